@@ -1,189 +1,169 @@
-from flask import Flask, jsonify, request, send_from_directory, render_template, send_file
+from flask import Flask, Blueprint, current_app, jsonify, request, send_from_directory, render_template, send_file, stream_with_context
 from flask_cors import CORS
 from datetime import datetime
+from collections import Counter
 import os
 import logging
 import shutil
-from werkzeug.utils import secure_filename
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.middleware.proxy_fix import ProxyFix
 from dotenv import load_dotenv
-import psycopg
-from psycopg.rows import dict_row
 import sys
 import traceback
 
-load_dotenv()
+if __name__ == '__main__':
+    # `flask` and gunicorn.conf.py load .env themselves, before this module
+    # and the settings it reads from the environment are imported.
+    load_dotenv()
+
+from db import get_db, init_app as init_db_pool, pool_stats
+from schema import check_schema, schema_ready, db_cli
+from stats import read_stats, stats_cli
+from trash import trash_cli
+from jobs import enqueue, job_worker, queue_stats, jobs_cli
+from notifications import enqueue_booking_confirmation
+from ratelimit import TRUSTED_PROXIES, admission, limiter_stats, rate_limit
+from idempotency import idempotent, remember_response
+from uploads import UPLOAD_FOLDER, MAX_CONTENT_LENGTH, UploadRequest, allowed_file, store_passport
+from thumbnails import PREVIEW_SIZES, ensure_preview
+from assets import asset_url, serve_asset, assets_cli
+from compression import init_app as init_compression
+from inventory import (
+    ROOM_TYPES, create_rooms, create_rooms_many, lock_rooms, reserve_room, release_room, set_capacity, get_rooms
+)
+from catalog_cache import trip_cache, read_versions, bump_version
+from http_cache import make_etag, add_validators, not_modified, versioned
+from spreadsheets import (
+    EXPORT_FORMATS, TRIP_EXPORT_COLUMNS, BOOKING_EXPORT_COLUMNS, TripImportError, XLSX_AVAILABLE,
+    trips_export_query, bookings_export_query, export_response, parse_trips_csv, import_trips
+)
+from pagination import PaginationError, encode_cursor, decode_cursor, parse_limit
+from serializers import (
+    BOOKING_FIELDS, BOOKING_SUMMARY_FIELDS, booking_serializer, serialize_booking, serialize_trip,
+    serialize_trash_trip, serialize_trash_booking, init_app as init_json
+)
+from queries import (
+    BOOKING_ROW, bookings_query, fetch_trips, fetch_trip, fetch_bookings, fetch_bookings_page,
+    fetch_booking, fetch_trash_trips, fetch_trash_bookings, fetch_trash_trip, fetch_trash_booking
+)
+from search import SearchError, parse_search, search_bookings
+from events import change_feed, event_stream
 
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-app = Flask(__name__, static_folder='static', template_folder='.')
-
-CORS(app)
-
-UPLOAD_FOLDER = 'static/uploads'
-PASSPORT_UPLOAD_FOLDER = os.path.join(UPLOAD_FOLDER, 'passports')
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'pdf', 'webp'}
-
-os.makedirs(PASSPORT_UPLOAD_FOLDER, exist_ok=True)
-
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
-
-def get_db():
-    DATABASE_URL = os.environ.get('DATABASE_URL')
-    
-    if DATABASE_URL and DATABASE_URL.startswith('postgres://'):
-        DATABASE_URL = DATABASE_URL.replace('postgres://', 'postgresql://', 1)
-    
-    try:
-        conn = psycopg.connect(
-            DATABASE_URL,
-            row_factory=dict_row,
-            autocommit=False
-        )
-        return conn
-    except Exception as e:
-        logger.error(f"Database connection error: {str(e)}")
-        logger.error(f"Traceback: {traceback.format_exc()}")
-        return None
-
-def init_db():
-    conn = get_db()
-    if not conn:
-        logger.error("Failed to connect to database")
-        return
-    
-    c = conn.cursor()
-
-    c.execute('''CREATE TABLE IF NOT EXISTS trips (
-        id SERIAL PRIMARY KEY,
-        date TEXT NOT NULL,
-        airline TEXT NOT NULL,
-        airline_logo TEXT,
-        hotel TEXT NOT NULL,  
-        hotel_logo TEXT,    
-        hotel_distance TEXT,  
-        route TEXT NOT NULL,
-        duration INTEGER NOT NULL,
-        type TEXT NOT NULL,
-        state TEXT NOT NULL DEFAULT 'all',
-        room5_price INTEGER NOT NULL,
-        room5_status TEXT NOT NULL DEFAULT 'available',
-        room4_price INTEGER NOT NULL,
-        room4_status TEXT NOT NULL DEFAULT 'available',
-        room3_price INTEGER NOT NULL,
-        room3_status TEXT NOT NULL DEFAULT 'available',
-        room2_price INTEGER NOT NULL,
-        room2_status TEXT NOT NULL DEFAULT 'available',
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        is_deleted BOOLEAN DEFAULT FALSE,
-        deleted_at TIMESTAMP
-    )''')
-
-    c.execute('''CREATE TABLE IF NOT EXISTS bookings (
-        id SERIAL PRIMARY KEY,
-        trip_id INTEGER NOT NULL,
-        first_name TEXT NOT NULL,
-        last_name TEXT NOT NULL,
-        email TEXT NOT NULL,
-        phone TEXT NOT NULL,
-        whatsapp_number TEXT,
-        birth_date TEXT NOT NULL,
-        birth_place TEXT NOT NULL,
-        passport_number TEXT NOT NULL,
-        passport_issue_date TEXT NOT NULL,
-        passport_expiry_date TEXT NOT NULL,
-        passport_scan TEXT,
-        passport_file TEXT,
-        marital_status TEXT NOT NULL,
-        father_name TEXT NOT NULL,
-        grandfather_name TEXT NOT NULL,
-        job_title TEXT NOT NULL,
-        education_level TEXT NOT NULL,
-        facebook_profile TEXT,
-        umrah_type TEXT NOT NULL,
-        room_type TEXT NOT NULL,
-        notes TEXT,
-        status TEXT NOT NULL DEFAULT 'pending',
-        booking_date TEXT NOT NULL,
-        branch_state TEXT,
-        is_deleted BOOLEAN DEFAULT FALSE,
-        deleted_at TIMESTAMP,
-        FOREIGN KEY (trip_id) REFERENCES trips (id) ON DELETE SET NULL
-    )''')
-
-    c.execute('''CREATE TABLE IF NOT EXISTS deleted_trips (
-        id SERIAL PRIMARY KEY,
-        original_id INTEGER,
-        date TEXT NOT NULL,
-        airline TEXT NOT NULL,
-        airline_logo TEXT,
-        hotel TEXT NOT NULL,  
-        hotel_logo TEXT,    
-        hotel_distance TEXT,  
-        route TEXT NOT NULL,
-        duration INTEGER NOT NULL,
-        type TEXT NOT NULL,
-        state TEXT NOT NULL,
-        room5_price INTEGER NOT NULL,
-        room5_status TEXT NOT NULL,
-        room4_price INTEGER NOT NULL,
-        room4_status TEXT NOT NULL,
-        room3_price INTEGER NOT NULL,
-        room3_status TEXT NOT NULL,
-        room2_price INTEGER NOT NULL,
-        room2_status TEXT NOT NULL,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        deleted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )''')
-
-    c.execute('''CREATE TABLE IF NOT EXISTS deleted_bookings (
-        id SERIAL PRIMARY KEY,
-        original_id INTEGER,
-        trip_id INTEGER,
-        first_name TEXT NOT NULL,
-        last_name TEXT NOT NULL,
-        email TEXT NOT NULL,
-        phone TEXT NOT NULL,
-        whatsapp_number TEXT,
-        birth_date TEXT NOT NULL,
-        birth_place TEXT NOT NULL,
-        passport_number TEXT NOT NULL,
-        passport_issue_date TEXT NOT NULL,
-        passport_expiry_date TEXT NOT NULL,
-        passport_scan TEXT,
-        passport_file TEXT,
-        marital_status TEXT NOT NULL,
-        father_name TEXT NOT NULL,
-        grandfather_name TEXT NOT NULL,
-        job_title TEXT NOT NULL,
-        education_level TEXT NOT NULL,
-        facebook_profile TEXT,
-        umrah_type TEXT NOT NULL,
-        room_type TEXT NOT NULL,
-        notes TEXT,
-        status TEXT NOT NULL,
-        booking_date TEXT NOT NULL,
-        branch_state TEXT,
-        deleted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )''')
-
-    conn.commit()
-    conn.close()
-
-@app.route('/')
+views = Blueprint('views', __name__)
+
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', 1000))
+BULK_MAX_ITEMS = int(os.environ.get('BULK_MAX_ITEMS', 500))
+
+TRIP_REQUIRED_FIELDS = [
+    'date', 'airline', 'hotel', 'route', 'duration', 'type', 'state',
+    'room5_price', 'room4_price', 'room3_price', 'room2_price'
+]
+
+INSERT_TRIP = '''INSERT INTO trips 
+    (date, airline, airline_logo, hotel, hotel_logo, hotel_distance, route, duration, type, state,
+     room5_price, room5_status, room4_price, room4_status,
+     room3_price, room3_status, room2_price, room2_status)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)'''
+
+def room_capacities(data):
+    # Optional roomN_capacity fields; None (or absent) means unlimited.
+    capacities = {}
+    for room_type in ROOM_TYPES:
+        field = f'room{room_type}_capacity'
+        if field in data:
+            value = data[field]
+            if value is not None and (not isinstance(value, int) or isinstance(value, bool) or value < 0):
+                raise ValueError(f'{field} must be a non-negative integer or null')
+            capacities[room_type] = value
+    return capacities
+
+def validate_trip(data):
+    for field in TRIP_REQUIRED_FIELDS:
+        if field not in data:
+            raise ValueError(f'Missing required field: {field}')
+
+def trip_insert_params(data):
+    if isinstance(data['state'], list):
+        state_value = ','.join(data['state'])
+    else:
+        state_value = data['state']
+
+    return (
+        data['date'], 
+        data['airline'], 
+        data.get('airline_logo', ''),
+        data['hotel'], 
+        data.get('hotel_logo', ''), 
+        data.get('hotel_distance', ''),
+        data['route'], 
+        data['duration'], 
+        data['type'], 
+        state_value,
+        data['room5_price'], 
+        'available', 
+        data['room4_price'], 
+        'available',
+        data['room3_price'], 
+        'available', 
+        data['room2_price'], 
+        'available'
+    )
+
+def bulk_ids(data):
+    ids = data.get('ids') if isinstance(data, dict) else None
+    if not isinstance(ids, list) or not ids:
+        raise ValueError('ids must be a non-empty list')
+    if len(ids) > BULK_MAX_ITEMS:
+        raise ValueError(f'At most {BULK_MAX_ITEMS} ids per request')
+    for item_id in ids:
+        if not isinstance(item_id, int) or isinstance(item_id, bool):
+            raise ValueError('ids must be integers')
+    # Duplicates would be reported twice but applied once.
+    return list(dict.fromkeys(ids))
+
+def bulk_results(ids, errors):
+    return [
+        {'id': item_id, 'ok': False, 'error': errors[item_id]} if item_id in errors else {'id': item_id, 'ok': True}
+        for item_id in ids
+    ]
+
+@views.route('/')
 def serve_index():
     return render_template('index.html')
 
-@app.route('/static/<path:path>')
+@views.route('/static/<path:path>')
 def serve_static(path):
+    response = serve_asset(path)
+    if response is not None:
+        return response
     return send_from_directory('static', path)
 
-@app.route('/uploads/<path:filename>')
+@views.route('/uploads/<path:filename>')
 def serve_uploaded_file(filename):
     return send_from_directory(UPLOAD_FOLDER, filename)
 
-@app.route('/api/check-password', methods=['POST'])
+@views.route('/uploads/previews/<size>/<path:filename>')
+def serve_upload_preview(size, filename):
+    if size not in PREVIEW_SIZES:
+        return jsonify({'error': f'Unknown preview size: {size}'}), 404
+
+    try:
+        path = ensure_preview(filename, size)
+    except Exception as e:
+        logger.error(f"Error generating preview for {filename}: {str(e)}")
+        return jsonify({'error': 'Preview generation failed'}), 500
+
+    if path is None:
+        return jsonify({'error': 'File not found'}), 404
+
+    response = send_file(path, mimetype='image/webp', max_age=31536000)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+@views.route('/api/check-password', methods=['POST'])
+@rate_limit('password')
 def check_password():
     try:
         data = request.get_json()
@@ -198,137 +178,87 @@ def check_password():
         logger.error(f"Password check error: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/dashboard')
+@views.route('/dashboard')
 def serve_dashboard():
     return render_template('dashboard.html')
 
-@app.route('/api/trips', methods=['GET'])
+@views.route('/api/trips', methods=['GET'])
 def get_all_trips():
     conn = get_db()
     if not conn:
         return jsonify({'error': 'Database connection failed'}), 500
-    
-    c = conn.cursor()
 
     state_filter = request.args.get('state', 'all')
     type_filter = request.args.get('type', 'all')
 
-    query = 'SELECT * FROM trips WHERE is_deleted = FALSE'
-    params = []
+    cache_key = ('trips', state_filter, type_filter)
+    version, last_modified = read_versions(conn, 'trips').get('trips', (None, None))
+    etag = make_etag(cache_key, version)
+    response = not_modified(etag, last_modified)
+    if response is not None:
+        return response
 
-    if state_filter != 'all':
-        query += ' AND (state = %s OR state = %s OR state LIKE %s)'
-        params.extend(['all', state_filter, f'%{state_filter}%'])
-        
-        if type_filter != 'all':
-            query += ' AND type = %s'
-            params.append(type_filter)
-    elif type_filter != 'all':
-        query += ' AND type = %s'
-        params.append(type_filter)
-
-    c.execute(query, params)
-    trips = c.fetchall()
-
-    trips_list = []
-    for trip in trips:
-        trip_data = {
-            'id': trip['id'],
-            'date': trip['date'],
-            'airline': trip['airline'],
-            'airline_logo': (trip['airline_logo'] or '').replace('static/', ''),
-            'hotel': trip['hotel'],
-            'hotel_logo': trip['hotel_logo'] or '',
-            'hotel_distance': trip['hotel_distance'] or '',
-            'route': trip['route'],
-            'duration': trip['duration'],
-            'type': trip['type'],
-            'state': trip['state'],
-            'room5': {
-                'price': trip['room5_price'],
-                'status': trip['room5_status']
-            },
-            'room4': {
-                'price': trip['room4_price'],
-                'status': trip['room4_status']
-            },
-            'room3': {
-                'price': trip['room3_price'],
-                'status': trip['room3_status']
-            },
-            'room2': {
-                'price': trip['room2_price'],
-                'status': trip['room2_status']
-            }
-        }
-        trips_list.append(trip_data)
+    body = trip_cache.get(cache_key, version)
+    if body is not None:
+        return add_validators(current_app.response_class(body, mimetype='application/json'), etag, last_modified)
+
+    trips = fetch_trips(conn, state_filter, type_filter)
 
-    conn.close()
-    return jsonify({'trips': trips_list})
+    trips_list = [serialize_trip(trip) for trip in trips]
 
-@app.route('/api/trips/<int:trip_id>', methods=['GET'])
+    body = trip_cache.put(cache_key, version, {'trips': trips_list})
+    return add_validators(current_app.response_class(body, mimetype='application/json'), etag, last_modified)
+
+@views.route('/api/trips/<int:trip_id>', methods=['GET'])
 def get_trip(trip_id):
     conn = get_db()
     if not conn:
         return jsonify({'error': 'Database connection failed'}), 500
     
-    c = conn.cursor()
+    cache_key = ('trip', trip_id)
+    version, last_modified = read_versions(conn, 'trips').get('trips', (None, None))
+    etag = make_etag(cache_key, version)
+    response = not_modified(etag, last_modified)
+    if response is not None:
+        return response
+
+    body = trip_cache.get(cache_key, version)
+    if body is not None:
+        return add_validators(current_app.response_class(body, mimetype='application/json'), etag, last_modified)
 
-    c.execute('SELECT * FROM trips WHERE id = %s AND is_deleted = FALSE', (trip_id,))
-    trip = c.fetchone()
+    trip = fetch_trip(conn, trip_id)
 
     if not trip:
-        conn.close()
         return jsonify({'error': 'Trip not found'}), 404
 
-    trip_data = {
-        'id': trip['id'],
-        'date': trip['date'],
-        'airline': trip['airline'],
-        'airline_logo': trip['airline_logo'] or '',
-        'hotel': trip['hotel'],
-        'hotel_logo': trip['hotel_logo'] or '',
-        'hotel_distance': trip['hotel_distance'] or '',
-        'route': trip['route'],
-        'duration': trip['duration'],
-        'type': trip['type'],
-        'state': trip['state'],
-        'room5': {
-            'price': trip['room5_price'],
-            'status': trip['room5_status']
-        },
-        'room4': {
-            'price': trip['room4_price'],
-            'status': trip['room4_status']
-        },
-        'room3': {
-            'price': trip['room3_price'],
-            'status': trip['room3_status']
-        },
-        'room2': {
-            'price': trip['room2_price'],
-            'status': trip['room2_status']
-        }
-    }
+    body = trip_cache.put(cache_key, version, serialize_trip(trip))
+    return add_validators(current_app.response_class(body, mimetype='application/json'), etag, last_modified)
+
+@views.route('/api/trips/<int:trip_id>/rooms', methods=['GET'])
+def get_trip_rooms(trip_id):
+    conn = get_db()
+    if not conn:
+        return jsonify({'error': 'Database connection failed'}), 500
+
+    rooms = get_rooms(conn, trip_id)
+    if not rooms:
+        return jsonify({'error': 'Trip not found'}), 404
 
-    conn.close()
-    return jsonify(trip_data)
+    return jsonify({'rooms': rooms})
 
-@app.route('/api/trips', methods=['POST'])
+@views.route('/api/trips', methods=['POST'])
+@idempotent('trips')
 def create_trip():
     try:
         data = request.get_json()
         if not data:
             return jsonify({'error': 'No data provided'}), 400
 
-        required_fields = [
-            'date', 'airline', 'hotel', 'route', 'duration', 'type', 'state',
-            'room5_price', 'room4_price', 'room3_price', 'room2_price'
-        ]
-
-        for field in required_fields:
-            if field not in data:
-                return jsonify({'error': f'Missing required field: {field}'}), 400
+        try:
+            validate_trip(data)
+            capacities = room_capacities(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
         conn = get_db()
         if not conn:
@@ -336,55 +266,146 @@ def create_trip():
         
         c = conn.cursor()
 
-        if isinstance(data['state'], list):
-            state_value = ','.join(data['state'])
-        else:
-            state_value = data['state']
-
-        c.execute('''INSERT INTO trips 
-            (date, airline, airline_logo, hotel, hotel_logo, hotel_distance, route, duration, type, state,
-             room5_price, room5_status, room4_price, room4_status,
-             room3_price, room3_status, room2_price, room2_status)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)''',
-                  (
-                      data['date'], 
-                      data['airline'], 
-                      data.get('airline_logo', ''),
-                      data['hotel'], 
-                      data.get('hotel_logo', ''), 
-                      data.get('hotel_distance', ''),
-                      data['route'], 
-                      data['duration'], 
-                      data['type'], 
-                      state_value,
-                      data['room5_price'], 
-                      'available', 
-                      data['room4_price'], 
-                      'available',
-                      data['room3_price'], 
-                      'available', 
-                      data['room2_price'], 
-                      'available'
-                  ))
-
-        conn.commit()
-        c.execute("SELECT lastval()")
-        trip_id = c.fetchone()['lastval']
-        conn.close()
-
-        return jsonify({
+        c.execute(INSERT_TRIP + ' RETURNING id', trip_insert_params(data))
+        trip_id = c.fetchone()['id']
+        create_rooms(conn, trip_id, capacities)
+        response = {
             'message': 'Trip created successfully',
             'id': trip_id,
             'trip': {
                 'id': trip_id,
                 **data
             }
-        }), 201
+        }
+        remember_response(conn, response, 201)
+        bump_version(conn, 'trips')
+        conn.commit()
+
+        return jsonify(response), 201
     except Exception as e:
         logger.error(f"Error creating trip: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/trips/<int:trip_id>', methods=['DELETE'])
+@views.route('/api/trips/bulk', methods=['POST'])
+def create_trips():
+    try:
+        data = request.get_json()
+        trips = data.get('trips') if isinstance(data, dict) else None
+        if not isinstance(trips, list) or not trips:
+            return jsonify({'error': 'trips must be a non-empty list'}), 400
+        if len(trips) > BULK_MAX_ITEMS:
+            return jsonify({'error': f'At most {BULK_MAX_ITEMS} trips per request'}), 400
+
+        # All or nothing: every trip is validated before any is inserted.
+        params = []
+        capacities = []
+        errors = {}
+        for index, trip in enumerate(trips):
+            try:
+                if not isinstance(trip, dict):
+                    raise ValueError('Trip must be an object')
+                validate_trip(trip)
+                capacities.append(room_capacities(trip))
+                params.append(trip_insert_params(trip))
+            except ValueError as e:
+                errors[index] = str(e)
+
+        if errors:
+            return jsonify({
+                'error': 'No trips were created',
+                'results': [
+                    {'index': index, 'ok': False, 'error': errors[index]} if index in errors else {'index': index, 'ok': True}
+                    for index in range(len(trips))
+                ]
+            }), 400
+
+        conn = get_db()
+        if not conn:
+            return jsonify({'error': 'Database connection failed'}), 500
+
+        c = conn.cursor()
+
+        # executemany pipelines the inserts; each one leaves its id as a result set.
+        c.executemany(INSERT_TRIP + ' RETURNING id', params, returning=True)
+        trip_ids = []
+        while True:
+            trip_ids.append(c.fetchone()['id'])
+            if not c.nextset():
+                break
+
+        create_rooms_many(conn, list(zip(trip_ids, capacities)))
+        bump_version(conn, 'trips')
+        conn.commit()
+
+        return jsonify({
+            'message': f'{len(trip_ids)} trips created successfully',
+            'results': [{'index': index, 'ok': True, 'id': trip_id} for index, trip_id in enumerate(trip_ids)]
+        }), 201
+    except Exception as e:
+        logger.error(f"Error creating trips: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@views.route('/api/trips/export', methods=['GET'])
+def export_trips():
+    export_format = request.args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': 'format must be csv or xlsx'}), 400
+    if export_format == 'xlsx' and not XLSX_AVAILABLE:
+        return jsonify({'error': 'XLSX export requires XlsxWriter'}), 501
+
+    conn = get_db()
+    if not conn:
+        return jsonify({'error': 'Database connection failed'}), 500
+
+    return export_response(conn, 'trips', trips_export_query(), TRIP_EXPORT_COLUMNS, export_format)
+
+@views.route('/api/trips/import', methods=['POST'])
+def import_trips_csv():
+    try:
+        # Either a multipart upload named "file" or a raw text/csv body.
+        upload = request.files.get('file')
+        if upload is not None and upload.filename != '':
+            stream = upload.stream
+        elif request.mimetype == 'text/csv':
+            stream = request.stream
+        else:
+            return jsonify({'error': 'Send a CSV file as "file" or a text/csv body'}), 400
+
+        try:
+            rows, with_capacity = parse_trips_csv(stream)
+        except TripImportError as e:
+            return jsonify({'error': 'No trips were imported', 'errors': e.errors}), 400
+
+        conn = get_db()
+        if not conn:
+            return jsonify({'error': 'Database connection failed'}), 500
+
+        try:
+            imported = import_trips(conn, rows, with_capacity)
+        except TripImportError as e:
+            conn.rollback()
+            return jsonify({'error': 'No trips were imported', 'errors': e.errors}), 400
+
+        bump_version(conn, 'trips')
+        conn.commit()
+
+        created = sum(1 for _, _, is_new in imported if is_new)
+        return jsonify({
+            'message': f'{len(imported)} trips imported successfully',
+            'created': created,
+            'updated': len(imported) - created,
+            'results': [
+                {'line': line, 'id': trip_id, 'action': 'created' if is_new else 'updated'}
+                for line, trip_id, is_new in imported
+            ]
+        })
+    except RequestEntityTooLarge as e:
+        return jsonify({'error': e.description}), 413
+    except Exception as e:
+        logger.error(f"Error importing trips: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@views.route('/api/trips/<int:trip_id>', methods=['DELETE'])
 def delete_trip(trip_id):
     try:
         conn = get_db()
@@ -393,75 +414,70 @@ def delete_trip(trip_id):
         
         c = conn.cursor()
 
-        c.execute('SELECT * FROM trips WHERE id = %s AND is_deleted = FALSE', (trip_id,))
+        c.execute('SELECT id FROM trips WHERE id = %s AND is_deleted = FALSE', (trip_id,))
         trip = c.fetchone()
 
         if not trip:
-            conn.close()
             return jsonify({'error': 'Trip not found'}), 404
 
-        c.execute('''INSERT INTO deleted_trips 
-            (original_id, date, airline, airline_logo, hotel, hotel_logo, hotel_distance, 
-             route, duration, type, state, room5_price, room5_status, room4_price, room4_status,
-             room3_price, room3_status, room2_price, room2_status, created_at)
-            SELECT 
-                id, date, airline, airline_logo, hotel, hotel_logo, hotel_distance, 
-                route, duration, type, state, room5_price, room5_status, room4_price, room4_status,
-                room3_price, room3_status, room2_price, room2_status, created_at
-            FROM trips WHERE id = %s''', (trip_id,))
-
         c.execute('UPDATE trips SET is_deleted = TRUE, deleted_at = CURRENT_TIMESTAMP WHERE id = %s', (trip_id,))
+        bump_version(conn, 'trips')
 
         conn.commit()
-        conn.close()
 
         return jsonify({'message': 'Trip moved to trash successfully'})
     except Exception as e:
         logger.error(f"Error deleting trip {trip_id}: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/trips/<int:trip_id>', methods=['PUT'])
+@views.route('/api/trips/<int:trip_id>', methods=['PUT'])
 def update_trip(trip_id):
     try:
         data = request.get_json()
         if not data:
             return jsonify({'error': 'No data provided'}), 400
 
+        try:
+            capacities = room_capacities(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
         conn = get_db()
         if not conn:
             return jsonify({'error': 'Database connection failed'}), 500
         
         c = conn.cursor()
 
-        c.execute('SELECT * FROM trips WHERE id = %s AND is_deleted = FALSE', (trip_id,))
-        trip = c.fetchone()
+        trip = fetch_trip(conn, trip_id)
 
         if not trip:
-            conn.close()
             return jsonify({'error': 'Trip not found'}), 404
 
         if 'state' in data and isinstance(data['state'], list):
             state_value = ','.join(data['state'])
         else:
-            state_value = data.get('state', trip['state'])
+            state_value = data.get('state', trip.state)
 
         update_fields = {
-            'date': data.get('date', trip['date']),
-            'airline': data.get('airline', trip['airline']),
-            'airline_logo': data.get('airline_logo', trip['airline_logo']),
-            'hotel': data.get('hotel', trip['hotel']),
-            'hotel_logo': data.get('hotel_logo', trip['hotel_logo']),
-            'hotel_distance': data.get('hotel_distance', trip['hotel_distance']),
-            'route': data.get('route', trip['route']),
-            'duration': data.get('duration', trip['duration']),
-            'type': data.get('type', trip['type']),
+            'date': data.get('date', trip.date),
+            'airline': data.get('airline', trip.airline),
+            'airline_logo': data.get('airline_logo', trip.airline_logo),
+            'hotel': data.get('hotel', trip.hotel),
+            'hotel_logo': data.get('hotel_logo', trip.hotel_logo),
+            'hotel_distance': data.get('hotel_distance', trip.hotel_distance),
+            'route': data.get('route', trip.route),
+            'duration': data.get('duration', trip.duration),
+            'type': data.get('type', trip.type),
             'state': state_value,
-            'room5_price': data.get('room5_price', trip['room5_price']),
-            'room4_price': data.get('room4_price', trip['room4_price']),
-            'room3_price': data.get('room3_price', trip['room3_price']),
-            'room2_price': data.get('room2_price', trip['room2_price'])
+            'room5_price': data.get('room5_price', trip.room5_price),
+            'room4_price': data.get('room4_price', trip.room4_price),
+            'room3_price': data.get('room3_price', trip.room3_price),
+            'room2_price': data.get('room2_price', trip.room2_price)
         }
 
+        # Rooms before the trip row, in the order bookings take them.
+        lock_rooms(conn, [(trip_id, room_type) for room_type in capacities])
+
         c.execute('''UPDATE trips SET 
                         date = %s, airline = %s, airline_logo = %s, hotel = %s, hotel_logo = %s, 
                         hotel_distance = %s, route = %s, duration = %s, type = %s, state = %s, 
@@ -485,8 +501,14 @@ def update_trip(trip_id):
                       trip_id
                   ))
 
+        for room_type, capacity in capacities.items():
+            if not set_capacity(conn, trip_id, room_type, capacity):
+                conn.rollback()
+                return jsonify({'error': f'room{room_type}_capacity is lower than the rooms already booked'}), 409
+
+        bump_version(conn, 'trips')
+
         conn.commit()
-        conn.close()
         return jsonify({
             'message': 'Trip updated successfully',
             'trip': {
@@ -498,7 +520,7 @@ def update_trip(trip_id):
         logger.error(f"Error updating trip {trip_id}: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/trips/<int:trip_id>/status', methods=['PUT'])
+@views.route('/api/trips/<int:trip_id>/status', methods=['PUT'])
 def update_trip_status(trip_id):
     try:
         data = request.get_json()
@@ -516,11 +538,10 @@ def update_trip_status(trip_id):
         
         c = conn.cursor()
 
-        c.execute('SELECT * FROM trips WHERE id = %s AND is_deleted = FALSE', (trip_id,))
+        c.execute('SELECT id FROM trips WHERE id = %s AND is_deleted = FALSE', (trip_id,))
         trip = c.fetchone()
 
         if not trip:
-            conn.close()
             return jsonify({'error': 'Trip not found'}), 404
 
         c.execute('''UPDATE trips SET 
@@ -533,15 +554,18 @@ def update_trip_status(trip_id):
                       data['room2_status'], 
                       trip_id
                   ))
+        bump_version(conn, 'trips')
 
         conn.commit()
-        conn.close()
         return jsonify({'message': 'Trip status updated successfully'})
     except Exception as e:
         logger.error(f"Error updating trip {trip_id} status: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/bookings', methods=['POST'])
+@views.route('/api/bookings', methods=['POST'])
+@rate_limit('bookings')
+@admission('bookings')
+@idempotent('bookings')
 def create_booking():
     try:
         data = request.form.to_dict()
@@ -560,36 +584,41 @@ def create_booking():
                 logger.error(f"Missing field: {field}, All data: {data}")
                 return jsonify({'error': f'Missing required field: {field}'}), 400
 
+        if data['roomType'] not in ROOM_TYPES:
+            return jsonify({'error': 'Invalid room type'}), 400
+
+        # The scan has already been streamed to a spool file (and hashed) by
+        # UploadRequest while the form was parsed; it only enters the content
+        # store once the booking is accepted.
+        passport_file = request.files.get('passportFile')
+        if passport_file and passport_file.filename != '':
+            if not allowed_file(passport_file.filename):
+                return jsonify({'error': 'File type not allowed. Allowed types: png, jpg, jpeg, pdf, webp'}), 400
+        else:
+            passport_file = None
+
         conn = get_db()
         if not conn:
             return jsonify({'error': 'Database connection failed'}), 500
         
         c = conn.cursor()
 
-        c.execute('SELECT * FROM trips WHERE id = %s AND is_deleted = FALSE', (data['tripId'],))
-        trip = c.fetchone()
+        trip = fetch_trip(conn, data['tripId'])
 
         if not trip:
-            conn.close()
             return jsonify({'error': 'Trip not found'}), 404
 
         room_status_field = f'room{data["roomType"]}_status'
-        if trip[room_status_field] == 'full':
-            conn.close()
+        if getattr(trip, room_status_field) == 'full':
             return jsonify({'error': 'This room type is fully booked'}), 400
 
-        passport_file = request.files.get('passportFile')
-        passport_filename = None
-        
-        if passport_file and passport_file.filename != '':
-            if allowed_file(passport_file.filename):
-                filename = secure_filename(passport_file.filename)
-                unique_filename = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{filename}"
-                filepath = os.path.join(PASSPORT_UPLOAD_FOLDER, unique_filename)
-                passport_file.save(filepath)
-                passport_filename = f"uploads/passports/{unique_filename}"
-            else:
-                return jsonify({'error': 'File type not allowed. Allowed types: png, jpg, jpeg, pdf, webp'}), 400
+        # Holds the trip_rooms row lock until commit, so concurrent bookings
+        # for the same room type cannot oversell it.
+        if not reserve_room(conn, data['tripId'], data['roomType']):
+            conn.rollback()
+            return jsonify({'error': 'This room type is fully booked'}), 400
+
+        passport_filename = store_passport(passport_file) if passport_file else None
 
         c.execute('''INSERT INTO bookings 
             (trip_id, first_name, last_name, email, phone, whatsapp_number,
@@ -597,7 +626,8 @@ def create_booking():
              passport_expiry_date, passport_scan, passport_file, marital_status, father_name,
              grandfather_name, job_title, education_level, facebook_profile,
              umrah_type, room_type, notes, booking_date, branch_state)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)''',
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            RETURNING id''',
                   (
                       data['tripId'], 
                       data['firstName'], 
@@ -624,22 +654,30 @@ def create_booking():
                       datetime.now().isoformat(),
                       data.get('birthPlace', '')
                   ))
-
-        conn.commit()
-        c.execute("SELECT lastval()")
-        booking_id = c.fetchone()['lastval']
-        conn.close()
-
-        return jsonify({
+        booking_id = c.fetchone()['id']
+
+        # Follow-up work is queued in the same transaction and runs in the
+        # background once the booking has committed.
+        enqueue_booking_confirmation(conn, booking_id, data['email'], data.get('whatsappNumber'))
+        if passport_filename:
+            enqueue(conn, 'passport_previews', {'filename': passport_filename.split('/', 1)[1]})
+        response = {
             'message': 'Booking created successfully',
             'id': booking_id
-        }), 201
+        }
+        remember_response(conn, response, 201)
+        bump_version(conn, 'bookings')
+        conn.commit()
 
+        return jsonify(response), 201
+
+    except RequestEntityTooLarge as e:
+        return jsonify({'error': e.description}), 413
     except Exception as e:
         logger.error(f"Error creating booking: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/bookings/<int:booking_id>', methods=['PUT'])
+@views.route('/api/bookings/<int:booking_id>', methods=['PUT'])
 def update_booking(booking_id):
     try:
         data = request.get_json()
@@ -655,24 +693,58 @@ def update_booking(booking_id):
         
         c = conn.cursor()
 
-        c.execute('SELECT * FROM bookings WHERE id = %s AND is_deleted = FALSE', (booking_id,))
+        c.execute('SELECT id FROM bookings WHERE id = %s AND is_deleted = FALSE', (booking_id,))
         booking = c.fetchone()
 
         if not booking:
-            conn.close()
             return jsonify({'error': 'Booking not found'}), 404
 
         c.execute('UPDATE bookings SET status = %s WHERE id = %s',
                   (data['status'], booking_id))
+        bump_version(conn, 'bookings')
 
         conn.commit()
-        conn.close()
         return jsonify({'message': 'Booking status updated successfully'})
     except Exception as e:
         logger.error(f"Error updating booking {booking_id}: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/bookings/<int:booking_id>', methods=['DELETE'])
+@views.route('/api/bookings', methods=['PATCH'])
+def update_bookings():
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': 'No data provided'}), 400
+
+        try:
+            ids = bulk_ids(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        if 'status' not in data:
+            return jsonify({'error': 'Missing required field: status'}), 400
+
+        conn = get_db()
+        if not conn:
+            return jsonify({'error': 'Database connection failed'}), 500
+
+        c = conn.cursor()
+
+        c.execute('''UPDATE bookings SET status = %s
+                     WHERE id = ANY(%s) AND is_deleted = FALSE
+                     RETURNING id''', (data['status'], ids))
+        updated = {row['id'] for row in c.fetchall()}
+
+        if updated:
+            bump_version(conn, 'bookings')
+        conn.commit()
+
+        return jsonify({'results': bulk_results(ids, {item_id: 'Booking not found' for item_id in ids if item_id not in updated})})
+    except Exception as e:
+        logger.error(f"Error updating bookings: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@views.route('/api/bookings/<int:booking_id>', methods=['DELETE'])
 def delete_booking(booking_id):
     try:
         conn = get_db()
@@ -681,60 +753,26 @@ def delete_booking(booking_id):
         
         c = conn.cursor()
 
-        c.execute('SELECT * FROM bookings WHERE id = %s AND is_deleted = FALSE', (booking_id,))
+        c.execute('SELECT trip_id, room_type FROM bookings WHERE id = %s AND is_deleted = FALSE FOR UPDATE', (booking_id,))
         booking = c.fetchone()
 
         if not booking:
-            conn.close()
             return jsonify({'error': 'Booking not found'}), 404
 
-        c.execute('''INSERT INTO deleted_bookings 
-            (original_id, trip_id, first_name, last_name, email, phone, whatsapp_number,
-             birth_date, birth_place, passport_number, passport_issue_date, 
-             passport_expiry_date, passport_scan, passport_file, marital_status, father_name,
-             grandfather_name, job_title, education_level, facebook_profile,
-             umrah_type, room_type, notes, status, booking_date, branch_state)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)''',
-                  (
-                      booking_id,
-                      booking['trip_id'],
-                      booking['first_name'],
-                      booking['last_name'],
-                      booking['email'],
-                      booking['phone'],
-                      booking['whatsapp_number'],
-                      booking['birth_date'],
-                      booking['birth_place'],
-                      booking['passport_number'],
-                      booking['passport_issue_date'],
-                      booking['passport_expiry_date'],
-                      booking['passport_scan'],
-                      booking['passport_file'],
-                      booking['marital_status'],
-                      booking['father_name'],
-                      booking['grandfather_name'],
-                      booking['job_title'],
-                      booking['education_level'],
-                      booking['facebook_profile'],
-                      booking['umrah_type'],
-                      booking['room_type'],
-                      booking['notes'],
-                      booking['status'],
-                      booking['booking_date'],
-                      booking['branch_state']
-                  ))
-
+        # The room is released before the bookings write, whose stats trigger
+        # would otherwise hold booking_stats while waiting for trip_rooms.
+        release_room(conn, booking['trip_id'], booking['room_type'])
         c.execute('UPDATE bookings SET is_deleted = TRUE, deleted_at = CURRENT_TIMESTAMP WHERE id = %s', (booking_id,))
+        bump_version(conn, 'bookings')
 
         conn.commit()
-        conn.close()
 
         return jsonify({'message': 'Booking moved to trash successfully'})
     except Exception as e:
         logger.error(f"Error deleting booking {booking_id}: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/bookings/<int:booking_id>/restore', methods=['POST'])
+@views.route('/api/bookings/<int:booking_id>/restore', methods=['POST'])
 def restore_booking(booking_id):
     try:
         conn = get_db()
@@ -743,26 +781,27 @@ def restore_booking(booking_id):
         
         c = conn.cursor()
 
-        c.execute('SELECT * FROM deleted_bookings WHERE original_id = %s ORDER BY deleted_at DESC LIMIT 1', (booking_id,))
-        deleted_booking = c.fetchone()
+        c.execute('SELECT trip_id, room_type FROM bookings WHERE id = %s AND is_deleted = TRUE FOR UPDATE', (booking_id,))
+        booking = c.fetchone()
 
-        if not deleted_booking:
-            conn.close()
+        if not booking:
             return jsonify({'error': 'Deleted booking not found'}), 404
 
-        c.execute('UPDATE bookings SET is_deleted = FALSE, deleted_at = NULL WHERE id = %s', (booking_id,))
+        if booking['trip_id'] is not None and not reserve_room(conn, booking['trip_id'], booking['room_type']):
+            conn.rollback()
+            return jsonify({'error': 'This room type is fully booked'}), 409
 
-        c.execute('DELETE FROM deleted_bookings WHERE original_id = %s', (booking_id,))
+        c.execute('UPDATE bookings SET is_deleted = FALSE, deleted_at = NULL WHERE id = %s', (booking_id,))
+        bump_version(conn, 'bookings')
 
         conn.commit()
-        conn.close()
 
         return jsonify({'message': 'Booking restored successfully'})
     except Exception as e:
         logger.error(f"Error restoring booking {booking_id}: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/bookings/<int:booking_id>/permanent', methods=['DELETE'])
+@views.route('/api/bookings/<int:booking_id>/permanent', methods=['DELETE'])
 def delete_booking_permanent(booking_id):
     try:
         conn = get_db()
@@ -771,67 +810,217 @@ def delete_booking_permanent(booking_id):
         
         c = conn.cursor()
 
-        c.execute('DELETE FROM deleted_bookings WHERE original_id = %s', (booking_id,))
-        
+        c.execute('SELECT trip_id, room_type, is_deleted FROM bookings WHERE id = %s FOR UPDATE', (booking_id,))
+        booking = c.fetchone()
+
+        if booking and not booking['is_deleted']:
+            release_room(conn, booking['trip_id'], booking['room_type'])
         c.execute('DELETE FROM bookings WHERE id = %s', (booking_id,))
+        bump_version(conn, 'bookings')
 
         conn.commit()
-        conn.close()
 
         return jsonify({'message': 'Booking permanently deleted'})
     except Exception as e:
         logger.error(f"Error permanently deleting booking {booking_id}: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/trash/trips', methods=['GET'])
+def get_trash_page(conn, key, fetch, serialize):
+    try:
+        limit = parse_limit(request.args.get('limit'))
+        cursor = request.args.get('cursor')
+        after = decode_cursor(cursor, 2) if cursor else None
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # One extra row tells whether another page exists.
+    rows = fetch(conn, after, limit + 1)
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].deleted_at.isoformat(), rows[-1].id)
+
+    return jsonify({
+        key: [serialize(row) for row in rows],
+        'next_cursor': next_cursor
+    })
+
+@views.route('/api/trash/trips', methods=['GET'])
 def get_trash_trips():
     conn = get_db()
     if not conn:
         return jsonify({'error': 'Database connection failed'}), 500
-    
-    c = conn.cursor()
-
-    c.execute('SELECT * FROM deleted_trips ORDER BY deleted_at DESC')
-    trips = c.fetchall()
-
-    trips_list = []
-    for trip in trips:
-        trips_list.append({
-            'id': trip['original_id'],
-            'date': trip['date'],
-            'airline': trip['airline'],
-            'deleted_at': trip['deleted_at']
-        })
 
-    conn.close()
-    return jsonify({'trips': trips_list})
+    return get_trash_page(conn, 'trips', fetch_trash_trips, serialize_trash_trip)
 
-@app.route('/api/trash/bookings', methods=['GET'])
+@views.route('/api/trash/bookings', methods=['GET'])
 def get_trash_bookings():
     conn = get_db()
     if not conn:
         return jsonify({'error': 'Database connection failed'}), 500
-    
-    c = conn.cursor()
-
-    c.execute('SELECT * FROM deleted_bookings ORDER BY deleted_at DESC')
-    bookings = c.fetchall()
-
-    bookings_list = []
-    for booking in bookings:
-        bookings_list.append({
-            'id': booking['original_id'],
-            'firstName': booking['first_name'],
-            'lastName': booking['last_name'],
-            'email': booking['email'],
-            'phone': booking['phone'],
-            'deleted_at': booking['deleted_at']
-        })
 
-    conn.close()
-    return jsonify({'bookings': bookings_list})
+    return get_trash_page(conn, 'bookings', fetch_trash_bookings, serialize_trash_booking)
+
+@views.route('/api/trash/trips/<int:trip_id>', methods=['GET'])
+def get_trash_trip(trip_id):
+    conn = get_db()
+    if not conn:
+        return jsonify({'error': 'Database connection failed'}), 500
+
+    trip = fetch_trash_trip(conn, trip_id)
+    if not trip:
+        return jsonify({'error': 'Trip not found in trash'}), 404
+
+    return jsonify(serialize_trash_trip(trip))
+
+@views.route('/api/trash/bookings/<int:booking_id>', methods=['GET'])
+def get_trash_booking(booking_id):
+    conn = get_db()
+    if not conn:
+        return jsonify({'error': 'Database connection failed'}), 500
+
+    booking = fetch_trash_booking(conn, booking_id)
+    if not booking:
+        return jsonify({'error': 'Booking not found in trash'}), 404
+
+    return jsonify(serialize_trash_booking(booking))
+
+@views.route('/api/trash/trips', methods=['POST'])
+def delete_trips():
+    try:
+        try:
+            ids = bulk_ids(request.get_json())
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        conn = get_db()
+        if not conn:
+            return jsonify({'error': 'Database connection failed'}), 500
+
+        c = conn.cursor()
+
+        # Rows are locked in id order so overlapping bulk requests cannot deadlock.
+        c.execute('''UPDATE trips SET is_deleted = TRUE, deleted_at = CURRENT_TIMESTAMP
+                     WHERE id IN (SELECT id FROM trips WHERE id = ANY(%s) AND is_deleted = FALSE ORDER BY id FOR UPDATE)
+                     RETURNING id''', (ids,))
+        deleted = [row['id'] for row in c.fetchall()]
 
-@app.route('/api/trash/trips/<int:trip_id>/restore', methods=['POST'])
+        if deleted:
+            bump_version(conn, 'trips')
+        conn.commit()
+
+        return jsonify({'results': bulk_results(ids, {item_id: 'Trip not found' for item_id in ids if item_id not in deleted})})
+    except Exception as e:
+        logger.error(f"Error deleting trips: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@views.route('/api/trash/trips/restore', methods=['POST'])
+def restore_trips():
+    try:
+        try:
+            ids = bulk_ids(request.get_json())
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        conn = get_db()
+        if not conn:
+            return jsonify({'error': 'Database connection failed'}), 500
+
+        c = conn.cursor()
+
+        c.execute('''UPDATE trips SET is_deleted = FALSE, deleted_at = NULL
+                     WHERE id IN (SELECT id FROM trips WHERE id = ANY(%s) AND is_deleted = TRUE ORDER BY id FOR UPDATE)
+                     RETURNING id''', (ids,))
+        restored = [row['id'] for row in c.fetchall()]
+
+        if restored:
+            bump_version(conn, 'trips')
+        conn.commit()
+
+        return jsonify({'results': bulk_results(ids, {item_id: 'Deleted trip not found' for item_id in ids if item_id not in restored})})
+    except Exception as e:
+        logger.error(f"Error restoring trips: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@views.route('/api/trash/bookings', methods=['POST'])
+def delete_bookings():
+    try:
+        try:
+            ids = bulk_ids(request.get_json())
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        conn = get_db()
+        if not conn:
+            return jsonify({'error': 'Database connection failed'}), 500
+
+        c = conn.cursor()
+
+        c.execute('''SELECT id, trip_id, room_type FROM bookings
+                     WHERE id = ANY(%s) AND is_deleted = FALSE
+                     ORDER BY id FOR UPDATE''', (ids,))
+        bookings = c.fetchall()
+        deleted = [booking['id'] for booking in bookings]
+
+        if deleted:
+            # All rooms are locked before any trips or bookings write.
+            rooms = Counter((booking['trip_id'], booking['room_type']) for booking in bookings if booking['trip_id'] is not None)
+            lock_rooms(conn, rooms)
+            for (trip_id, room_type), count in sorted(rooms.items()):
+                release_room(conn, trip_id, room_type, count)
+            c.execute('UPDATE bookings SET is_deleted = TRUE, deleted_at = CURRENT_TIMESTAMP WHERE id = ANY(%s)', (deleted,))
+            bump_version(conn, 'bookings')
+        conn.commit()
+
+        return jsonify({'results': bulk_results(ids, {item_id: 'Booking not found' for item_id in ids if item_id not in deleted})})
+    except Exception as e:
+        logger.error(f"Error deleting bookings: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@views.route('/api/trash/bookings/restore', methods=['POST'])
+def restore_bookings():
+    try:
+        try:
+            ids = bulk_ids(request.get_json())
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        conn = get_db()
+        if not conn:
+            return jsonify({'error': 'Database connection failed'}), 500
+
+        c = conn.cursor()
+
+        c.execute('''SELECT id, trip_id, room_type FROM bookings
+                     WHERE id = ANY(%s) AND is_deleted = TRUE
+                     ORDER BY id FOR UPDATE''', (ids,))
+        bookings = c.fetchall()
+
+        lock_rooms(conn, [(booking['trip_id'], booking['room_type']) for booking in bookings if booking['trip_id'] is not None])
+
+        errors = {item_id: 'Deleted booking not found' for item_id in ids}
+        restored = []
+        for booking in bookings:
+            # Each booking needs its room back; the ones that no longer fit
+            # stay in the trash.
+            if booking['trip_id'] is not None and not reserve_room(conn, booking['trip_id'], booking['room_type']):
+                errors[booking['id']] = 'This room type is fully booked'
+                continue
+            del errors[booking['id']]
+            restored.append(booking['id'])
+
+        if restored:
+            c.execute('UPDATE bookings SET is_deleted = FALSE, deleted_at = NULL WHERE id = ANY(%s)', (restored,))
+            bump_version(conn, 'bookings')
+        conn.commit()
+
+        return jsonify({'results': bulk_results(ids, errors)})
+    except Exception as e:
+        logger.error(f"Error restoring bookings: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@views.route('/api/trash/trips/<int:trip_id>/restore', methods=['POST'])
 def restore_trip(trip_id):
     try:
         conn = get_db()
@@ -840,19 +1029,22 @@ def restore_trip(trip_id):
         
         c = conn.cursor()
 
-        c.execute('UPDATE trips SET is_deleted = FALSE, deleted_at = NULL WHERE id = %s', (trip_id,))
+        c.execute('UPDATE trips SET is_deleted = FALSE, deleted_at = NULL WHERE id = %s AND is_deleted = TRUE RETURNING id',
+                  (trip_id,))
 
-        c.execute('DELETE FROM deleted_trips WHERE original_id = %s', (trip_id,))
+        if not c.fetchone():
+            return jsonify({'error': 'Deleted trip not found'}), 404
+
+        bump_version(conn, 'trips')
 
         conn.commit()
-        conn.close()
 
         return jsonify({'message': 'Trip restored successfully'})
     except Exception as e:
         logger.error(f"Error restoring trip {trip_id}: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/trash/trips/<int:trip_id>/permanent', methods=['DELETE'])
+@views.route('/api/trash/trips/<int:trip_id>/permanent', methods=['DELETE'])
 def delete_trip_permanent(trip_id):
     try:
         conn = get_db()
@@ -861,127 +1053,269 @@ def delete_trip_permanent(trip_id):
         
         c = conn.cursor()
 
-        c.execute('DELETE FROM deleted_trips WHERE original_id = %s', (trip_id,))
+        # The delete cascades into trip_rooms; lock those rows first.
+        lock_rooms(conn, [(trip_id, room_type) for room_type in ROOM_TYPES])
         c.execute('DELETE FROM trips WHERE id = %s', (trip_id,))
+        bump_version(conn, 'trips')
 
         conn.commit()
-        conn.close()
 
         return jsonify({'message': 'Trip permanently deleted'})
     except Exception as e:
         logger.error(f"Error permanently deleting trip {trip_id}: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/stats', methods=['GET'])
+@views.route('/api/stats', methods=['GET'])
 def get_stats():
     conn = get_db()
     if not conn:
         return jsonify({'error': 'Database connection failed'}), 500
     
-    c = conn.cursor()
+    version, last_modified = versioned(read_versions(conn, 'trips', 'bookings'), 'trips', 'bookings')
+    etag = make_etag('stats', version)
+    response = not_modified(etag, last_modified)
+    if response is not None:
+        return response
+
+    return add_validators(jsonify(read_stats(conn)), etag, last_modified)
+
+@views.route('/api/health', methods=['GET'])
+def get_health():
+    # Readiness probe for the platform: no database work once the schema has
+    # been seen up to date.
+    if not schema_ready():
+        return jsonify({'status': 'unavailable', 'error': 'Database unreachable or schema out of date'}), 503
+    return jsonify({'status': 'ok'})
+
+@views.route('/api/pool/stats', methods=['GET'])
+def get_pool_stats():
+    return jsonify(pool_stats())
+
+@views.route('/api/cache/stats', methods=['GET'])
+def get_cache_stats():
+    return jsonify(trip_cache.stats())
+
+@views.route('/api/events/stats', methods=['GET'])
+def get_events_stats():
+    return jsonify(change_feed.stats())
+
+@views.route('/api/jobs/stats', methods=['GET'])
+def get_jobs_stats():
+    conn = get_db()
+    if not conn:
+        return jsonify({'error': 'Database connection failed'}), 500
 
-    c.execute('SELECT COUNT(*) FROM bookings WHERE is_deleted = FALSE')
-    total_bookings = c.fetchone()['count']
+    return jsonify(queue_stats(conn))
 
-    c.execute('SELECT COUNT(*) FROM bookings WHERE status = %s AND is_deleted = FALSE', ('pending',))
-    pending_bookings = c.fetchone()['count']
+@views.route('/api/ratelimit/stats', methods=['GET'])
+def get_ratelimit_stats():
+    return jsonify(limiter_stats())
 
-    c.execute('SELECT COUNT(*) FROM bookings WHERE status = %s AND is_deleted = FALSE', ('approved',))
-    approved_bookings = c.fetchone()['count']
+@views.route('/api/events', methods=['GET'])
+def stream_events():
+    # Browsers resend the id of the last event they saw when reconnecting;
+    # the query parameter lets a fresh page resume from a stored id.
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return jsonify({'error': 'Last-Event-ID must be an integer'}), 400
+
+    # No pooled connection is held for the life of the stream: events come
+    # from the per-process listener.
+    subscription = change_feed.subscribe()
+    response = current_app.response_class(event_stream(subscription, last_event_id), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def requested_booking_fields():
+    if 'fields' in request.args:
+        fields = [field.strip() for field in request.args['fields'].split(',') if field.strip()]
+        for field in fields:
+            if field not in BOOKING_FIELDS:
+                raise PaginationError(f'Unknown field: {field}')
+        return fields or BOOKING_SUMMARY_FIELDS
+
+    if request.args.get('view', 'summary') == 'full':
+        return BOOKING_FIELDS
+    return BOOKING_SUMMARY_FIELDS
+
+def get_bookings_page(conn, branch_filter):
+    try:
+        fields = requested_booking_fields()
+        limit = parse_limit(request.args.get('limit'))
+        cursor = request.args.get('cursor')
+        after = decode_cursor(cursor, 2) if cursor else None
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # One extra row tells whether another page exists.
+    rows = fetch_bookings_page(conn, fields, branch_filter, after, limit + 1,
+                               status_filter=request.args.get('status', 'all'))
+
+    serialize = booking_serializer(fields)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].booking_date, rows[-1].id)
 
-    c.execute('SELECT COUNT(*) FROM trips WHERE is_deleted = FALSE')
-    total_trips = c.fetchone()['count']
+    return jsonify({
+        'bookings': [serialize(row) for row in rows],
+        'next_cursor': next_cursor
+    })
 
-    c.execute('''SELECT branch_state as state, COUNT(*) as count 
-               FROM bookings WHERE is_deleted = FALSE GROUP BY branch_state''')
-    rows = c.fetchall()
-    state_stats = {row['state']: row['count'] for row in rows}
+@views.route('/api/bookings/search', methods=['GET'])
+def search_bookings_route():
+    try:
+        q, limit = parse_search(request.args)
+        fields = requested_booking_fields()
+    except (SearchError, PaginationError) as e:
+        return jsonify({'error': str(e)}), 400
 
-    c.execute('''SELECT umrah_type as type, COUNT(*) as count 
-               FROM bookings WHERE is_deleted = FALSE GROUP BY umrah_type''')
-    rows = c.fetchall()
-    type_stats = {row['type']: row['count'] for row in rows}
+    conn = get_db()
+    if not conn:
+        return jsonify({'error': 'Database connection failed'}), 500
 
-    conn.close()
-    return jsonify({
-        'total_bookings': total_bookings,
-        'pending_bookings': pending_bookings,
-        'approved_bookings': approved_bookings,
-        'total_trips': total_trips,
-        'state_stats': state_stats,
-        'type_stats': type_stats
-    })
+    branch_filter = request.args.get('branch', 'all')
+
+    version, last_modified = versioned(read_versions(conn, 'trips', 'bookings'), 'trips', 'bookings')
+    etag = make_etag('bookings-search', sorted(request.args.items(multi=True)), version)
+    response = not_modified(etag, last_modified)
+    if response is not None:
+        return response
+
+    serialize = booking_serializer(fields)
+    rows = search_bookings(conn, q, fields, branch_filter, limit)
+
+    return add_validators(jsonify({'bookings': [serialize(row) for row in rows]}), etag, last_modified)
+
+@views.route('/api/bookings/export', methods=['GET'])
+def export_bookings():
+    export_format = request.args.get('format', 'json')
+    if export_format not in ('json', 'ndjson') + EXPORT_FORMATS:
+        return jsonify({'error': 'format must be json, ndjson, csv or xlsx'}), 400
+    if export_format == 'xlsx' and not XLSX_AVAILABLE:
+        return jsonify({'error': 'XLSX export requires XlsxWriter'}), 501
 
-@app.route('/api/bookings', methods=['GET'])
-def get_bookings():
     conn = get_db()
     if not conn:
         return jsonify({'error': 'Database connection failed'}), 500
-    
-    c = conn.cursor()
 
     branch_filter = request.args.get('branch', 'all')
 
-    if branch_filter == 'all':
-        c.execute('''SELECT b.*, t.date as trip_date, t.airline as trip_airline 
-                     FROM bookings b 
-                     JOIN trips t ON b.trip_id = t.id 
-                     WHERE b.is_deleted = FALSE''')
-    else:
-        c.execute('''SELECT b.*, t.date as trip_date, t.airline as trip_airline 
-                     FROM bookings b 
-                     JOIN trips t ON b.trip_id = t.id 
-                     WHERE b.is_deleted = FALSE AND b.branch_state = %s''', (branch_filter,))
-
-    bookings = c.fetchall()
-
-    bookings_list = []
-    for booking in bookings:
-        bookings_list.append({
-            'id': booking['id'],
-            'tripId': booking['trip_id'],
-            'firstName': booking['first_name'],
-            'lastName': booking['last_name'],
-            'email': booking['email'],
-            'phone': booking['phone'],
-            'whatsappNumber': booking['whatsapp_number'],
-            'birthDate': booking['birth_date'],
-            'birthPlace': booking['birth_place'],
-            'passportNumber': booking['passport_number'],
-            'passportIssueDate': booking['passport_issue_date'],
-            'passportExpiryDate': booking['passport_expiry_date'],
-            'passportScan': booking['passport_scan'],
-            'passportFile': booking['passport_file'],
-            'maritalStatus': booking['marital_status'],
-            'fatherName': booking['father_name'],
-            'grandfatherName': booking['grandfather_name'],
-            'jobTitle': booking['job_title'],
-            'educationLevel': booking['education_level'],
-            'facebookProfile': booking['facebook_profile'],
-            'umrahType': booking['umrah_type'],
-            'roomType': booking['room_type'],
-            'notes': booking['notes'],
-            'status': booking['status'],
-            'bookingDate': booking['booking_date'],
-            'branchState': booking['branch_state'],
-            'trip': {
-                'date': booking['trip_date'],
-                'airline': booking['trip_airline']
-            }
-        })
+    if export_format in EXPORT_FORMATS:
+        return export_response(conn, 'bookings', bookings_export_query(branch_filter), BOOKING_EXPORT_COLUMNS,
+                               export_format, {'branch': branch_filter})
+
+    query = bookings_query(BOOKING_FIELDS, branch_filter) + ' ORDER BY b.id'
+    params = {'branch': branch_filter}
+
+    def generate():
+        # A named cursor keeps the result set on the server; only one batch
+        # of rows is held in this worker at a time.
+        with conn.cursor(name='bookings_export', row_factory=BOOKING_ROW) as c:
+            c.execute(query, params)
+            first = True
+            if export_format == 'json':
+                yield '['
+            while True:
+                rows = c.fetchmany(EXPORT_BATCH_SIZE)
+                if not rows:
+                    break
+                if export_format == 'json':
+                    chunk = ','.join(current_app.json.dumps(serialize_booking(row)) for row in rows)
+                    yield chunk if first else ',' + chunk
+                else:
+                    yield ''.join(current_app.json.dumps(serialize_booking(row)) + '\n' for row in rows)
+                first = False
+            if export_format == 'json':
+                yield ']\n'
+
+    mimetype = 'application/json' if export_format == 'json' else 'application/x-ndjson'
+    response = current_app.response_class(stream_with_context(generate()), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=bookings.{export_format}'
+    return response
+
+@views.route('/api/bookings/<int:booking_id>', methods=['GET'])
+def get_booking(booking_id):
+    conn = get_db()
+    if not conn:
+        return jsonify({'error': 'Database connection failed'}), 500
+
+    version, last_modified = versioned(read_versions(conn, 'trips', 'bookings'), 'trips', 'bookings')
+    etag = make_etag('booking', booking_id, version)
+    response = not_modified(etag, last_modified)
+    if response is not None:
+        return response
+
+    booking = fetch_booking(conn, booking_id, BOOKING_FIELDS)
+
+    if not booking:
+        return jsonify({'error': 'Booking not found'}), 404
+
+    return add_validators(jsonify(serialize_booking(booking)), etag, last_modified)
+
+@views.route('/api/bookings', methods=['GET'])
+def get_bookings():
+    conn = get_db()
+    if not conn:
+        return jsonify({'error': 'Database connection failed'}), 500
+
+    branch_filter = request.args.get('branch', 'all')
 
-    conn.close()
-    return jsonify(bookings_list)
+    version, last_modified = versioned(read_versions(conn, 'trips', 'bookings'), 'trips', 'bookings')
+    etag = make_etag('bookings', sorted(request.args.items(multi=True)), version)
+    response = not_modified(etag, last_modified)
+    if response is not None:
+        return response
+
+    # Paged, projected listing, which is what the dashboard uses. Without
+    # any of these parameters the full history is returned as a plain array
+    # for older clients.
+    if any(arg in request.args for arg in ('limit', 'cursor', 'fields', 'view', 'status')):
+        response = get_bookings_page(conn, branch_filter)
+        if isinstance(response, tuple):
+            return response
+        return add_validators(response, etag, last_modified)
+
+    bookings_list = [serialize_booking(booking) for booking in fetch_bookings(conn, BOOKING_FIELDS, branch_filter)]
+
+    return add_validators(jsonify(bookings_list), etag, last_modified)
+
+def create_app():
+    # /static is served by serve_static, which knows about the asset build.
+    app = Flask(__name__, static_folder=None, template_folder='.')
+    app.request_class = UploadRequest
+    if TRUSTED_PROXIES:
+        # Client addresses, which the rate limits are keyed on, come from
+        # X-Forwarded-For as set by our own proxies.
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES)
+    app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
+
+    CORS(app)
+    init_db_pool(app)
+    init_compression(app)
+    init_json(app)
+    app.cli.add_command(db_cli)
+    app.cli.add_command(stats_cli)
+    app.cli.add_command(trash_cli)
+    app.cli.add_command(jobs_cli)
+    app.cli.add_command(assets_cli)
+    app.jinja_env.globals['asset_url'] = asset_url
+    app.register_blueprint(views)
+    return app
+
+# `flask --app app`, gunicorn (app:app) and the bench scripts use this one.
+app = create_app()
 
 if __name__ == '__main__':
-    init_db()
+    logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper())
+    check_schema()
+    job_worker.start()
 
     port = int(os.environ.get('PORT', 5000))
     logger.info(f"Starting Flask app on port {port}")
     
     app.run(host="0.0.0.0", port=port, debug=False)
 
-else:
-    # For production servers (Render)
-    init_db()
-    # gunicorn_app is not used but kept for compatibility
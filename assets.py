@@ -0,0 +1,216 @@
+from flask import request, send_from_directory
+from flask.cli import AppGroup
+import os
+import re
+import gzip
+import json
+import shutil
+import hashlib
+import logging
+import mimetypes
+import click
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+STATIC_FOLDER = 'static'
+DIST_FOLDER = os.path.join(STATIC_FOLDER, 'dist')
+MANIFEST_PATH = os.path.join(DIST_FOLDER, 'manifest.json')
+
+# Runtime output and build output are never fed back into the build.
+SKIP_FOLDERS = {'uploads', 'dist'}
+
+IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg'}
+TEXT_EXTENSIONS = {'html', 'css', 'js', 'svg', 'json', 'txt'}
+
+IMAGE_VARIANTS = [('image/avif', 'avif'), ('image/webp', 'webp')]
+
+# Preferred first.
+ENCODINGS = [('br', 'br'), ('gzip', 'gz')]
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+_manifest = None
+
+
+def fingerprint(name, digest):
+    stem, extension = os.path.splitext(name)
+    return f'{stem}.{digest[:12]}{extension}'
+
+
+def write_image_variants(source, stem):
+    from PIL import Image
+
+    try:
+        import pillow_avif  # noqa: F401  registers the AVIF encoder
+    except ImportError:
+        pass
+
+    variants = []
+    with Image.open(source) as image:
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+
+        for mimetype, extension in IMAGE_VARIANTS:
+            target = f'{stem}.{extension}'
+            try:
+                image.save(os.path.join(DIST_FOLDER, target), extension.upper(), quality=80)
+            except (KeyError, OSError) as e:
+                logger.warning(f"Skipping {extension} variant of {source}: {str(e)}")
+                continue
+
+            # Only worth serving when it is actually smaller.
+            size = os.path.getsize(os.path.join(DIST_FOLDER, target))
+            if size < os.path.getsize(source):
+                variants.append((size, mimetype, target))
+            else:
+                os.remove(os.path.join(DIST_FOLDER, target))
+
+    # Smallest first: AVIF is not always smaller than WebP for flat artwork.
+    return [[mimetype, target] for _, mimetype, target in sorted(variants)]
+
+
+def rewrite_references(data, manifest):
+    # Points `static/<file>` references inside HTML/CSS at the fingerprinted
+    # copies, so pages pull immutable URLs.
+    text = data.decode('utf-8')
+    for logical, entry in manifest.items():
+        text = re.sub(rf'static/{re.escape(logical)}(?=["\')?#])', f"static/dist/{entry['file']}", text)
+    return text.encode('utf-8')
+
+
+def write_encodings(data, target):
+    encoded = {'gzip': gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        encoded['br'] = brotli.compress(data, quality=11)
+
+    encodings = {}
+    for encoding, extension in ENCODINGS:
+        if encoding in encoded and len(encoded[encoding]) < len(data):
+            with open(os.path.join(DIST_FOLDER, f'{target}.{extension}'), 'wb') as f:
+                f.write(encoded[encoding])
+            encodings[encoding] = f'{target}.{extension}'
+    return encodings
+
+
+def build_assets():
+    if os.path.isdir(DIST_FOLDER):
+        shutil.rmtree(DIST_FOLDER)
+    os.makedirs(DIST_FOLDER)
+
+    sources = []
+    for root, folders, files in os.walk(STATIC_FOLDER):
+        if root == STATIC_FOLDER:
+            folders[:] = [folder for folder in folders if folder not in SKIP_FOLDERS]
+        for name in files:
+            source = os.path.join(root, name)
+            sources.append((os.path.relpath(source, STATIC_FOLDER).replace(os.sep, '/'), source))
+
+    # Text files go last so their references to other assets can be rewritten
+    # (and included in their own fingerprint).
+    sources.sort(key=lambda item: (item[0].rsplit('.', 1)[-1].lower() in TEXT_EXTENSIONS, item[0]))
+
+    manifest = {}
+    for logical, source in sources:
+        extension = logical.rsplit('.', 1)[-1].lower()
+
+        with open(source, 'rb') as f:
+            data = f.read()
+        if extension in TEXT_EXTENSIONS:
+            data = rewrite_references(data, manifest)
+
+        target = fingerprint(logical, hashlib.sha256(data).hexdigest())
+        os.makedirs(os.path.dirname(os.path.join(DIST_FOLDER, target)), exist_ok=True)
+        with open(os.path.join(DIST_FOLDER, target), 'wb') as f:
+            f.write(data)
+
+        entry = {'file': target, 'variants': [], 'encodings': {}}
+        if extension in IMAGE_EXTENSIONS:
+            entry['variants'] = write_image_variants(source, os.path.splitext(target)[0])
+        elif extension in TEXT_EXTENSIONS:
+            entry['encodings'] = write_encodings(data, target)
+        manifest[logical] = entry
+
+    with open(MANIFEST_PATH, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    return manifest
+
+
+def load_manifest():
+    # Read once per process; the build runs before the server starts.
+    global _manifest
+    if _manifest is None:
+        try:
+            with open(MANIFEST_PATH, encoding='utf-8') as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            manifest = {}
+        fingerprinted = {entry['file']: logical for logical, entry in manifest.items()}
+        _manifest = (manifest, fingerprinted)
+    return _manifest
+
+
+def asset_url(path):
+    manifest, _ = load_manifest()
+    entry = manifest.get(path)
+    return f"/static/{'dist/' + entry['file'] if entry else path}"
+
+
+def serve_asset(path):
+    # Serves `path` (logical or fingerprinted) from the build output, picking
+    # the best variant the client accepts. Returns None when the file is not
+    # part of the build.
+    manifest, fingerprinted = load_manifest()
+
+    immutable = path.startswith('dist/') and path[len('dist/'):] in fingerprinted
+    logical = fingerprinted[path[len('dist/'):]] if immutable else path
+    entry = manifest.get(logical)
+    if entry is None:
+        return None
+
+    filename = entry['file']
+    mimetype = mimetypes.guess_type(logical)[0] or 'application/octet-stream'
+    content_encoding = None
+    vary = None
+
+    if entry['variants']:
+        vary = 'Accept'
+        for variant_type, variant_file in entry['variants']:
+            # Only on explicit support: `*/*` alone does not promise AVIF/WebP.
+            if any(value == variant_type and quality > 0 for value, quality in request.accept_mimetypes):
+                filename, mimetype = variant_file, variant_type
+                break
+    elif entry['encodings']:
+        vary = 'Accept-Encoding'
+        for encoding, _ in ENCODINGS:
+            if encoding in entry['encodings'] and request.accept_encodings.quality(encoding) > 0:
+                filename, content_encoding = entry['encodings'][encoding], encoding
+                break
+
+    response = send_from_directory(DIST_FOLDER, filename, mimetype=mimetype)
+    if content_encoding:
+        response.headers['Content-Encoding'] = content_encoding
+    if vary:
+        response.vary.add(vary)
+    response.headers['Cache-Control'] = IMMUTABLE if immutable else 'no-cache'
+    return response
+
+
+assets_cli = AppGroup('assets', help='Static asset build.')
+
+
+@assets_cli.command('build')
+def build_command():
+    """Write fingerprinted, precompressed and re-encoded static assets."""
+    manifest = build_assets()
+    before = after = 0
+    for logical, entry in manifest.items():
+        before += os.path.getsize(os.path.join(STATIC_FOLDER, logical))
+        smallest = [entry['file']] + [name for _, name in entry['variants']] + list(entry['encodings'].values())
+        after += min(os.path.getsize(os.path.join(DIST_FOLDER, name)) for name in smallest)
+    click.echo(f'Built {len(manifest)} assets into {DIST_FOLDER}: {before} -> {after} bytes at best')
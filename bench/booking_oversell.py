@@ -0,0 +1,81 @@
+# Fires many simultaneous bookings at one limited room type and checks that
+# exactly `capacity` of them succeed.
+#
+#   DATABASE_URL=postgresql://.../scratch flask --app app db upgrade
+#   DATABASE_URL=postgresql://.../scratch python bench/booking_oversell.py --capacity 20 --requests 300
+#
+# Run it against a scratch database: it creates a trip and bookings.
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DB_POOL_MAX_SIZE', '20')
+os.environ.setdefault('DB_POOL_TIMEOUT', '60')
+# Every request comes from the test client's single address.
+os.environ.setdefault('RATE_LIMIT_ENABLED', '0')
+
+from app import app  # noqa: E402
+from db import get_pool  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--capacity', type=int, default=20)
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--threads', type=int, default=100)
+    parser.add_argument('--room-type', default='4')
+    args = parser.parse_args()
+
+    client = app.test_client()
+    response = client.post('/api/trips', json={
+        'date': '2026-12-01', 'airline': 'Oversell check', 'hotel': 'H', 'route': 'R',
+        'duration': 15, 'type': 'umrah', 'state': 'all',
+        'room5_price': 1, 'room4_price': 1, 'room3_price': 1, 'room2_price': 1,
+        f'room{args.room_type}_capacity': args.capacity
+    })
+    trip_id = response.get_json()['id']
+
+    start = threading.Barrier(min(args.threads, args.requests))
+
+    def book(i):
+        if i < start.parties:
+            start.wait()
+        response = app.test_client().post('/api/bookings', data={
+            'tripId': str(trip_id), 'firstName': f'Pilgrim {i}', 'lastName': 'Test',
+            'email': f'p{i}@example.com', 'phone': '0', 'birthDate': '1990-01-01',
+            'birthPlace': 'Alger', 'passportNumber': f'P{i:06d}',
+            'passportIssueDate': '2020-01-01', 'passportExpiryDate': '2030-01-01',
+            'umrahType': 'umrah', 'roomType': args.room_type, 'maritalStatus': 'single',
+            'fatherName': 'F', 'grandfatherName': 'G', 'jobTitle': 'J', 'educationLevel': 'E'
+        })
+        return response.status_code
+
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        statuses = list(executor.map(book, range(args.requests)))
+
+    with get_pool().connection() as conn:
+        c = conn.cursor()
+        c.execute('SELECT COUNT(*) FROM bookings WHERE trip_id = %s AND room_type = %s AND is_deleted = FALSE',
+                  (trip_id, args.room_type))
+        stored = c.fetchone()['count']
+        c.execute('SELECT booked FROM trip_rooms WHERE trip_id = %s AND room_type = %s', (trip_id, args.room_type))
+        booked = c.fetchone()['booked']
+        c.execute(f'SELECT room{args.room_type}_status AS status FROM trips WHERE id = %s', (trip_id,))
+        status = c.fetchone()['status']
+
+    accepted = statuses.count(201)
+    print(f'requests={args.requests} capacity={args.capacity} accepted={accepted} '
+          f'rejected={statuses.count(400)} other={len(statuses) - accepted - statuses.count(400)}')
+    print(f'bookings stored={stored} trip_rooms.booked={booked} room status={status}')
+
+    if accepted != args.capacity or stored != args.capacity or booked != args.capacity or status != 'full':
+        print('OVERSOLD or inconsistent inventory')
+        sys.exit(1)
+    print('OK: no oversell')
+
+
+if __name__ == '__main__':
+    main()
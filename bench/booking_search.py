@@ -0,0 +1,95 @@
+# Measures GET /api/bookings/search latency over a large bookings table.
+#
+#   DATABASE_URL=postgresql://.../scratch flask --app app db upgrade
+#   DATABASE_URL=postgresql://.../scratch python bench/booking_search.py --seed 500000
+#
+# --seed COPYs that many synthetic bookings in first; run it against a
+# scratch database. Later runs can drop --seed and reuse the data.
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app  # noqa: E402
+from db import get_pool  # noqa: E402
+
+FIRST_NAMES = ['محمد', 'أحمد', 'عبد القادر', 'فاطمة', 'خديجة', 'يوسف', 'مريم', 'عائشة', 'إبراهيم', 'نور الدين',
+               'Mohamed', 'Ahmed', 'Karim', 'Sofiane', 'Amina', 'Yasmine', 'Rachid', 'Nadia', 'Samir', 'Lina']
+LAST_NAMES = ['بن علي', 'بوزيد', 'حمادي', 'بلقاسم', 'زروقي', 'مسعودي', 'شريف', 'عمراني', 'بن يوسف', 'قاسمي',
+              'Benali', 'Bouzid', 'Hamadi', 'Belkacem', 'Zerrouki', 'Messaoudi', 'Cherif', 'Amrani', 'Kacemi', 'Saadi']
+BRANCHES = ['Alger', 'Oran', 'Constantine', 'Setif']
+
+COPY_BOOKINGS = '''COPY bookings (trip_id, first_name, last_name, email, phone, whatsapp_number, birth_date,
+    birth_place, passport_number, passport_issue_date, passport_expiry_date, marital_status, father_name,
+    grandfather_name, job_title, education_level, umrah_type, room_type, booking_date, branch_state)
+    FROM STDIN'''
+
+
+def seed(count):
+    random.seed(1)
+    with get_pool().connection() as conn:
+        c = conn.cursor()
+        c.execute('''INSERT INTO trips (date, airline, hotel, route, duration, type, state,
+                                        room5_price, room4_price, room3_price, room2_price)
+                     VALUES ('2027-01-01', 'bench', 'bench', 'ALG-JED', 15, 'umrah', 'all', 1, 1, 1, 1)
+                     RETURNING id''')
+        trip_id = c.fetchone()['id']
+        with c.copy(COPY_BOOKINGS) as copy:
+            for i in range(count):
+                phone = f'0{random.choice("567")}{random.randrange(10 ** 8):08d}'
+                copy.write_row((trip_id, random.choice(FIRST_NAMES), random.choice(LAST_NAMES), f'user{i}@example.com',
+                                phone, phone, '1980-01-01', 'Alger', f'{random.choice("ABCP")}{i:08d}',
+                                '2020-01-01', '2030-01-01', 'married', random.choice(FIRST_NAMES),
+                                random.choice(FIRST_NAMES), 'job', 'university', 'umrah', '4',
+                                f'2026-{i % 12 + 1:02d}-01T10:00:00', random.choice(BRANCHES)))
+        c.execute('ANALYZE bookings')
+        conn.commit()
+
+
+def queries(count):
+    random.seed(2)
+    mix = []
+    for _ in range(count):
+        kind = random.randrange(4)
+        if kind == 0:
+            mix.append(random.choice(FIRST_NAMES))
+        elif kind == 1:
+            mix.append(f'{random.choice(FIRST_NAMES)} {random.choice(LAST_NAMES)[:3]}')
+        elif kind == 2:
+            mix.append(f'0{random.choice("567")}{random.randrange(10 ** 4):04d}')
+        else:
+            mix.append(f'{random.choice("ABCP")}{random.randrange(10 ** 5):05d}')
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--queries', type=int, default=400)
+    args = parser.parse_args()
+
+    if args.seed:
+        start = time.perf_counter()
+        seed(args.seed)
+        print(f'seeded {args.seed} bookings in {time.perf_counter() - start:.1f}s')
+
+    client = app.test_client()
+    timings = []
+    for q in queries(args.queries):
+        start = time.perf_counter()
+        response = client.get('/api/bookings/search', query_string={'q': q})
+        timings.append((time.perf_counter() - start) * 1000)
+        if response.status_code != 200:
+            sys.exit(f'Search failed for {q!r}: {response.status_code} {response.get_json()}')
+
+    timings.sort()
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f'{len(timings)} searches: p50 {statistics.median(timings):.1f} ms, p95 {p95:.1f} ms, max {timings[-1]:.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
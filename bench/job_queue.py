@@ -0,0 +1,79 @@
+# Measures how fast the job queue drains and how long enqueueing adds to a
+# writer's transaction.
+#
+#   DATABASE_URL=postgresql://.../scratch flask --app app db upgrade
+#   DATABASE_URL=postgresql://.../scratch python bench/job_queue.py --jobs 2000 --job-ms 20 --concurrency 1 2 4 8
+#
+# Uses a job kind registered here that sleeps --job-ms, standing in for an
+# SMTP or gateway round trip; run it against a scratch database.
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import jobs  # noqa: E402
+from db import get_pool  # noqa: E402
+
+BENCH_KIND = 'bench_sleep'
+
+
+@jobs.job_handler(BENCH_KIND)
+def sleep(payload):
+    time.sleep(payload['ms'] / 1000)
+
+
+def enqueue_jobs(count, job_ms=0):
+    timings = []
+    with get_pool().connection() as conn:
+        for i in range(count):
+            start = time.perf_counter()
+            jobs.enqueue(conn, BENCH_KIND, {'n': i, 'ms': job_ms})
+            timings.append((time.perf_counter() - start) * 1000)
+        conn.commit()
+    return timings
+
+
+def remaining():
+    with get_pool().connection() as conn:
+        row = conn.execute('SELECT COUNT(*) AS count FROM jobs WHERE kind = %s AND status <> %s',
+                           (BENCH_KIND, 'done')).fetchone()
+        return row['count']
+
+
+def drain(count, concurrency, job_ms):
+    enqueue_jobs(count, job_ms)
+    worker = jobs.JobWorker(concurrency)
+    start = time.perf_counter()
+    worker.start()
+    while remaining():
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - start
+    worker.stop()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--jobs', type=int, default=2000)
+    parser.add_argument('--job-ms', type=float, default=20)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    timings = sorted(enqueue_jobs(1000))
+    print(f'enqueue: p50 {statistics.median(timings):.2f} ms, p95 {timings[int(len(timings) * 0.95) - 1]:.2f} ms')
+    drain(0, 1, 0)
+
+    for concurrency in args.concurrency:
+        elapsed = drain(args.jobs, concurrency, args.job_ms)
+        print(f'{concurrency} workers: {args.jobs} jobs in {elapsed:.2f}s ({args.jobs / elapsed:.0f} jobs/s)')
+
+    with get_pool().connection() as conn:
+        conn.execute('DELETE FROM jobs WHERE kind = %s', (BENCH_KIND,))
+        conn.commit()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+# Measures what the rate limiter and admission control add to a request, with
+# several processes sharing the state the way gunicorn workers do.
+#
+#   python bench/rate_limit.py --processes 4 --calls 20000
+#
+# Uses its own state file, so it does not disturb a running server.
+import argparse
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ratelimit  # noqa: E402
+
+
+def worker(path, calls, clients, results):
+    backend = ratelimit.LocalBackend(path)
+    take = []
+    admit = []
+    for i in range(calls):
+        start = time.perf_counter()
+        backend.take('bookings', f'10.0.{i % clients // 256}.{i % 256}', 10, 60)
+        take.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        slot = backend.acquire('bookings', 8, 1)
+        if slot is not None:
+            backend.release('bookings', slot)
+        admit.append(time.perf_counter() - start)
+    results.put((take, admit))
+
+
+def percentile(values, fraction):
+    return values[int(len(values) * fraction) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--calls', type=int, default=20000)
+    parser.add_argument('--clients', type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'ratelimit')
+        results = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=worker, args=(path, args.calls, args.clients, results))
+                     for _ in range(args.processes)]
+        start = time.perf_counter()
+        for process in processes:
+            process.start()
+        take, admit = [], []
+        for _ in processes:
+            process_take, process_admit = results.get()
+            take.extend(process_take)
+            admit.extend(process_admit)
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - start
+
+    for name, timings in (('take', take), ('acquire+release', admit)):
+        timings.sort()
+        print(f'{name}: p50 {statistics.median(timings) * 1e6:.1f} us, p99 {percentile(timings, 0.99) * 1e6:.1f} us')
+    print(f'{len(take)} checks from {args.processes} processes in {elapsed:.2f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+# Compares the old per-row dict building + stdlib JSON with the compiled
+# shapes + orjson provider on synthetic rows (dict rows for the old path, row
+# models for the new one). Needs no database.
+#
+#   python bench/serialize_rows.py --rows 10000
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from serializers import ORJSONProvider, orjson, serialize_booking, serialize_trip  # noqa: E402
+from queries import Booking, Trip  # noqa: E402
+
+
+def trip_rows(count):
+    return [{
+        'id': i, 'date': '2026-11-01', 'airline': 'الخطوط السعودية', 'airline_logo': 'static/airline_saudi.png',
+        'hotel': 'فندق مكة', 'hotel_logo': None, 'hotel_distance': '300m', 'route': 'ALG-JED',
+        'duration': 15, 'type': 'umrah', 'state': 'all',
+        'room5_price': 150000, 'room5_status': 'available', 'room4_price': 170000, 'room4_status': 'available',
+        'room3_price': 190000, 'room3_status': 'full', 'room2_price': 220000, 'room2_status': 'available'
+    } for i in range(count)]
+
+
+def booking_rows(count):
+    rows = []
+    for i in range(count):
+        row = {
+            'id': i, 'trip_id': i % 40, 'first_name': 'محمد', 'last_name': 'بن علي', 'email': f'user{i}@example.com',
+            'phone': '0550000000', 'whatsapp_number': '0550000000', 'birth_date': '1980-01-01', 'birth_place': 'Alger',
+            'passport_number': f'P{i:08d}', 'passport_issue_date': '2020-01-01', 'passport_expiry_date': '2030-01-01',
+            'passport_scan': '', 'passport_file': None, 'marital_status': 'married', 'father_name': 'أحمد',
+            'grandfather_name': 'علي', 'job_title': 'teacher', 'education_level': 'university', 'facebook_profile': '',
+            'umrah_type': 'umrah', 'room_type': '4', 'notes': '', 'status': 'pending',
+            'booking_date': '2026-10-16T10:00:00', 'branch_state': 'Alger',
+            'trip_date': '2026-11-01', 'trip_airline': 'الخطوط السعودية'
+        }
+        rows.append(row)
+    return rows
+
+
+def old_trip(trip):
+    return {
+        'id': trip['id'],
+        'date': trip['date'],
+        'airline': trip['airline'],
+        'airline_logo': (trip['airline_logo'] or '').replace('static/', ''),
+        'hotel': trip['hotel'],
+        'hotel_logo': trip['hotel_logo'] or '',
+        'hotel_distance': trip['hotel_distance'] or '',
+        'route': trip['route'],
+        'duration': trip['duration'],
+        'type': trip['type'],
+        'state': trip['state'],
+        'room5': {'price': trip['room5_price'], 'status': trip['room5_status']},
+        'room4': {'price': trip['room4_price'], 'status': trip['room4_status']},
+        'room3': {'price': trip['room3_price'], 'status': trip['room3_status']},
+        'room2': {'price': trip['room2_price'], 'status': trip['room2_status']}
+    }
+
+
+def old_booking(booking):
+    return {
+        'id': booking['id'],
+        'tripId': booking['trip_id'],
+        'firstName': booking['first_name'],
+        'lastName': booking['last_name'],
+        'email': booking['email'],
+        'phone': booking['phone'],
+        'whatsappNumber': booking['whatsapp_number'],
+        'birthDate': booking['birth_date'],
+        'birthPlace': booking['birth_place'],
+        'passportNumber': booking['passport_number'],
+        'passportIssueDate': booking['passport_issue_date'],
+        'passportExpiryDate': booking['passport_expiry_date'],
+        'passportScan': booking['passport_scan'],
+        'passportFile': booking['passport_file'],
+        'maritalStatus': booking['marital_status'],
+        'fatherName': booking['father_name'],
+        'grandfatherName': booking['grandfather_name'],
+        'jobTitle': booking['job_title'],
+        'educationLevel': booking['education_level'],
+        'facebookProfile': booking['facebook_profile'],
+        'umrahType': booking['umrah_type'],
+        'roomType': booking['room_type'],
+        'notes': booking['notes'],
+        'status': booking['status'],
+        'bookingDate': booking['booking_date'],
+        'branchState': booking['branch_state'],
+        'trip': {'date': booking['trip_date'], 'airline': booking['trip_airline']}
+    }
+
+
+def measure(label, function, repeat):
+    best = min(timeit.repeat(function, number=1, repeat=repeat))
+    print(f'  {label:<28} {best * 1000:8.1f} ms')
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    default = DefaultJSONProvider(app)
+    fast = ORJSONProvider(app) if orjson is not None else default
+    if orjson is None:
+        print('orjson is not installed; measuring the compiled shapes only')
+
+    raw_trips = trip_rows(args.rows)
+    trips = [Trip(**row) for row in raw_trips]
+    raw_bookings = booking_rows(args.rows)
+    bookings = [Booking(**row) for row in raw_bookings]
+
+    cases = [
+        ('trips', lambda: default.dumps({'trips': [old_trip(t) for t in raw_trips]}),
+                  lambda: fast.dumps({'trips': [serialize_trip(t) for t in trips]})),
+        ('bookings', lambda: default.dumps([old_booking(b) for b in raw_bookings]),
+                     lambda: fast.dumps([serialize_booking(b) for b in bookings]))
+    ]
+
+    for name, old, new in cases:
+        print(f'{name} ({args.rows} rows)')
+        before = measure('dicts + stdlib json', old, args.repeat)
+        after = measure('compiled shape + provider', new, args.repeat)
+        print(f'  speedup                      {before / after:8.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+# Guards the cost of importing the app module, which every gunicorn boot,
+# CLI command and bench script pays. Each sample imports `app` in a fresh
+# interpreter, from an empty working directory and with DATABASE_URL pointing
+# at a server that does not exist, so database I/O at import shows up as a
+# slow import or an opened pool, and directory creation as new files.
+#
+#   python bench/startup.py --runs 10 --budget-ms 2000 [--profile]
+#
+# Exits non-zero when the median import exceeds the budget or the import had
+# side effects.
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = '''
+import json, os, sys, threading, time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+import app
+elapsed = time.perf_counter() - start
+import db
+print(json.dumps({{
+    'ms': elapsed * 1000,
+    'pool': db._pool is not None,
+    'threads': sorted(t.name for t in threading.enumerate() if t is not threading.main_thread()),
+    'files': sorted(os.listdir('.'))
+}}))
+'''
+
+UNREACHABLE_DATABASE = 'postgresql://startup-bench@/nowhere?host=/nonexistent&connect_timeout=1'
+
+
+def probe_environment():
+    env = dict(os.environ, DATABASE_URL=UNREACHABLE_DATABASE)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    return env
+
+
+def sample(workdir):
+    result = subprocess.run([sys.executable, '-c', PROBE.format(root=ROOT)], cwd=workdir, env=probe_environment(),
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def profile(workdir, top):
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', PROBE.format(root=ROOT)], cwd=workdir,
+                            env=probe_environment(), capture_output=True, text=True, check=True)
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        modules.append((int(cumulative), name.strip()))
+    print(f'slowest imports (cumulative, {top}):')
+    for cumulative, name in sorted(modules, reverse=True)[:top]:
+        print(f'  {cumulative / 1000:8.1f} ms  {name}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--budget-ms', type=float, default=2000)
+    parser.add_argument('--profile', action='store_true')
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    problems = []
+    timings = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for _ in range(args.runs):
+            result = sample(workdir)
+            timings.append(result['ms'])
+            if result['pool']:
+                problems.append('import opened the database pool')
+            if result['threads']:
+                problems.append(f'import started threads: {", ".join(result["threads"])}')
+            if result['files']:
+                problems.append(f'import created files in the working directory: {", ".join(result["files"])}')
+
+        if args.profile:
+            profile(workdir, args.top)
+
+    timings.sort()
+    median = statistics.median(timings)
+    print(f'import app: median {median:.1f} ms, min {timings[0]:.1f} ms, max {timings[-1]:.1f} ms ({args.runs} runs)')
+
+    if median > args.budget_ms:
+        problems.append(f'median import time {median:.1f} ms is over the {args.budget_ms:.0f} ms budget')
+    for problem in sorted(set(problems)):
+        print(f'FAIL: {problem}')
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+# Measures trip import (CSV -> COPY -> merge) and CSV/XLSX export throughput.
+#
+#   DATABASE_URL=postgresql://.../scratch flask --app app db upgrade
+#   DATABASE_URL=postgresql://.../scratch python bench/trip_import.py --rows 50000
+#
+# Run it against a scratch database: it creates the trips it imports.
+import argparse
+import csv
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app  # noqa: E402
+
+
+def trips_csv(count):
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(['date', 'airline', 'hotel', 'hotel_distance', 'route', 'duration', 'type', 'state',
+                     'room5_price', 'room4_price', 'room3_price', 'room2_price', 'room4_capacity'])
+    for i in range(count):
+        writer.writerow([f'2027-{i % 12 + 1:02d}-01', 'الخطوط الجزائرية', f'فندق {i}', '300m', 'ALG-JED', 15,
+                         'umrah', 'Alger, Oran', 150000, 170000, 190000, 220000, 40])
+    return output.getvalue().encode('utf-8')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=50000)
+    args = parser.parse_args()
+
+    client = app.test_client()
+    body = trips_csv(args.rows)
+
+    start = time.perf_counter()
+    response = client.post('/api/trips/import', data=body, content_type='text/csv')
+    elapsed = time.perf_counter() - start
+    if response.status_code != 200:
+        sys.exit(f'Import failed: {response.status_code} {response.get_json()}')
+    print(f'import      {args.rows} rows in {elapsed:.2f}s  ({args.rows / elapsed:,.0f} rows/s, {len(body) / 1e6:.1f} MB)')
+
+    for export_format in ('csv', 'xlsx'):
+        start = time.perf_counter()
+        response = client.get(f'/api/trips/export?format={export_format}')
+        size = len(response.get_data())
+        elapsed = time.perf_counter() - start
+        rows = args.rows if export_format == 'xlsx' else response.get_data().count(b'\n') - 1
+        print(f'export {export_format:<4} {rows} rows in {elapsed:.2f}s  ({rows / elapsed:,.0f} rows/s, {size / 1e6:.1f} MB)')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,5 @@
 #!/usr/bin/env bash
 pip install --upgrade pip
 pip install -r requirements.txt
+flask --app app db upgrade
+flask --app app assets build
@@ -0,0 +1,73 @@
+from collections import OrderedDict
+from flask import current_app
+from db import PREPARE
+import os
+import threading
+
+
+class TripCatalogCache:
+    # LRU of pre-serialized JSON bodies. Every entry remembers the
+    # cache_versions counter it was built under and is only served while that
+    # counter is unchanged, which keeps all worker processes coherent.
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version):
+        if version is None:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, version, payload):
+        body = (current_app.json.dumps(payload) + '\n').encode('utf-8')
+        if version is None:
+            return body
+
+        with self._lock:
+            self._entries[key] = (version, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return body
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+trip_cache = TripCatalogCache(int(os.environ.get('TRIP_CACHE_SIZE', 128)))
+
+
+def read_versions(conn, *names):
+    # Returns {name: (version, updated_at)} from one primary-key lookup.
+    c = conn.cursor()
+    c.execute('SELECT name, version, updated_at FROM cache_versions WHERE name = ANY(%s)', (list(names),), prepare=PREPARE)
+    return {row['name']: (row['version'], row['updated_at']) for row in c.fetchall()}
+
+
+def bump_version(conn, name):
+    # Must run inside the writer's transaction so the new version becomes
+    # visible exactly when the change itself commits.
+    c = conn.cursor()
+    c.execute('UPDATE cache_versions SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE name = %s', (name,))
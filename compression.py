@@ -0,0 +1,149 @@
+from collections import OrderedDict
+from flask import request
+from http_cache import CONTENT_CODINGS, coded_etag
+import os
+import zlib
+import threading
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/json', 'application/x-ndjson', 'text/csv',
+    'text/html', 'text/plain', 'text/css', 'application/javascript'
+}
+
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))
+GZIP_LEVEL = int(os.environ.get('COMPRESSION_GZIP_LEVEL', 6))
+BROTLI_QUALITY = int(os.environ.get('COMPRESSION_BROTLI_QUALITY', 5))
+COMPRESSION_CACHE_SIZE = int(os.environ.get('COMPRESSION_CACHE_SIZE', 64))
+COMPRESSION_CACHE_MAX_BODY = int(os.environ.get('COMPRESSION_CACHE_MAX_BODY', 512 * 1024))
+
+
+class GzipEncoder:
+    def __init__(self):
+        self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def chunk(self, data):
+        # Sync flush so every chunk of a stream reaches the client promptly.
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliEncoder:
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def chunk(self, data):
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+ENCODERS = {'gzip': GzipEncoder}
+if brotli is not None:
+    ENCODERS['br'] = BrotliEncoder
+
+
+def compress(data, coding):
+    if coding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+def compress_stream(chunks, encoder):
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            data = encoder.chunk(chunk)
+            if data:
+                yield data
+        yield encoder.finish()
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+
+
+class CompressedBodyCache:
+    # Compressed bodies of responses with a strong ETag, keyed by
+    # (ETag, coding). The ETag pins the exact uncompressed bytes, so a hit can
+    # be served without recompressing, e.g. for the trip catalog.
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+            return body
+
+    def put(self, key, body):
+        with self._lock:
+            self._entries[key] = body
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+compressed_cache = CompressedBodyCache(COMPRESSION_CACHE_SIZE)
+
+
+def negotiate_coding():
+    for coding in CONTENT_CODINGS:
+        if coding in ENCODERS and request.accept_encodings.quality(coding) > 0:
+            return coding
+    return None
+
+
+def compress_response(response):
+    if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+
+    response.vary.add('Accept-Encoding')
+
+    if (response.status_code != 200 or request.method == 'HEAD'
+            or 'Content-Encoding' in response.headers or response.direct_passthrough):
+        return response
+
+    coding = negotiate_coding()
+    if coding is None:
+        return response
+
+    etag, weak = response.get_etag()
+
+    if response.is_streamed:
+        response.response = compress_stream(response.response, ENCODERS[coding]())
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESSION_MIN_SIZE:
+            return response
+
+        cache_key = (etag, coding) if etag and not weak and len(data) <= COMPRESSION_CACHE_MAX_BODY else None
+        body = compressed_cache.get(cache_key) if cache_key else None
+        if body is None:
+            body = compress(data, coding)
+            if cache_key:
+                compressed_cache.put(cache_key, body)
+        response.set_data(body)
+
+    response.headers['Content-Encoding'] = coding
+    if etag and not weak:
+        response.set_etag(coded_etag(etag, coding))
+    return response
+
+
+def init_app(app):
+    app.after_request(compress_response)
@@ -0,0 +1,116 @@
+from flask import g, request, has_request_context
+from psycopg.pq import TransactionStatus
+from psycopg.rows import dict_row
+from psycopg_pool import ConnectionPool
+import os
+import logging
+import threading
+import traceback
+
+logger = logging.getLogger(__name__)
+
+# Hot-path queries are prepared on first use and stay prepared on the pooled
+# connection. Turn off behind a transaction-pooling proxy (e.g. PgBouncer).
+PREPARE = True if os.environ.get('DB_PREPARE_STATEMENTS', '1') == '1' else None
+
+READ_ONLY_METHODS = {'GET', 'HEAD', 'OPTIONS'}
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_database_url():
+    DATABASE_URL = os.environ.get('DATABASE_URL')
+
+    if DATABASE_URL and DATABASE_URL.startswith('postgres://'):
+        DATABASE_URL = DATABASE_URL.replace('postgres://', 'postgresql://', 1)
+
+    return DATABASE_URL
+
+
+def get_pool():
+    # The pool is created on first use so that nothing connects at import time
+    # and every worker process gets its own sockets.
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                pool = ConnectionPool(
+                    get_database_url(),
+                    kwargs={'row_factory': dict_row, 'autocommit': False},
+                    min_size=int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+                    max_size=int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+                    timeout=float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+                    max_lifetime=float(os.environ.get('DB_POOL_MAX_LIFETIME', 1800)),
+                    max_idle=float(os.environ.get('DB_POOL_MAX_IDLE', 300)),
+                    check=ConnectionPool.check_connection if os.environ.get('DB_POOL_CHECK', '1') == '1' else None,
+                    name='el-riyad',
+                    open=False
+                )
+                pool.open()
+                _pool = pool
+    return _pool
+
+
+def get_db():
+    # One connection per request, checked out lazily on the first call and
+    # handed back to the pool by release_db() when the app context tears down.
+    if 'db_conn' not in g:
+        try:
+            g.db_conn = get_pool().getconn()
+            g.db_read_only = has_request_context() and request.method in READ_ONLY_METHODS
+        except Exception as e:
+            logger.error(f"Database connection error: {str(e)}")
+            logger.error(f"Traceback: {traceback.format_exc()}")
+            return None
+    return g.db_conn
+
+
+def release_db(exception=None):
+    conn = g.pop('db_conn', None)
+    read_only = g.pop('db_read_only', False)
+    if conn is None:
+        return
+
+    try:
+        # Read-only handlers never commit, and failed handlers leave an aborted
+        # transaction behind; close either before the connection is reused.
+        # psycopg drops its prepared statements on ROLLBACK, so a read-only
+        # transaction is ended with COMMIT instead.
+        status = conn.info.transaction_status
+        if status == TransactionStatus.INTRANS and read_only:
+            conn.commit()
+        elif status != TransactionStatus.IDLE:
+            conn.rollback()
+    except Exception as e:
+        logger.error(f"Error ending transaction on pooled connection: {str(e)}")
+
+    try:
+        _pool.putconn(conn)
+    except Exception as e:
+        logger.error(f"Error returning connection to pool: {str(e)}")
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+def pool_stats():
+    if _pool is None:
+        return {'open': False}
+
+    stats = _pool.get_stats()
+    stats.update({
+        'open': not _pool.closed,
+        'min_size': _pool.min_size,
+        'max_size': _pool.max_size
+    })
+    return stats
+
+
+def init_app(app):
+    app.teardown_appcontext(release_db)
@@ -0,0 +1,203 @@
+from psycopg.rows import dict_row
+from db import get_database_url, get_pool
+import os
+import json
+import queue
+import time
+import logging
+import threading
+import psycopg
+
+logger = logging.getLogger(__name__)
+
+EVENTS_CHANNEL = 'change_events'
+
+# Idle streams get a comment line this often so proxies keep them open.
+EVENTS_HEARTBEAT = float(os.environ.get('EVENTS_HEARTBEAT', 15))
+# The listener also polls this often, which covers notifications lost while
+# it was reconnecting.
+EVENTS_POLL_INTERVAL = float(os.environ.get('EVENTS_POLL_INTERVAL', 5))
+# A subscriber that falls this many events behind is disconnected; the
+# browser reconnects with Last-Event-ID and catches up from the table.
+EVENTS_QUEUE_SIZE = int(os.environ.get('EVENTS_QUEUE_SIZE', 1000))
+# Longer gaps are not replayed: the client is told to reload instead.
+EVENTS_REPLAY_LIMIT = int(os.environ.get('EVENTS_REPLAY_LIMIT', 1000))
+EVENTS_RETENTION_DAYS = int(os.environ.get('EVENTS_RETENTION_DAYS', 7))
+EVENTS_PRUNE_INTERVAL = 3600
+EVENTS_START_TIMEOUT = 5
+EVENTS_RETRY_MS = 3000
+
+EVENT_COLUMNS = 'seq, entity, entity_id, action'
+
+
+class Subscription:
+    def __init__(self):
+        self.queue = queue.Queue(EVENTS_QUEUE_SIZE)
+        self.dropped = False
+
+
+class ChangeFeed:
+    # One LISTEN connection per process, opened with the first subscriber,
+    # fans the change_events rows out to every open /api/events stream.
+
+    def __init__(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._last_seq = None
+        self._ready = threading.Event()
+
+    def subscribe(self):
+        subscription = Subscription()
+        with self._lock:
+            self._subscribers.add(subscription)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='change-feed', daemon=True)
+                self._thread.start()
+        # The listener must have its starting point before the subscriber
+        # reads its backlog, or an event numbered in between is lost.
+        self._ready.wait(EVENTS_START_TIMEOUT)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'subscribers': len(self._subscribers),
+                'listening': self._thread is not None,
+                'last_event_id': self._last_seq
+            }
+
+    def _publish(self, events):
+        with self._lock:
+            subscribers = list(self._subscribers)
+
+        for subscription in subscribers:
+            for event in events:
+                try:
+                    subscription.queue.put_nowait(event)
+                except queue.Full:
+                    subscription.dropped = True
+                    self.unsubscribe(subscription)
+                    break
+
+    def _run(self):
+        delay = 1
+        while True:
+            try:
+                self._listen()
+            except Exception as e:
+                logger.error(f"Change feed listener failed, reconnecting in {delay}s: {str(e)}")
+                time.sleep(delay)
+                delay = min(delay * 2, 60)
+            else:
+                delay = 1
+
+    def _listen(self):
+        with psycopg.connect(get_database_url(), autocommit=True, row_factory=dict_row) as conn:
+            conn.execute(f'LISTEN {EVENTS_CHANNEL}')
+            if self._last_seq is None:
+                # Everything numbered later is published; older events are
+                # only reachable through replay.
+                row = conn.execute('SELECT COALESCE(MAX(seq), 0) AS seq FROM change_events').fetchone()
+                self._last_seq = row['seq']
+                self._ready.set()
+
+            pruned_at = 0
+            while True:
+                conn.execute('SELECT sequence_change_events()')
+                self._fetch(conn)
+
+                if time.monotonic() - pruned_at > EVENTS_PRUNE_INTERVAL:
+                    conn.execute('''DELETE FROM change_events
+                                    WHERE seq IS NOT NULL AND created_at < CURRENT_TIMESTAMP - make_interval(days => %s)''',
+                                 (EVENTS_RETENTION_DAYS,))
+                    pruned_at = time.monotonic()
+
+                for _ in conn.notifies(timeout=EVENTS_POLL_INTERVAL, stop_after=1):
+                    pass
+
+    def _fetch(self, conn):
+        while True:
+            rows = conn.execute(f'''SELECT {EVENT_COLUMNS} FROM change_events
+                                    WHERE seq > %s ORDER BY seq LIMIT %s''',
+                                (self._last_seq, EVENTS_QUEUE_SIZE)).fetchall()
+            if not rows:
+                return
+            self._last_seq = rows[-1]['seq']
+            self._publish([format_event(row) for row in rows])
+
+
+change_feed = ChangeFeed()
+
+
+def format_event(row):
+    data = json.dumps({'entity': row['entity'], 'id': row['entity_id'], 'action': row['action']},
+                      separators=(',', ':'))
+    return row['seq'], f'id: {row["seq"]}\nevent: change\ndata: {data}\n\n'
+
+
+def format_position(event, seq):
+    return f'id: {seq}\nevent: {event}\ndata: {{}}\n\n'
+
+
+def read_backlog(last_event_id):
+    # The events after last_event_id, or None when they can no longer be
+    # replayed (pruned, or too many). Also returns the newest event id.
+    with get_pool().connection() as conn:
+        c = conn.cursor()
+        c.execute('SELECT COALESCE(MIN(seq), 0) AS oldest, COALESCE(MAX(seq), 0) AS newest FROM change_events')
+        bounds = c.fetchone()
+        if last_event_id is None:
+            return bounds['newest'], []
+        if last_event_id > bounds['newest']:
+            # Ids from another database (e.g. after a restore): start over.
+            return bounds['newest'], None
+        if bounds['oldest'] > last_event_id + 1:
+            return bounds['newest'], None
+
+        c.execute(f'''SELECT {EVENT_COLUMNS} FROM change_events
+                      WHERE seq > %s ORDER BY seq LIMIT %s''', (last_event_id, EVENTS_REPLAY_LIMIT + 1))
+        rows = c.fetchall()
+        if len(rows) > EVENTS_REPLAY_LIMIT:
+            return bounds['newest'], None
+        return bounds['newest'], [format_event(row) for row in rows]
+
+
+def event_stream(subscription, last_event_id):
+    # Subscribed before the backlog is read, so nothing falls in between;
+    # events delivered both ways are skipped by id.
+    try:
+        newest, backlog = read_backlog(last_event_id)
+        yield f'retry: {EVENTS_RETRY_MS}\n\n'
+
+        if backlog is None:
+            # Too far behind: the client reloads everything and continues
+            # from the newest event.
+            yield format_position('reset', newest)
+            sent = newest
+        elif last_event_id is None:
+            yield format_position('ready', newest)
+            sent = newest
+        else:
+            sent = last_event_id
+            for seq, message in backlog:
+                yield message
+                sent = seq
+
+        while True:
+            try:
+                seq, message = subscription.queue.get(timeout=EVENTS_HEARTBEAT)
+            except queue.Empty:
+                if subscription.dropped:
+                    return
+                yield ': keepalive\n\n'
+                continue
+            if seq > sent:
+                yield message
+                sent = seq
+    finally:
+        change_feed.unsubscribe(subscription)
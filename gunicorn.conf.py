@@ -0,0 +1,75 @@
+# Production server settings (Procfile: gunicorn --config gunicorn.conf.py app:app).
+# Every value can be overridden from the environment.
+#
+# Each worker process has its own connection pool, so the database sees up
+# to WEB_CONCURRENCY * DB_POOL_MAX_SIZE connections. Threads serve the
+# /api/events streams too (one per open dashboard), which hold no database
+# connection. Background job threads share the pool but only hold a
+# connection to claim a job and to record its outcome.
+#
+# Reloading: with preload on, SIGHUP restarts the workers but keeps the code
+# loaded in the master; deploy new code by restarting the process (what the
+# platform does), or run with GUNICORN_PRELOAD=0 to make SIGHUP reload it.
+from dotenv import load_dotenv
+import logging
+import multiprocessing
+import os
+
+# Before the app modules, which read their settings at import.
+load_dotenv()
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper())
+
+from db import close_pool  # noqa: E402
+from jobs import job_worker  # noqa: E402
+from schema import schema_ready  # noqa: E402
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+
+# One process per core; threads cover the time requests spend waiting on
+# Postgres and on uploads.
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+# Importing the app once in the master shares its memory with the workers
+# and makes boot failures fail the deploy instead of every worker.
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+# Recycle workers after a jittered number of requests, so slow leaks are
+# bounded and workers do not all restart at once.
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 200))
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+# Longer than the platform router's idle timeout would tie up threads;
+# shorter makes the router reconnect for every burst of requests.
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+# The worker heartbeat file is written constantly; keep it off disk.
+worker_tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+forwarded_allow_ips = os.environ.get('FORWARDED_ALLOW_IPS', '*')
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+
+def when_ready(server):
+    # Runs in the master before the first fork: warn once about a database
+    # that is unreachable or behind, then drop the connections, which must
+    # not be shared with the workers (they open their own pools on use).
+    schema_ready()
+    close_pool()
+
+
+def post_worker_init(worker):
+    # Each worker processes background jobs with JOBS_CONCURRENCY threads of
+    # its own (0 leaves them to `flask jobs work`). Started after the fork:
+    # threads do not survive one.
+    job_worker.start()
+
+
+def worker_exit(server, worker):
+    job_worker.stop()
+    close_pool()
@@ -0,0 +1,69 @@
+from flask import current_app, request
+from werkzeug.http import is_resource_modified
+from datetime import datetime, timedelta, timezone
+import hashlib
+
+# Compressed representations carry the coding as an ETag suffix so each
+# coding has its own strong validator (see compression.py).
+CONTENT_CODINGS = ('br', 'gzip')
+
+# HTTP dates have one-second resolution, so a change later within the same
+# second as Last-Modified would be invisible to If-Modified-Since. A
+# timestamp is only used as a validator once it is this much older than the
+# response.
+LAST_MODIFIED_MIN_AGE = timedelta(seconds=1)
+
+
+def make_etag(*parts):
+    # Parts must fully determine the representation (resource, filters and
+    # the cache_versions counters it was read under), so the ETag is strong.
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+def coded_etag(etag, coding):
+    return f'{etag}-{coding}'
+
+
+def settled(last_modified):
+    return last_modified <= datetime.now(timezone.utc) - LAST_MODIFIED_MIN_AGE
+
+
+def add_validators(response, etag, last_modified):
+    # last_modified is None when the cache_versions row is missing; without a
+    # counter the ETag would not change on writes, so none is sent.
+    if last_modified is None:
+        return response
+
+    response.set_etag(etag)
+    if settled(last_modified):
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def not_modified(etag, last_modified):
+    # Decided from the validators alone, before any row is fetched or
+    # serialized. If-None-Match takes precedence over If-Modified-Since.
+    if last_modified is None:
+        return None
+
+    if request.if_none_match:
+        candidates = [etag] + [coded_etag(etag, coding) for coding in CONTENT_CODINGS]
+        matched = next((candidate for candidate in candidates if request.if_none_match.contains_weak(candidate)), None)
+        if matched is None:
+            return None
+    elif not settled(last_modified) or is_resource_modified(request.environ, last_modified=last_modified):
+        return None
+    else:
+        matched = etag
+
+    return add_validators(current_app.response_class(status=304), matched, last_modified)
+
+
+def versioned(versions, *names):
+    # Combines several (version, updated_at) pairs into the version tuple used
+    # for the ETag and the newest timestamp used for Last-Modified.
+    pairs = [versions.get(name, (None, None)) for name in names]
+    if any(stamp is None for _, stamp in pairs):
+        return None, None
+    return tuple(version for version, _ in pairs), max(stamp for _, stamp in pairs)
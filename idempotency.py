@@ -0,0 +1,145 @@
+from functools import wraps
+from flask import g, jsonify, request
+from psycopg.errors import LockNotAvailable
+from psycopg.types.json import Jsonb
+from werkzeug.exceptions import RequestEntityTooLarge
+from db import PREPARE, get_db
+from jobs import maintenance_task
+import os
+import json
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+# A key can be replayed this long after its request; later it may be reused
+# and is eventually pruned.
+IDEMPOTENCY_KEY_TTL_HOURS = int(os.environ.get('IDEMPOTENCY_KEY_TTL_HOURS', 24))
+# How long a duplicate waits for the request holding its key to finish
+# before it is told to retry.
+IDEMPOTENCY_LOCK_TIMEOUT = os.environ.get('IDEMPOTENCY_LOCK_TIMEOUT', '5s')
+IDEMPOTENCY_PRUNE_BATCH_SIZE = 1000
+
+# Inserts the key, or takes over one that has expired. A key still held by an
+# uncommitted request makes this wait on its primary key until that request
+# commits (no row: replay it) or rolls back (the key is ours).
+CLAIM_KEY = '''INSERT INTO idempotency_keys (route, key, fingerprint)
+               VALUES (%(route)s, %(key)s, %(fingerprint)s)
+               ON CONFLICT (route, key) DO UPDATE
+                   SET fingerprint = EXCLUDED.fingerprint, response_code = NULL, response_body = NULL,
+                       created_at = CURRENT_TIMESTAMP
+                   WHERE idempotency_keys.created_at < CURRENT_TIMESTAMP - make_interval(hours => %(ttl)s)
+               RETURNING key'''
+
+
+def request_fingerprint(route):
+    # Multipart bodies differ in their boundary on every retry, so the form is
+    # hashed field by field, with uploads by the SHA-256 computed while they
+    # were spooled. JSON is hashed in canonical form.
+    digest = hashlib.sha256(route.encode('utf-8'))
+    if request.mimetype in ('multipart/form-data', 'application/x-www-form-urlencoded'):
+        for name, value in sorted(request.form.items(multi=True)):
+            digest.update(json.dumps(['field', name, value]).encode('utf-8'))
+        for name, storage in sorted(request.files.items(multi=True), key=lambda item: item[0]):
+            digest.update(json.dumps(['file', name, storage.filename, storage.stream.sha256.hexdigest()]).encode('utf-8'))
+    else:
+        data = request.get_json(silent=True)
+        digest.update(json.dumps(data, sort_keys=True).encode('utf-8') if data is not None else request.get_data())
+    return digest.hexdigest()
+
+
+def claim_key(conn, route, key, fingerprint):
+    # Returns None when the request should go ahead, or the response to send
+    # instead of running it.
+    c = conn.cursor()
+    try:
+        c.execute("SELECT set_config('lock_timeout', %s, true)", (IDEMPOTENCY_LOCK_TIMEOUT,), prepare=PREPARE)
+        c.execute(CLAIM_KEY, {'route': route, 'key': key, 'fingerprint': fingerprint,
+                              'ttl': IDEMPOTENCY_KEY_TTL_HOURS}, prepare=PREPARE)
+        claimed = c.fetchone() is not None
+        c.execute('SET LOCAL lock_timeout = DEFAULT')
+    except LockNotAvailable:
+        conn.rollback()
+        response = jsonify({'error': 'A request with this Idempotency-Key is still in progress'})
+        response.status_code = 409
+        response.headers['Retry-After'] = '1'
+        return response
+    if claimed:
+        return None
+
+    c.execute('''SELECT fingerprint, response_code, response_body FROM idempotency_keys
+                 WHERE route = %s AND key = %s''', (route, key), prepare=PREPARE)
+    stored = c.fetchone()
+    conn.commit()
+    if stored['fingerprint'] != fingerprint:
+        return jsonify({'error': 'Idempotency-Key was already used for a different request'}), 422
+    response = jsonify(stored['response_body'])
+    response.status_code = stored['response_code']
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(route):
+    # Requests carrying an Idempotency-Key run at most once per key: the key is
+    # claimed in the view's transaction and remember_response() stores the
+    # response in it, so a booking and its key commit together. Failed
+    # requests roll their key back and may be retried with it.
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            g.idempotency_key = None
+            key = request.headers.get(IDEMPOTENCY_HEADER)
+            if key is None:
+                return view(*args, **kwargs)
+            if not 0 < len(key) <= IDEMPOTENCY_KEY_MAX_LENGTH:
+                return jsonify({'error': f'{IDEMPOTENCY_HEADER} must be 1 to {IDEMPOTENCY_KEY_MAX_LENGTH} characters'}), 400
+
+            try:
+                fingerprint = request_fingerprint(route)
+            except RequestEntityTooLarge as e:
+                return jsonify({'error': e.description}), 413
+
+            conn = get_db()
+            if not conn:
+                return jsonify({'error': 'Database connection failed'}), 500
+            try:
+                replay = claim_key(conn, route, key, fingerprint)
+            except Exception as e:
+                logger.error(f"Error claiming idempotency key: {str(e)}")
+                return jsonify({'error': str(e)}), 500
+            if replay is not None:
+                return replay
+
+            g.idempotency_key = (route, key)
+            return view(*args, **kwargs)
+        return wrapped
+    return decorator
+
+
+def remember_response(conn, body, status):
+    # Called by the view just before it commits; a no-op without a key.
+    if not g.get('idempotency_key'):
+        return
+    route, key = g.idempotency_key
+    c = conn.cursor()
+    c.execute('''UPDATE idempotency_keys SET response_code = %s, response_body = %s
+                 WHERE route = %s AND key = %s''', (status, Jsonb(body), route, key), prepare=PREPARE)
+
+
+@maintenance_task
+def prune_expired_keys(conn):
+    # In batches, skipping keys whose requests are still running.
+    pruned = 0
+    while True:
+        c = conn.cursor()
+        c.execute('''DELETE FROM idempotency_keys WHERE (route, key) IN (
+                         SELECT route, key FROM idempotency_keys
+                         WHERE created_at < CURRENT_TIMESTAMP - make_interval(hours => %s)
+                         LIMIT %s FOR UPDATE SKIP LOCKED)''',
+                  (IDEMPOTENCY_KEY_TTL_HOURS, IDEMPOTENCY_PRUNE_BATCH_SIZE))
+        conn.commit()
+        pruned += c.rowcount
+        if c.rowcount < IDEMPOTENCY_PRUNE_BATCH_SIZE:
+            return pruned
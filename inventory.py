@@ -0,0 +1,103 @@
+from catalog_cache import bump_version
+
+ROOM_TYPES = ('5', '4', '3', '2')
+
+
+def create_rooms(conn, trip_id, capacities):
+    create_rooms_many(conn, [(trip_id, capacities)])
+
+
+def create_rooms_many(conn, trips):
+    # `trips` is a list of (trip_id, capacities); one pipelined batch for all.
+    c = conn.cursor()
+    c.executemany('''INSERT INTO trip_rooms (trip_id, room_type, capacity) VALUES (%s, %s, %s)
+                     ON CONFLICT (trip_id, room_type) DO UPDATE SET capacity = EXCLUDED.capacity''',
+                  [(trip_id, room_type, capacities.get(room_type))
+                   for trip_id, capacities in trips for room_type in ROOM_TYPES])
+
+
+def lock_rooms(conn, rooms):
+    # Row-locks the given (trip_id, room_type) pairs in key order. Writers
+    # lock trip_rooms before trips and bookings (whose triggers lock
+    # booking_stats), as reserve_room() does; paths that touch several rooms,
+    # or write trips or bookings before their rooms, lock them here first.
+    rooms = sorted(set(rooms))
+    if not rooms:
+        return
+    c = conn.cursor()
+    c.execute('''SELECT 1 FROM trip_rooms
+                 WHERE (trip_id, room_type) IN (SELECT * FROM unnest(%s::integer[], %s::text[]))
+                 ORDER BY trip_id, room_type FOR UPDATE''',
+              ([trip_id for trip_id, _ in rooms], [room_type for _, room_type in rooms]))
+
+
+def reserve_room(conn, trip_id, room_type):
+    # Atomic check-and-increment: the row lock taken by the upsert serializes
+    # concurrent reservations of the same room type, and the WHERE clause
+    # refuses the increment once capacity is reached. Returns False when full.
+    c = conn.cursor()
+    c.execute('''INSERT INTO trip_rooms (trip_id, room_type, booked) VALUES (%s, %s, 1)
+                 ON CONFLICT (trip_id, room_type) DO UPDATE SET booked = trip_rooms.booked + 1
+                 WHERE trip_rooms.capacity IS NULL OR trip_rooms.booked < trip_rooms.capacity
+                 RETURNING booked, capacity''', (trip_id, room_type))
+    room = c.fetchone()
+    if not room:
+        return False
+
+    sync_room_status(conn, trip_id, room_type, room['booked'], room['capacity'])
+    return True
+
+
+def release_room(conn, trip_id, room_type, count=1):
+    c = conn.cursor()
+    c.execute('''UPDATE trip_rooms SET booked = GREATEST(booked - %s, 0)
+                 WHERE trip_id = %s AND room_type = %s AND booked > 0
+                 RETURNING booked, capacity''', (count, trip_id, room_type))
+    room = c.fetchone()
+    if room:
+        sync_room_status(conn, trip_id, room_type, room['booked'], room['capacity'])
+
+
+def set_capacity(conn, trip_id, room_type, capacity):
+    # Returns False when more rooms are already booked than the new capacity.
+    c = conn.cursor()
+    c.execute('''INSERT INTO trip_rooms (trip_id, room_type, capacity) VALUES (%s, %s, %s)
+                 ON CONFLICT (trip_id, room_type) DO UPDATE SET capacity = EXCLUDED.capacity
+                 WHERE EXCLUDED.capacity IS NULL OR trip_rooms.booked <= EXCLUDED.capacity
+                 RETURNING booked, capacity''', (trip_id, room_type, capacity))
+    room = c.fetchone()
+    if not room:
+        return False
+
+    sync_room_status(conn, trip_id, room_type, room['booked'], room['capacity'])
+    return True
+
+
+def sync_room_status(conn, trip_id, room_type, booked, capacity):
+    # Flips roomN_status when a limited room type sells out or frees up again.
+    # Rooms without a capacity keep whatever status staff set by hand.
+    if capacity is None:
+        return
+
+    status_field = f'room{room_type}_status'
+    c = conn.cursor()
+    if booked >= capacity:
+        c.execute(f"UPDATE trips SET {status_field} = 'full' WHERE id = %s AND {status_field} <> 'full'", (trip_id,))
+    else:
+        c.execute(f"UPDATE trips SET {status_field} = 'available' WHERE id = %s AND {status_field} = 'full'", (trip_id,))
+
+    if c.rowcount:
+        bump_version(conn, 'trips')
+
+
+def get_rooms(conn, trip_id):
+    c = conn.cursor()
+    c.execute('SELECT room_type, capacity, booked FROM trip_rooms WHERE trip_id = %s', (trip_id,))
+    return {
+        row['room_type']: {
+            'capacity': row['capacity'],
+            'booked': row['booked'],
+            'available': None if row['capacity'] is None else row['capacity'] - row['booked']
+        }
+        for row in c.fetchall()
+    }
@@ -0,0 +1,325 @@
+from flask.cli import AppGroup
+from psycopg.rows import dict_row
+from psycopg.types.json import Jsonb
+from db import PREPARE, get_database_url, get_pool
+import os
+import time
+import random
+import logging
+import threading
+import click
+import psycopg
+
+logger = logging.getLogger(__name__)
+
+JOBS_CHANNEL = 'jobs'
+
+# Worker threads per process. Under gunicorn every web worker runs its own
+# pool (post_worker_init); set 0 there and run `flask jobs work` instead to
+# keep job processing out of the web processes.
+JOBS_CONCURRENCY = int(os.environ.get('JOBS_CONCURRENCY', 2))
+# Idle workers also poll this often, which covers lost notifications, jobs
+# whose retry time has come and expired leases.
+JOBS_POLL_INTERVAL = float(os.environ.get('JOBS_POLL_INTERVAL', 5))
+# A running job not finished within its lease is assumed lost with its
+# worker and runs again; handlers must finish well within it.
+JOBS_LEASE_SECONDS = int(os.environ.get('JOBS_LEASE_SECONDS', 300))
+JOBS_MAX_ATTEMPTS = int(os.environ.get('JOBS_MAX_ATTEMPTS', 5))
+# Retries wait base * 2^(attempt - 1) seconds, capped, with jitter.
+JOBS_BACKOFF_BASE = float(os.environ.get('JOBS_BACKOFF_BASE', 10))
+JOBS_BACKOFF_MAX = float(os.environ.get('JOBS_BACKOFF_MAX', 3600))
+# Finished jobs are kept this long; dead ones until retried or removed.
+JOBS_RETENTION_DAYS = int(os.environ.get('JOBS_RETENTION_DAYS', 7))
+JOBS_PRUNE_INTERVAL = 3600
+JOBS_STOP_TIMEOUT = float(os.environ.get('JOBS_STOP_TIMEOUT', 20))
+
+_handlers = {}
+_maintenance = []
+
+
+class PermanentJobError(Exception):
+    # Raised by a handler when retrying cannot help (bad payload, invalid
+    # address): the job goes straight to the dead-letter queue.
+    pass
+
+
+def job_handler(kind):
+    # Delivery is at-least-once: a handler can run again after a worker dies
+    # or fails to record the outcome, so handlers must tolerate repeats.
+    def register(func):
+        _handlers[kind] = func
+        return func
+    return register
+
+
+def maintenance_task(func):
+    # Housekeeping for other modules' tables, run by the listener every
+    # JOBS_PRUNE_INTERVAL on its autocommit connection.
+    _maintenance.append(func)
+    return func
+
+
+def enqueue(conn, kind, payload, delay=0, max_attempts=None):
+    # Runs inside the caller's transaction; the job and the wake-up
+    # notification only take effect when it commits.
+    c = conn.cursor()
+    c.execute('''INSERT INTO jobs (kind, payload, run_at, max_attempts)
+                 VALUES (%s, %s, CURRENT_TIMESTAMP + make_interval(secs => %s), %s)
+                 RETURNING id''', (kind, Jsonb(payload), delay, max_attempts or JOBS_MAX_ATTEMPTS), prepare=PREPARE)
+    job_id = c.fetchone()['id']
+    c.execute(f"SELECT pg_notify('{JOBS_CHANNEL}', '')", prepare=PREPARE)
+    return job_id
+
+
+def retry_delay(attempts):
+    delay = min(JOBS_BACKOFF_BASE * 2 ** (attempts - 1), JOBS_BACKOFF_MAX)
+    return delay * random.uniform(0.5, 1)
+
+
+def claim_job(conn, kinds):
+    # Oldest due job of the kinds this process has handlers for; jobs claimed
+    # by other workers are skipped, not waited for. The claim commits at
+    # once, so no lock or transaction is held while the job runs.
+    c = conn.cursor()
+    c.execute('''UPDATE jobs SET status = 'running', attempts = attempts + 1,
+                        locked_until = CURRENT_TIMESTAMP + make_interval(secs => %s)
+                 WHERE id = (SELECT id FROM jobs
+                             WHERE status = 'queued' AND run_at <= CURRENT_TIMESTAMP AND kind = ANY(%s)
+                             ORDER BY run_at, id LIMIT 1 FOR UPDATE SKIP LOCKED)
+                 RETURNING id, kind, payload, attempts, max_attempts''', (JOBS_LEASE_SECONDS, list(kinds)),
+              prepare=PREPARE)
+    job = c.fetchone()
+    conn.commit()
+    return job
+
+
+def finish_job(conn, job):
+    c = conn.cursor()
+    c.execute('''UPDATE jobs SET status = 'done', locked_until = NULL, last_error = NULL,
+                        finished_at = CURRENT_TIMESTAMP
+                 WHERE id = %s AND status = 'running' ''', (job['id'],), prepare=PREPARE)
+    conn.commit()
+
+
+def fail_job(conn, job, error, permanent=False):
+    c = conn.cursor()
+    if permanent or job['attempts'] >= job['max_attempts']:
+        logger.error(f"Job {job['id']} ({job['kind']}) moved to the dead-letter queue after "
+                     f"{job['attempts']} attempts: {error}")
+        c.execute('''UPDATE jobs SET status = 'dead', locked_until = NULL, last_error = %s,
+                            finished_at = CURRENT_TIMESTAMP
+                     WHERE id = %s AND status = 'running' ''', (error, job['id']))
+    else:
+        delay = retry_delay(job['attempts'])
+        logger.warning(f"Job {job['id']} ({job['kind']}) failed, retrying in {delay:.1f}s: {error}")
+        c.execute('''UPDATE jobs SET status = 'queued', locked_until = NULL, last_error = %s,
+                            run_at = CURRENT_TIMESTAMP + make_interval(secs => %s)
+                     WHERE id = %s AND status = 'running' ''', (error, delay, job['id']))
+    conn.commit()
+
+
+def requeue_expired(conn):
+    # Leases left behind by workers that died mid-job. The attempt already
+    # counted, so a job that keeps killing its worker ends up dead.
+    c = conn.cursor()
+    c.execute('''UPDATE jobs SET status = CASE WHEN attempts >= max_attempts THEN 'dead' ELSE 'queued' END,
+                        finished_at = CASE WHEN attempts >= max_attempts THEN CURRENT_TIMESTAMP END,
+                        locked_until = NULL, last_error = 'Lease expired', run_at = CURRENT_TIMESTAMP
+                 WHERE status = 'running' AND locked_until < CURRENT_TIMESTAMP''')
+    conn.commit()
+    return c.rowcount
+
+
+def prune_finished(conn):
+    c = conn.cursor()
+    c.execute('''DELETE FROM jobs WHERE status = 'done'
+                 AND finished_at < CURRENT_TIMESTAMP - make_interval(days => %s)''', (JOBS_RETENTION_DAYS,))
+    conn.commit()
+    return c.rowcount
+
+
+def process_one():
+    # Claims and runs one job and returns whether it succeeded, or None when
+    # nothing was due. A pooled connection is only held for the claim and for
+    # recording the outcome.
+    with get_pool().connection() as conn:
+        job = claim_job(conn, sorted(_handlers))
+    if job is None:
+        return None
+
+    try:
+        _handlers[job['kind']](job['payload'])
+    except PermanentJobError as e:
+        outcome = (str(e), True)
+    except Exception as e:
+        outcome = (f'{type(e).__name__}: {e}', False)
+    else:
+        outcome = None
+
+    with get_pool().connection() as conn:
+        if outcome is None:
+            finish_job(conn, job)
+        else:
+            fail_job(conn, job, *outcome)
+    return outcome is None
+
+
+class JobWorker:
+    # JOBS_CONCURRENCY threads take jobs from the table; one LISTEN
+    # connection wakes them when a job is enqueued and does the upkeep.
+
+    def __init__(self, concurrency=JOBS_CONCURRENCY):
+        self.concurrency = concurrency
+        self._wake = threading.Condition()
+        self._stopping = threading.Event()
+        self._threads = []
+        self._succeeded = 0
+        self._failed = 0
+
+    def start(self):
+        if self._threads or self.concurrency <= 0:
+            return
+        self._threads.append(threading.Thread(target=self._run_listener, name='jobs-listener', daemon=True))
+        for i in range(self.concurrency):
+            self._threads.append(threading.Thread(target=self._run_worker, name=f'jobs-worker-{i}', daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout=JOBS_STOP_TIMEOUT):
+        # Jobs still running at the deadline are abandoned; their leases
+        # expire and another worker runs them again.
+        self._stopping.set()
+        with self._wake:
+            self._wake.notify_all()
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(0, deadline - time.monotonic()))
+        self._threads = []
+
+    def stats(self):
+        return {
+            'concurrency': self.concurrency,
+            'running': bool(self._threads),
+            'succeeded': self._succeeded,
+            'failed': self._failed
+        }
+
+    def _run_worker(self):
+        while not self._stopping.is_set():
+            try:
+                succeeded = process_one()
+            except Exception as e:
+                logger.error(f"Job worker error: {str(e)}")
+                succeeded = None
+
+            if succeeded is True:
+                self._succeeded += 1
+            elif succeeded is False:
+                self._failed += 1
+            else:
+                with self._wake:
+                    self._wake.wait(JOBS_POLL_INTERVAL)
+
+    def _run_listener(self):
+        delay = 1
+        while not self._stopping.is_set():
+            try:
+                self._listen()
+            except Exception as e:
+                logger.error(f"Job listener failed, reconnecting in {delay}s: {str(e)}")
+                self._stopping.wait(delay)
+                delay = min(delay * 2, 60)
+            else:
+                delay = 1
+
+    def _listen(self):
+        with psycopg.connect(get_database_url(), autocommit=True, row_factory=dict_row) as conn:
+            conn.execute(f'LISTEN {JOBS_CHANNEL}')
+            pruned_at = 0
+            while not self._stopping.is_set():
+                if requeue_expired(conn):
+                    self._notify()
+                if time.monotonic() - pruned_at > JOBS_PRUNE_INTERVAL:
+                    prune_finished(conn)
+                    for task in _maintenance:
+                        try:
+                            task(conn)
+                        except Exception as e:
+                            logger.error(f"Maintenance task {task.__name__} failed: {str(e)}")
+                    pruned_at = time.monotonic()
+
+                for _ in conn.notifies(timeout=JOBS_POLL_INTERVAL, stop_after=1):
+                    self._notify()
+
+    def _notify(self):
+        with self._wake:
+            self._wake.notify_all()
+
+
+job_worker = JobWorker()
+
+
+def queue_stats(conn):
+    c = conn.cursor()
+    c.execute('''SELECT status, COUNT(*) AS count,
+                        MIN(run_at) FILTER (WHERE status = 'queued') AS next_run_at
+                 FROM jobs GROUP BY status''')
+    rows = c.fetchall()
+    counts = {status: 0 for status in ('queued', 'running', 'done', 'dead')}
+    counts.update({row['status']: row['count'] for row in rows})
+    next_run_at = min((row['next_run_at'] for row in rows if row['next_run_at']), default=None)
+    return {'jobs': counts, 'next_run_at': next_run_at, 'worker': job_worker.stats()}
+
+
+jobs_cli = AppGroup('jobs', help='Background job queue.')
+
+
+@jobs_cli.command('work')
+@click.option('--concurrency', type=int, default=max(1, JOBS_CONCURRENCY), show_default=True)
+def work_command(concurrency):
+    """Process jobs in the foreground until interrupted."""
+    worker = JobWorker(concurrency)
+    worker.start()
+    click.echo(f'Processing jobs with {concurrency} workers.')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        worker.stop()
+
+
+@jobs_cli.command('dead')
+@click.option('--limit', type=int, default=50, show_default=True)
+def dead_command(limit):
+    """List jobs in the dead-letter queue."""
+    with get_pool().connection() as conn:
+        c = conn.cursor()
+        c.execute('''SELECT id, kind, attempts, finished_at, last_error FROM jobs
+                     WHERE status = 'dead' ORDER BY finished_at DESC, id DESC LIMIT %s''', (limit,))
+        rows = c.fetchall()
+
+    if not rows:
+        click.echo('No dead jobs.')
+    for row in rows:
+        click.echo(f"{row['id']} {row['kind']} attempts={row['attempts']} at {row['finished_at']}: {row['last_error']}")
+
+
+@jobs_cli.command('retry')
+@click.argument('ids', nargs=-1, type=int)
+@click.option('--all', 'retry_all', is_flag=True, help='Retry every dead job.')
+def retry_command(ids, retry_all):
+    """Queue dead jobs again with a fresh set of attempts."""
+    if not ids and not retry_all:
+        raise click.UsageError('Give job ids or --all.')
+
+    with get_pool().connection() as conn:
+        c = conn.cursor()
+        c.execute(f'''UPDATE jobs SET status = 'queued', attempts = 0, run_at = CURRENT_TIMESTAMP,
+                             finished_at = NULL
+                      WHERE status = 'dead' {'' if retry_all else 'AND id = ANY(%s)'}''',
+                  () if retry_all else (list(ids),))
+        retried = c.rowcount
+        c.execute(f"SELECT pg_notify('{JOBS_CHANNEL}', '')")
+        conn.commit()
+
+    click.echo(f'Queued {retried} jobs again.')
@@ -0,0 +1,114 @@
+-- Tables as originally created by init_db().
+
+CREATE TABLE IF NOT EXISTS trips (
+    id SERIAL PRIMARY KEY,
+    date TEXT NOT NULL,
+    airline TEXT NOT NULL,
+    airline_logo TEXT,
+    hotel TEXT NOT NULL,
+    hotel_logo TEXT,
+    hotel_distance TEXT,
+    route TEXT NOT NULL,
+    duration INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'all',
+    room5_price INTEGER NOT NULL,
+    room5_status TEXT NOT NULL DEFAULT 'available',
+    room4_price INTEGER NOT NULL,
+    room4_status TEXT NOT NULL DEFAULT 'available',
+    room3_price INTEGER NOT NULL,
+    room3_status TEXT NOT NULL DEFAULT 'available',
+    room2_price INTEGER NOT NULL,
+    room2_status TEXT NOT NULL DEFAULT 'available',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    is_deleted BOOLEAN DEFAULT FALSE,
+    deleted_at TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS bookings (
+    id SERIAL PRIMARY KEY,
+    trip_id INTEGER NOT NULL,
+    first_name TEXT NOT NULL,
+    last_name TEXT NOT NULL,
+    email TEXT NOT NULL,
+    phone TEXT NOT NULL,
+    whatsapp_number TEXT,
+    birth_date TEXT NOT NULL,
+    birth_place TEXT NOT NULL,
+    passport_number TEXT NOT NULL,
+    passport_issue_date TEXT NOT NULL,
+    passport_expiry_date TEXT NOT NULL,
+    passport_scan TEXT,
+    passport_file TEXT,
+    marital_status TEXT NOT NULL,
+    father_name TEXT NOT NULL,
+    grandfather_name TEXT NOT NULL,
+    job_title TEXT NOT NULL,
+    education_level TEXT NOT NULL,
+    facebook_profile TEXT,
+    umrah_type TEXT NOT NULL,
+    room_type TEXT NOT NULL,
+    notes TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    booking_date TEXT NOT NULL,
+    branch_state TEXT,
+    is_deleted BOOLEAN DEFAULT FALSE,
+    deleted_at TIMESTAMP,
+    FOREIGN KEY (trip_id) REFERENCES trips (id) ON DELETE SET NULL
+);
+
+CREATE TABLE IF NOT EXISTS deleted_trips (
+    id SERIAL PRIMARY KEY,
+    original_id INTEGER,
+    date TEXT NOT NULL,
+    airline TEXT NOT NULL,
+    airline_logo TEXT,
+    hotel TEXT NOT NULL,
+    hotel_logo TEXT,
+    hotel_distance TEXT,
+    route TEXT NOT NULL,
+    duration INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    state TEXT NOT NULL,
+    room5_price INTEGER NOT NULL,
+    room5_status TEXT NOT NULL,
+    room4_price INTEGER NOT NULL,
+    room4_status TEXT NOT NULL,
+    room3_price INTEGER NOT NULL,
+    room3_status TEXT NOT NULL,
+    room2_price INTEGER NOT NULL,
+    room2_status TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    deleted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS deleted_bookings (
+    id SERIAL PRIMARY KEY,
+    original_id INTEGER,
+    trip_id INTEGER,
+    first_name TEXT NOT NULL,
+    last_name TEXT NOT NULL,
+    email TEXT NOT NULL,
+    phone TEXT NOT NULL,
+    whatsapp_number TEXT,
+    birth_date TEXT NOT NULL,
+    birth_place TEXT NOT NULL,
+    passport_number TEXT NOT NULL,
+    passport_issue_date TEXT NOT NULL,
+    passport_expiry_date TEXT NOT NULL,
+    passport_scan TEXT,
+    passport_file TEXT,
+    marital_status TEXT NOT NULL,
+    father_name TEXT NOT NULL,
+    grandfather_name TEXT NOT NULL,
+    job_title TEXT NOT NULL,
+    education_level TEXT NOT NULL,
+    facebook_profile TEXT,
+    umrah_type TEXT NOT NULL,
+    room_type TEXT NOT NULL,
+    notes TEXT,
+    status TEXT NOT NULL,
+    booking_date TEXT NOT NULL,
+    branch_state TEXT,
+    deleted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,33 @@
+-- Indexes for the filters used by get_all_trips, get_bookings, get_stats and
+-- the trash/restore handlers. Every live-row query filters on
+-- is_deleted = FALSE, so the hot indexes are partial on that predicate.
+
+CREATE INDEX IF NOT EXISTS idx_trips_active_type
+    ON trips (type) WHERE is_deleted = FALSE;
+
+CREATE INDEX IF NOT EXISTS idx_trips_active_state_type
+    ON trips (state, type) WHERE is_deleted = FALSE;
+
+CREATE INDEX IF NOT EXISTS idx_bookings_trip_id
+    ON bookings (trip_id);
+
+CREATE INDEX IF NOT EXISTS idx_bookings_active_branch
+    ON bookings (branch_state) WHERE is_deleted = FALSE;
+
+CREATE INDEX IF NOT EXISTS idx_bookings_active_status
+    ON bookings (status) WHERE is_deleted = FALSE;
+
+CREATE INDEX IF NOT EXISTS idx_bookings_active_umrah_type
+    ON bookings (umrah_type) WHERE is_deleted = FALSE;
+
+CREATE INDEX IF NOT EXISTS idx_deleted_trips_original_id
+    ON deleted_trips (original_id);
+
+CREATE INDEX IF NOT EXISTS idx_deleted_trips_deleted_at
+    ON deleted_trips (deleted_at DESC);
+
+CREATE INDEX IF NOT EXISTS idx_deleted_bookings_original_id
+    ON deleted_bookings (original_id);
+
+CREATE INDEX IF NOT EXISTS idx_deleted_bookings_deleted_at
+    ON deleted_bookings (deleted_at DESC);
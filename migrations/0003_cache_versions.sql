@@ -0,0 +1,11 @@
+-- Version counters for cached read models. Writers bump the counter in the
+-- same transaction as their change; every worker compares it before serving
+-- a cached body.
+
+CREATE TABLE IF NOT EXISTS cache_versions (
+    name TEXT PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0
+);
+
+INSERT INTO cache_versions (name, version) VALUES ('trips', 0)
+    ON CONFLICT (name) DO NOTHING;
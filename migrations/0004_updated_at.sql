@@ -0,0 +1,26 @@
+-- Row-level modification times for trips and bookings, plus a last-changed
+-- timestamp on each cache_versions counter so conditional GETs can be
+-- answered from that single row.
+
+ALTER TABLE trips ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+ALTER TABLE bookings ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+
+CREATE OR REPLACE FUNCTION set_updated_at() RETURNS trigger AS $$
+BEGIN
+    NEW.updated_at = CURRENT_TIMESTAMP;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trips_set_updated_at ON trips;
+CREATE TRIGGER trips_set_updated_at BEFORE UPDATE ON trips
+    FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+DROP TRIGGER IF EXISTS bookings_set_updated_at ON bookings;
+CREATE TRIGGER bookings_set_updated_at BEFORE UPDATE ON bookings
+    FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+ALTER TABLE cache_versions ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP;
+
+INSERT INTO cache_versions (name, version) VALUES ('bookings', 0)
+    ON CONFLICT (name) DO NOTHING;
@@ -0,0 +1,8 @@
+-- Keyset pagination of GET /api/bookings walks (booking_date, id) backwards,
+-- optionally within one branch.
+
+CREATE INDEX IF NOT EXISTS idx_bookings_active_date_id
+    ON bookings (booking_date DESC, id DESC) WHERE is_deleted = FALSE;
+
+CREATE INDEX IF NOT EXISTS idx_bookings_active_branch_date_id
+    ON bookings (branch_state, booking_date DESC, id DESC) WHERE is_deleted = FALSE;
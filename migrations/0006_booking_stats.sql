@@ -0,0 +1,89 @@
+-- Rollup of the counts shown by GET /api/stats, maintained by row triggers on
+-- bookings and trips so that every write path (single, bulk or manual SQL)
+-- keeps it current. `flask --app app stats reconcile` rebuilds it.
+
+CREATE TABLE IF NOT EXISTS booking_stats (
+    dimension TEXT NOT NULL,
+    value TEXT NOT NULL,
+    count BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (dimension, value)
+);
+
+CREATE OR REPLACE FUNCTION bookings_maintain_stats() RETURNS trigger AS $$
+DECLARE
+    old_live BOOLEAN := TG_OP <> 'INSERT' AND OLD.is_deleted IS FALSE;
+    new_live BOOLEAN := TG_OP <> 'DELETE' AND NEW.is_deleted IS FALSE;
+BEGIN
+    -- Net deltas are applied in key order so concurrent transactions lock
+    -- the counter rows in the same sequence.
+    WITH changes (dimension, value, delta) AS (
+        SELECT 'total', '', -1 WHERE old_live
+        UNION ALL SELECT 'status', COALESCE(OLD.status, ''), -1 WHERE old_live
+        UNION ALL SELECT 'branch_state', COALESCE(OLD.branch_state, ''), -1 WHERE old_live
+        UNION ALL SELECT 'umrah_type', COALESCE(OLD.umrah_type, ''), -1 WHERE old_live
+        UNION ALL SELECT 'total', '', 1 WHERE new_live
+        UNION ALL SELECT 'status', COALESCE(NEW.status, ''), 1 WHERE new_live
+        UNION ALL SELECT 'branch_state', COALESCE(NEW.branch_state, ''), 1 WHERE new_live
+        UNION ALL SELECT 'umrah_type', COALESCE(NEW.umrah_type, ''), 1 WHERE new_live
+    )
+    INSERT INTO booking_stats (dimension, value, count)
+    SELECT dimension, value, SUM(delta) FROM changes
+    GROUP BY dimension, value
+    HAVING SUM(delta) <> 0
+    ORDER BY dimension, value
+    ON CONFLICT (dimension, value) DO UPDATE SET count = booking_stats.count + EXCLUDED.count;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS bookings_stats_insert_delete ON bookings;
+CREATE TRIGGER bookings_stats_insert_delete AFTER INSERT OR DELETE ON bookings
+    FOR EACH ROW EXECUTE FUNCTION bookings_maintain_stats();
+
+DROP TRIGGER IF EXISTS bookings_stats_update ON bookings;
+CREATE TRIGGER bookings_stats_update AFTER UPDATE OF status, branch_state, umrah_type, is_deleted ON bookings
+    FOR EACH ROW
+    WHEN (OLD.status IS DISTINCT FROM NEW.status
+          OR OLD.branch_state IS DISTINCT FROM NEW.branch_state
+          OR OLD.umrah_type IS DISTINCT FROM NEW.umrah_type
+          OR OLD.is_deleted IS DISTINCT FROM NEW.is_deleted)
+    EXECUTE FUNCTION bookings_maintain_stats();
+
+CREATE OR REPLACE FUNCTION trips_maintain_stats() RETURNS trigger AS $$
+DECLARE
+    delta INTEGER := (CASE WHEN TG_OP <> 'DELETE' AND NEW.is_deleted IS FALSE THEN 1 ELSE 0 END)
+                   - (CASE WHEN TG_OP <> 'INSERT' AND OLD.is_deleted IS FALSE THEN 1 ELSE 0 END);
+BEGIN
+    IF delta <> 0 THEN
+        INSERT INTO booking_stats (dimension, value, count) VALUES ('trips', '', delta)
+        ON CONFLICT (dimension, value) DO UPDATE SET count = booking_stats.count + EXCLUDED.count;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trips_stats_insert_delete ON trips;
+CREATE TRIGGER trips_stats_insert_delete AFTER INSERT OR DELETE ON trips
+    FOR EACH ROW EXECUTE FUNCTION trips_maintain_stats();
+
+DROP TRIGGER IF EXISTS trips_stats_update ON trips;
+CREATE TRIGGER trips_stats_update AFTER UPDATE OF is_deleted ON trips
+    FOR EACH ROW
+    WHEN (OLD.is_deleted IS DISTINCT FROM NEW.is_deleted)
+    EXECUTE FUNCTION trips_maintain_stats();
+
+-- Seed from the existing rows.
+DELETE FROM booking_stats;
+
+INSERT INTO booking_stats (dimension, value, count)
+SELECT 'total', '', COUNT(*) FROM bookings WHERE is_deleted = FALSE
+UNION ALL
+SELECT 'status', COALESCE(status, ''), COUNT(*) FROM bookings WHERE is_deleted = FALSE GROUP BY 2
+UNION ALL
+SELECT 'branch_state', COALESCE(branch_state, ''), COUNT(*) FROM bookings WHERE is_deleted = FALSE GROUP BY 2
+UNION ALL
+SELECT 'umrah_type', COALESCE(umrah_type, ''), COUNT(*) FROM bookings WHERE is_deleted = FALSE GROUP BY 2
+UNION ALL
+SELECT 'trips', '', COUNT(*) FROM trips WHERE is_deleted = FALSE;
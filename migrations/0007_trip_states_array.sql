@@ -0,0 +1,12 @@
+-- Exact, indexable state membership. trips.state stays the comma-joined text
+-- the API returns; states is derived from it by the database, so existing
+-- rows are migrated and writers cannot let the two drift apart.
+
+ALTER TABLE trips ADD COLUMN IF NOT EXISTS states TEXT[]
+    GENERATED ALWAYS AS (regexp_split_to_array(btrim(state), '\s*,\s*')) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_trips_active_states
+    ON trips USING GIN (states) WHERE is_deleted = FALSE;
+
+-- Only served the old `state = ... OR state LIKE ...` filter.
+DROP INDEX IF EXISTS idx_trips_active_state_type;
@@ -0,0 +1,22 @@
+-- Per-trip, per-room-type inventory. capacity NULL means "not limited" (the
+-- old behaviour, driven only by the manual roomN_status flag); booked counts
+-- live bookings holding that room type.
+
+CREATE TABLE IF NOT EXISTS trip_rooms (
+    trip_id INTEGER NOT NULL REFERENCES trips (id) ON DELETE CASCADE,
+    room_type TEXT NOT NULL,
+    capacity INTEGER,
+    booked INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (trip_id, room_type),
+    CHECK (room_type IN ('5', '4', '3', '2')),
+    CHECK (capacity IS NULL OR (capacity >= 0 AND booked <= capacity)),
+    CHECK (booked >= 0)
+);
+
+INSERT INTO trip_rooms (trip_id, room_type, booked)
+SELECT t.id, r.room_type,
+       (SELECT COUNT(*) FROM bookings b
+         WHERE b.trip_id = t.id AND b.room_type = r.room_type AND b.is_deleted = FALSE)
+FROM trips t
+CROSS JOIN (VALUES ('5'), ('4'), ('3'), ('2')) AS r (room_type)
+ON CONFLICT (trip_id, room_type) DO NOTHING;
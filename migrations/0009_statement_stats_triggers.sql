@@ -0,0 +1,90 @@
+-- booking_stats maintenance moves from row to statement triggers: a bulk
+-- write (bulk endpoints, CSV import) now applies one aggregated delta per
+-- statement instead of one upsert per row. Transition tables cannot be
+-- combined with column lists, so UPDATE triggers fire for every update and
+-- rely on the deltas netting out to nothing when no counted column changed.
+
+CREATE OR REPLACE FUNCTION bookings_maintain_stats() RETURNS trigger AS $$
+DECLARE
+    changed TEXT := CASE TG_OP
+        WHEN 'INSERT' THEN 'SELECT 1 AS sign, * FROM new_rows'
+        WHEN 'DELETE' THEN 'SELECT -1 AS sign, * FROM old_rows'
+        ELSE 'SELECT -1 AS sign, * FROM old_rows UNION ALL SELECT 1, * FROM new_rows'
+    END;
+BEGIN
+    -- Net deltas are applied in key order so concurrent transactions lock
+    -- the counter rows in the same sequence.
+    EXECUTE format($query$
+        WITH live AS (
+            SELECT sign, status, branch_state, umrah_type FROM (%s) AS changed
+            WHERE is_deleted IS FALSE
+        ),
+        changes (dimension, value, delta) AS (
+            SELECT 'total', '', sign FROM live
+            UNION ALL SELECT 'status', COALESCE(status, ''), sign FROM live
+            UNION ALL SELECT 'branch_state', COALESCE(branch_state, ''), sign FROM live
+            UNION ALL SELECT 'umrah_type', COALESCE(umrah_type, ''), sign FROM live
+        )
+        INSERT INTO booking_stats (dimension, value, count)
+        SELECT dimension, value, SUM(delta) FROM changes
+        GROUP BY dimension, value
+        HAVING SUM(delta) <> 0
+        ORDER BY dimension, value
+        ON CONFLICT (dimension, value) DO UPDATE SET count = booking_stats.count + EXCLUDED.count
+    $query$, changed);
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION trips_maintain_stats() RETURNS trigger AS $$
+DECLARE
+    delta BIGINT := 0;
+    removed BIGINT := 0;
+BEGIN
+    IF TG_OP <> 'DELETE' THEN
+        SELECT COUNT(*) INTO delta FROM new_rows WHERE is_deleted IS FALSE;
+    END IF;
+    IF TG_OP <> 'INSERT' THEN
+        SELECT COUNT(*) INTO removed FROM old_rows WHERE is_deleted IS FALSE;
+    END IF;
+    delta := delta - removed;
+
+    IF delta <> 0 THEN
+        INSERT INTO booking_stats (dimension, value, count) VALUES ('trips', '', delta)
+        ON CONFLICT (dimension, value) DO UPDATE SET count = booking_stats.count + EXCLUDED.count;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS bookings_stats_insert_delete ON bookings;
+DROP TRIGGER IF EXISTS bookings_stats_update ON bookings;
+
+CREATE TRIGGER bookings_stats_insert AFTER INSERT ON bookings
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bookings_maintain_stats();
+
+CREATE TRIGGER bookings_stats_update AFTER UPDATE ON bookings
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bookings_maintain_stats();
+
+CREATE TRIGGER bookings_stats_delete AFTER DELETE ON bookings
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bookings_maintain_stats();
+
+DROP TRIGGER IF EXISTS trips_stats_insert_delete ON trips;
+DROP TRIGGER IF EXISTS trips_stats_update ON trips;
+
+CREATE TRIGGER trips_stats_insert AFTER INSERT ON trips
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION trips_maintain_stats();
+
+CREATE TRIGGER trips_stats_update AFTER UPDATE ON trips
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION trips_maintain_stats();
+
+CREATE TRIGGER trips_stats_delete AFTER DELETE ON trips
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION trips_maintain_stats();
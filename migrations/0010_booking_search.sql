@@ -0,0 +1,66 @@
+-- Indexed search over bookings for GET /api/bookings/search. Names are
+-- matched with full-text prefix queries ('simple' configuration: no stemming,
+-- so Arabic and Latin names are tokenized the same way); phone, WhatsApp and
+-- passport numbers with prefix indexes on a normalized form. When pg_trgm is
+-- available, trigram indexes add substring and typo-tolerant matching.
+
+-- Folds the spellings staff type interchangeably: harakat and tatweel are
+-- dropped, alef/yaa/taa marbuta variants unified, Arabic-Indic digits mapped
+-- to ASCII and Latin letters lower-cased.
+CREATE OR REPLACE FUNCTION search_normalize(value TEXT) RETURNS TEXT AS $$
+    SELECT lower(translate(
+        regexp_replace(COALESCE(value, ''), '[\u064B-\u065F\u0670\u0640]', '', 'g'),
+        'أإآٱىة٠١٢٣٤٥٦٧٨٩', 'اااايه0123456789'))
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
+CREATE OR REPLACE FUNCTION booking_search_names(first_name TEXT, last_name TEXT, father_name TEXT, grandfather_name TEXT)
+RETURNS TEXT AS $$
+    SELECT search_normalize(COALESCE(first_name, '') || ' ' || COALESCE(last_name, '') || ' ' ||
+                            COALESCE(father_name, '') || ' ' || COALESCE(grandfather_name, ''))
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
+-- Phone numbers are entered with spaces, dashes and country prefixes.
+CREATE OR REPLACE FUNCTION booking_search_digits(value TEXT) RETURNS TEXT AS $$
+    SELECT regexp_replace(translate(COALESCE(value, ''), '٠١٢٣٤٥٦٧٨٩', '0123456789'), '[^0-9]', '', 'g')
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
+CREATE OR REPLACE FUNCTION booking_search_key(value TEXT) RETURNS TEXT AS $$
+    SELECT upper(regexp_replace(COALESCE(value, ''), '[^0-9A-Za-z]', '', 'g'))
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
+CREATE INDEX IF NOT EXISTS idx_bookings_search_names
+    ON bookings USING GIN (to_tsvector('simple', booking_search_names(first_name, last_name, father_name, grandfather_name)))
+    WHERE is_deleted = FALSE;
+
+CREATE INDEX IF NOT EXISTS idx_bookings_search_phone
+    ON bookings (booking_search_digits(phone) text_pattern_ops) WHERE is_deleted = FALSE;
+
+CREATE INDEX IF NOT EXISTS idx_bookings_search_whatsapp
+    ON bookings (booking_search_digits(whatsapp_number) text_pattern_ops) WHERE is_deleted = FALSE;
+
+CREATE INDEX IF NOT EXISTS idx_bookings_search_passport
+    ON bookings (booking_search_key(passport_number) text_pattern_ops) WHERE is_deleted = FALSE;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm') THEN
+        RAISE NOTICE 'pg_trgm is not available; booking search falls back to prefix matching';
+        RETURN;
+    END IF;
+
+    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+    CREATE INDEX IF NOT EXISTS idx_bookings_search_names_trgm
+        ON bookings USING GIN (booking_search_names(first_name, last_name, father_name, grandfather_name) gin_trgm_ops)
+        WHERE is_deleted = FALSE;
+
+    CREATE INDEX IF NOT EXISTS idx_bookings_search_phone_trgm
+        ON bookings USING GIN (booking_search_digits(phone) gin_trgm_ops) WHERE is_deleted = FALSE;
+
+    CREATE INDEX IF NOT EXISTS idx_bookings_search_whatsapp_trgm
+        ON bookings USING GIN (booking_search_digits(whatsapp_number) gin_trgm_ops) WHERE is_deleted = FALSE;
+
+    CREATE INDEX IF NOT EXISTS idx_bookings_search_passport_trgm
+        ON bookings USING GIN (booking_search_key(passport_number) gin_trgm_ops) WHERE is_deleted = FALSE;
+END;
+$$;
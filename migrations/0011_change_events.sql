@@ -0,0 +1,96 @@
+-- Change feed behind GET /api/events. Every write to trips or bookings
+-- appends compact rows here and notifies the 'change_events' channel.
+--
+-- Row ids follow insertion, not commit order, so a reader that has seen id N
+-- can still find a smaller id committing later. The feed therefore numbers
+-- committed rows itself (sequence_change_events, run by the listeners): seq
+-- is handed out under a lock in the order rows become visible, and it is
+-- the SSE event id clients resume from.
+
+CREATE SEQUENCE IF NOT EXISTS change_events_seq;
+
+CREATE TABLE IF NOT EXISTS change_events (
+    id BIGSERIAL PRIMARY KEY,
+    seq BIGINT UNIQUE,
+    entity TEXT NOT NULL,
+    -- NULL for a 'bulk' event: the statement changed too many rows to list.
+    entity_id INTEGER,
+    action TEXT NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_change_events_unsequenced ON change_events (id) WHERE seq IS NULL;
+CREATE INDEX IF NOT EXISTS idx_change_events_created_at ON change_events (created_at);
+
+CREATE OR REPLACE FUNCTION record_changes() RETURNS trigger AS $$
+DECLARE
+    entity TEXT := TG_ARGV[0];
+    bulk_threshold INTEGER := TG_ARGV[1]::INTEGER;
+    changes TEXT := CASE TG_OP
+        WHEN 'INSERT' THEN 'SELECT id, ''create'' AS action FROM new_rows'
+        WHEN 'DELETE' THEN 'SELECT id, ''purge'' AS action FROM old_rows'
+        ELSE 'SELECT n.id, CASE
+                  WHEN n.is_deleted AND o.is_deleted IS NOT TRUE THEN ''delete''
+                  WHEN o.is_deleted AND n.is_deleted IS NOT TRUE THEN ''restore''
+                  ELSE ''update'' END AS action
+              FROM new_rows n JOIN old_rows o ON o.id = n.id'
+    END;
+    changed BIGINT;
+BEGIN
+    EXECUTE format('SELECT COUNT(*) FROM (%s) AS changes', changes) INTO changed;
+    IF changed = 0 THEN
+        RETURN NULL;
+    ELSIF changed > bulk_threshold THEN
+        INSERT INTO change_events (entity, entity_id, action) VALUES (entity, NULL, 'bulk');
+    ELSE
+        EXECUTE format('INSERT INTO change_events (entity, entity_id, action)
+                        SELECT %L, id, action FROM (%s) AS changes ORDER BY id', entity, changes);
+    END IF;
+
+    -- Identical payloads are folded into one notification per transaction.
+    PERFORM pg_notify('change_events', '');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Numbers the committed, not yet numbered rows in id order. The lock is
+-- held until the numbering commits, so seq values become visible in order.
+CREATE OR REPLACE FUNCTION sequence_change_events() RETURNS BIGINT AS $$
+DECLARE
+    numbered BIGINT;
+BEGIN
+    PERFORM pg_advisory_xact_lock(72010002);
+
+    UPDATE change_events e SET seq = pending.seq
+    FROM (SELECT id, nextval('change_events_seq') AS seq
+          FROM (SELECT id FROM change_events WHERE seq IS NULL ORDER BY id) AS unsequenced) AS pending
+    WHERE e.id = pending.id;
+
+    GET DIAGNOSTICS numbered = ROW_COUNT;
+    RETURN numbered;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trips_record_insert AFTER INSERT ON trips
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION record_changes('trip', 100);
+
+CREATE TRIGGER trips_record_update AFTER UPDATE ON trips
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION record_changes('trip', 100);
+
+CREATE TRIGGER trips_record_delete AFTER DELETE ON trips
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION record_changes('trip', 100);
+
+CREATE TRIGGER bookings_record_insert AFTER INSERT ON bookings
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION record_changes('booking', 100);
+
+CREATE TRIGGER bookings_record_update AFTER UPDATE ON bookings
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION record_changes('booking', 100);
+
+CREATE TRIGGER bookings_record_delete AFTER DELETE ON bookings
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION record_changes('booking', 100);
@@ -0,0 +1,30 @@
+-- Soft delete is the is_deleted flag plus deleted_at on the row itself; the
+-- deleted_trips/deleted_bookings copies, which doubled every delete and
+-- restore, are dropped. The trash listings and the retention purge
+-- (`flask trash purge`) walk deleted_at through the partial indexes below.
+
+UPDATE trips t SET deleted_at = COALESCE(
+        (SELECT MAX(d.deleted_at) FROM deleted_trips d WHERE d.original_id = t.id), CURRENT_TIMESTAMP)
+    WHERE is_deleted = TRUE AND deleted_at IS NULL;
+
+UPDATE bookings b SET deleted_at = COALESCE(
+        (SELECT MAX(d.deleted_at) FROM deleted_bookings d WHERE d.original_id = b.id), CURRENT_TIMESTAMP)
+    WHERE is_deleted = TRUE AND deleted_at IS NULL;
+
+UPDATE trips SET deleted_at = NULL WHERE is_deleted IS NOT TRUE AND deleted_at IS NOT NULL;
+UPDATE bookings SET deleted_at = NULL WHERE is_deleted IS NOT TRUE AND deleted_at IS NOT NULL;
+
+-- deleted_at is set exactly while a row is in the trash.
+ALTER TABLE trips ADD CONSTRAINT trips_deleted_at_check
+    CHECK ((is_deleted IS TRUE) = (deleted_at IS NOT NULL));
+ALTER TABLE bookings ADD CONSTRAINT bookings_deleted_at_check
+    CHECK ((is_deleted IS TRUE) = (deleted_at IS NOT NULL));
+
+CREATE INDEX IF NOT EXISTS idx_trips_trash
+    ON trips (deleted_at DESC, id DESC) WHERE is_deleted = TRUE;
+
+CREATE INDEX IF NOT EXISTS idx_bookings_trash
+    ON bookings (deleted_at DESC, id DESC) WHERE is_deleted = TRUE;
+
+DROP TABLE IF EXISTS deleted_trips;
+DROP TABLE IF EXISTS deleted_bookings;
@@ -0,0 +1,28 @@
+-- Durable background jobs (jobs.py). Writers insert jobs in their own
+-- transaction, so a job exists exactly when the change that asked for it
+-- committed. Workers claim due jobs with FOR UPDATE SKIP LOCKED and hold a
+-- lease (locked_until) while running, outside any transaction; a worker that
+-- dies leaves the lease to expire and the job is queued again.
+--
+-- status: queued -> running -> done, or back to queued with a later run_at
+-- after a failure, or dead once max_attempts are used up. Dead jobs stay in
+-- the table as the dead-letter queue (`flask jobs dead` / `flask jobs retry`).
+
+CREATE TABLE IF NOT EXISTS jobs (
+    id BIGSERIAL PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload JSONB NOT NULL DEFAULT '{}',
+    status TEXT NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'done', 'dead')),
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 5,
+    run_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    locked_until TIMESTAMP,
+    last_error TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+-- Claim order, over the small set of waiting jobs only.
+CREATE INDEX IF NOT EXISTS idx_jobs_due ON jobs (run_at, id) WHERE status = 'queued';
+CREATE INDEX IF NOT EXISTS idx_jobs_leases ON jobs (locked_until) WHERE status = 'running';
+CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs (finished_at) WHERE status = 'done';
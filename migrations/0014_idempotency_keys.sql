@@ -0,0 +1,19 @@
+-- Idempotency-Key support for POST /api/bookings and POST /api/trips
+-- (idempotency.py). A key row is inserted in the same transaction as the
+-- booking or trip it creates, together with the response, so a replay finds
+-- either both or neither. The primary key makes a concurrent duplicate wait
+-- for the first request's transaction and then replay its response.
+
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    route TEXT NOT NULL,
+    key TEXT NOT NULL,
+    -- SHA-256 of the request, so a key reused for different content is
+    -- refused instead of replaying an unrelated response.
+    fingerprint TEXT NOT NULL,
+    response_code INTEGER,
+    response_body JSONB,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (route, key)
+);
+
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created_at ON idempotency_keys (created_at);
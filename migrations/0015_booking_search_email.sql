@@ -0,0 +1,17 @@
+-- Email addresses for GET /api/bookings/search, which the dashboard's old
+-- in-browser filter matched too: a prefix index on the lower-cased address,
+-- and a trigram index for substrings where pg_trgm is installed (0010).
+
+CREATE INDEX IF NOT EXISTS idx_bookings_search_email
+    ON bookings (lower(email) text_pattern_ops) WHERE is_deleted = FALSE;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm') THEN
+        RETURN;
+    END IF;
+
+    CREATE INDEX IF NOT EXISTS idx_bookings_search_email_trgm
+        ON bookings USING GIN (lower(email) gin_trgm_ops) WHERE is_deleted = FALSE;
+END;
+$$;
@@ -0,0 +1,5 @@
+-- Lets `flask trash purge` check which stored passport scans are still
+-- referenced (trash.py) without scanning bookings once per batch of files.
+
+CREATE INDEX IF NOT EXISTS idx_bookings_passport_file
+    ON bookings (passport_file) WHERE passport_file IS NOT NULL;
@@ -0,0 +1,5 @@
+-- The dashboard pages through GET /api/bookings?status=... with the same
+-- (booking_date, id) keyset as 0005, one status at a time.
+
+CREATE INDEX IF NOT EXISTS idx_bookings_active_status_date_id
+    ON bookings (status, booking_date DESC, id DESC) WHERE is_deleted = FALSE;
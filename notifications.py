@@ -0,0 +1,169 @@
+from email.message import EmailMessage
+from jobs import PermanentJobError, enqueue, job_handler
+from db import get_pool
+import os
+import json
+import smtplib
+import logging
+import threading
+import urllib.error
+import urllib.request
+
+logger = logging.getLogger(__name__)
+
+AGENCY_NAME = os.environ.get('AGENCY_NAME', 'وكالة الرياض للعمرة')
+
+# Delivery backend per channel: log (default, sends nothing), file, smtp for
+# email, webhook for WhatsApp. Other backends can be added with
+# register_backend().
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'log')
+WHATSAPP_BACKEND = os.environ.get('WHATSAPP_BACKEND', 'log')
+
+# Sink of the file backend, one JSON message per line.
+NOTIFICATIONS_FILE = os.environ.get('NOTIFICATIONS_FILE', 'notifications.jsonl')
+
+SMTP_HOST = os.environ.get('SMTP_HOST', 'localhost')
+SMTP_PORT = int(os.environ.get('SMTP_PORT', 25))
+SMTP_USERNAME = os.environ.get('SMTP_USERNAME')
+SMTP_PASSWORD = os.environ.get('SMTP_PASSWORD')
+SMTP_STARTTLS = os.environ.get('SMTP_STARTTLS', '0') == '1'
+SMTP_FROM = os.environ.get('SMTP_FROM', 'no-reply@localhost')
+SMTP_TIMEOUT = float(os.environ.get('SMTP_TIMEOUT', 20))
+
+# Any WhatsApp gateway that accepts a JSON POST of {"to": ..., "body": ...}.
+WHATSAPP_WEBHOOK_URL = os.environ.get('WHATSAPP_WEBHOOK_URL')
+WHATSAPP_WEBHOOK_TOKEN = os.environ.get('WHATSAPP_WEBHOOK_TOKEN')
+WHATSAPP_WEBHOOK_TIMEOUT = float(os.environ.get('WHATSAPP_WEBHOOK_TIMEOUT', 20))
+
+CHANNELS = {'email': EMAIL_BACKEND, 'whatsapp': WHATSAPP_BACKEND}
+
+
+class LogBackend:
+    def send(self, message):
+        logger.info(f"Notification ({message['channel']}) to {message['to']}: {message['subject']}")
+
+
+class FileBackend:
+    # Stands in for real delivery in development and tests.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def send(self, message):
+        line = json.dumps(message, ensure_ascii=False)
+        with self._lock, open(NOTIFICATIONS_FILE, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+
+
+class SmtpBackend:
+    def send(self, message):
+        email = EmailMessage()
+        email['From'] = SMTP_FROM
+        email['To'] = message['to']
+        email['Subject'] = message['subject']
+        email.set_content(message['body'])
+
+        try:
+            with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT) as smtp:
+                if SMTP_STARTTLS:
+                    smtp.starttls()
+                if SMTP_USERNAME:
+                    smtp.login(SMTP_USERNAME, SMTP_PASSWORD)
+                smtp.send_message(email)
+        except smtplib.SMTPRecipientsRefused as e:
+            raise PermanentJobError(f'Recipient refused: {e.recipients}')
+
+
+class WebhookBackend:
+    def send(self, message):
+        if not WHATSAPP_WEBHOOK_URL:
+            raise PermanentJobError('WHATSAPP_WEBHOOK_URL is not set')
+
+        request = urllib.request.Request(
+            WHATSAPP_WEBHOOK_URL,
+            data=json.dumps({'to': message['to'], 'body': message['body']}).encode('utf-8'),
+            headers={'Content-Type': 'application/json'},
+            method='POST'
+        )
+        if WHATSAPP_WEBHOOK_TOKEN:
+            request.add_header('Authorization', f'Bearer {WHATSAPP_WEBHOOK_TOKEN}')
+
+        try:
+            with urllib.request.urlopen(request, timeout=WHATSAPP_WEBHOOK_TIMEOUT):
+                pass
+        except urllib.error.HTTPError as e:
+            # Other client errors will not go away on retry; throttling and
+            # server errors may.
+            if 400 <= e.code < 500 and e.code != 429:
+                raise PermanentJobError(f'Gateway rejected the message: HTTP {e.code}')
+            raise
+
+
+BACKENDS = {
+    'log': LogBackend,
+    'file': FileBackend,
+    'smtp': SmtpBackend,
+    'webhook': WebhookBackend
+}
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def register_backend(name, backend_class):
+    BACKENDS[name] = backend_class
+
+
+def get_backend(channel):
+    with _backends_lock:
+        if channel not in _backends:
+            name = CHANNELS[channel]
+            if name not in BACKENDS:
+                raise PermanentJobError(f'Unknown {channel} backend {name!r}')
+            _backends[channel] = BACKENDS[name]()
+        return _backends[channel]
+
+
+def booking_confirmation(booking, channel, to):
+    trip = f"{booking['trip_date']} ({booking['trip_airline']})" if booking['trip_date'] else ''
+    body = (f"السلام عليكم {booking['first_name']} {booking['last_name']}،\n\n"
+            f"تم استلام طلب حجزك رقم {booking['id']} لرحلة {trip} وهو قيد المراجعة. "
+            f"سنتواصل معك قريبًا لتأكيده.\n\n{AGENCY_NAME}")
+    return {
+        'channel': channel,
+        'to': to,
+        'subject': f"تأكيد استلام طلب الحجز رقم {booking['id']}",
+        'body': body
+    }
+
+
+def enqueue_booking_confirmation(conn, booking_id, email, whatsapp_number):
+    # One job per channel, so a failing channel is retried on its own.
+    if email:
+        enqueue(conn, 'booking_confirmation', {'booking_id': booking_id, 'channel': 'email'})
+    if whatsapp_number:
+        enqueue(conn, 'booking_confirmation', {'booking_id': booking_id, 'channel': 'whatsapp'})
+
+
+@job_handler('booking_confirmation')
+def send_booking_confirmation(payload):
+    channel = payload['channel']
+    if channel not in CHANNELS:
+        raise PermanentJobError(f'Unknown channel {channel!r}')
+
+    with get_pool().connection() as conn:
+        c = conn.cursor()
+        c.execute('''SELECT b.id, b.first_name, b.last_name, b.email, b.whatsapp_number, b.is_deleted,
+                            t.date AS trip_date, t.airline AS trip_airline
+                     FROM bookings b LEFT JOIN trips t ON t.id = b.trip_id
+                     WHERE b.id = %s''', (payload['booking_id'],))
+        booking = c.fetchone()
+
+    # Deleted before the job ran: nothing to confirm any more.
+    if booking is None or booking['is_deleted']:
+        return
+
+    to = booking['email'] if channel == 'email' else booking['whatsapp_number']
+    if not to:
+        return
+    get_backend(channel).send(booking_confirmation(booking, channel, to))
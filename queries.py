@@ -0,0 +1,201 @@
+from dataclasses import dataclass, fields
+from psycopg.rows import class_row
+from db import PREPARE
+from serializers import BOOKING_ATTRIBUTES
+
+
+@dataclass(slots=True)
+class Trip:
+    id: int
+    date: str
+    airline: str
+    airline_logo: str
+    hotel: str
+    hotel_logo: str
+    hotel_distance: str
+    route: str
+    duration: int
+    type: str
+    state: str
+    room5_price: int
+    room5_status: str
+    room4_price: int
+    room4_status: str
+    room3_price: int
+    room3_status: str
+    room2_price: int
+    room2_status: str
+
+
+@dataclass(slots=True)
+class Booking:
+    # Projections select only some columns, so everything defaults to None.
+    id: int = None
+    trip_id: int = None
+    first_name: str = None
+    last_name: str = None
+    email: str = None
+    phone: str = None
+    whatsapp_number: str = None
+    birth_date: str = None
+    birth_place: str = None
+    passport_number: str = None
+    passport_issue_date: str = None
+    passport_expiry_date: str = None
+    passport_scan: str = None
+    passport_file: str = None
+    marital_status: str = None
+    father_name: str = None
+    grandfather_name: str = None
+    job_title: str = None
+    education_level: str = None
+    facebook_profile: str = None
+    umrah_type: str = None
+    room_type: str = None
+    notes: str = None
+    status: str = None
+    booking_date: str = None
+    branch_state: str = None
+    trip_date: str = None
+    trip_airline: str = None
+
+
+@dataclass(slots=True)
+class TrashTrip:
+    id: int
+    date: str
+    airline: str
+    deleted_at: object
+
+
+@dataclass(slots=True)
+class TrashBooking:
+    id: int
+    first_name: str
+    last_name: str
+    email: str
+    phone: str
+    deleted_at: object
+
+
+def column_list(row_type):
+    return ', '.join(field.name for field in fields(row_type))
+
+
+TRIP_COLUMNS = column_list(Trip)
+
+TRIP_ROW = class_row(Trip)
+BOOKING_ROW = class_row(Booking)
+TRASH_TRIP_ROW = class_row(TrashTrip)
+TRASH_BOOKING_ROW = class_row(TrashBooking)
+
+
+def booking_columns(fields):
+    columns = [f'b.{BOOKING_ATTRIBUTES[field]}' for field in fields if field in BOOKING_ATTRIBUTES]
+    if 'trip' in fields:
+        columns.extend(['t.date AS trip_date', 't.airline AS trip_airline'])
+    return ', '.join(columns)
+
+
+def bookings_query(fields, branch_filter, keyset=False, status_filter='all'):
+    # Shared by the listings and the export; `keyset` adds the cursor
+    # condition used by the paged listing.
+    query = f'''SELECT {booking_columns(fields)}
+                FROM bookings b
+                JOIN trips t ON b.trip_id = t.id
+                WHERE b.is_deleted = FALSE'''
+    if branch_filter != 'all':
+        query += ' AND b.branch_state = %(branch)s'
+    if status_filter != 'all':
+        query += ' AND b.status = %(status)s'
+    if keyset:
+        query += ' AND (b.booking_date, b.id) < (%(after_date)s, %(after_id)s)'
+    return query
+
+
+def fetch_trips(conn, state_filter, type_filter):
+    query = f'SELECT {TRIP_COLUMNS} FROM trips WHERE is_deleted = FALSE'
+    if state_filter != 'all':
+        query += ' AND states && %(states)s'
+    if type_filter != 'all':
+        query += ' AND type = %(type)s'
+
+    c = conn.cursor(row_factory=TRIP_ROW)
+    c.execute(query, {'states': ['all', state_filter], 'type': type_filter}, prepare=PREPARE)
+    return c.fetchall()
+
+
+def fetch_trip(conn, trip_id):
+    c = conn.cursor(row_factory=TRIP_ROW)
+    c.execute(f'SELECT {TRIP_COLUMNS} FROM trips WHERE id = %s AND is_deleted = FALSE', (trip_id,), prepare=PREPARE)
+    return c.fetchone()
+
+
+def fetch_bookings(conn, fields, branch_filter):
+    c = conn.cursor(row_factory=BOOKING_ROW)
+    c.execute(bookings_query(fields, branch_filter), {'branch': branch_filter}, prepare=PREPARE)
+    return c.fetchall()
+
+
+def fetch_bookings_page(conn, fields, branch_filter, after, limit, status_filter='all'):
+    # The cursor columns are always selected, whatever the projection.
+    fields = ['id', 'bookingDate'] + [field for field in fields if field not in ('id', 'bookingDate')]
+    query = bookings_query(fields, branch_filter, keyset=after is not None, status_filter=status_filter)
+    query += ' ORDER BY b.booking_date DESC, b.id DESC LIMIT %(limit)s'
+    params = {'branch': branch_filter, 'status': status_filter, 'limit': limit}
+    if after is not None:
+        params['after_date'], params['after_id'] = after
+
+    c = conn.cursor(row_factory=BOOKING_ROW)
+    c.execute(query, params, prepare=PREPARE)
+    return c.fetchall()
+
+
+def fetch_booking(conn, booking_id, fields):
+    c = conn.cursor(row_factory=BOOKING_ROW)
+    c.execute(f'''SELECT {booking_columns(fields)}
+                  FROM bookings b
+                  JOIN trips t ON b.trip_id = t.id
+                  WHERE b.id = %s AND b.is_deleted = FALSE''', (booking_id,), prepare=PREPARE)
+    return c.fetchone()
+
+
+def trash_query(table, row_type, keyset):
+    # Newest deletions first, walking the partial (deleted_at, id) index.
+    query = f'SELECT {column_list(row_type)} FROM {table} WHERE is_deleted = TRUE'
+    if keyset:
+        query += ' AND (deleted_at, id) < (%(after_deleted_at)s::timestamp, %(after_id)s)'
+    return query + ' ORDER BY deleted_at DESC, id DESC LIMIT %(limit)s'
+
+
+def fetch_trash_page(conn, table, row_type, row_factory, after, limit):
+    params = {'limit': limit}
+    if after is not None:
+        params['after_deleted_at'], params['after_id'] = after
+
+    c = conn.cursor(row_factory=row_factory)
+    c.execute(trash_query(table, row_type, after is not None), params, prepare=PREPARE)
+    return c.fetchall()
+
+
+def fetch_trash_item(conn, table, row_type, row_factory, item_id):
+    c = conn.cursor(row_factory=row_factory)
+    c.execute(f'SELECT {column_list(row_type)} FROM {table} WHERE id = %s AND is_deleted = TRUE',
+              (item_id,), prepare=PREPARE)
+    return c.fetchone()
+
+
+def fetch_trash_trips(conn, after, limit):
+    return fetch_trash_page(conn, 'trips', TrashTrip, TRASH_TRIP_ROW, after, limit)
+
+
+def fetch_trash_bookings(conn, after, limit):
+    return fetch_trash_page(conn, 'bookings', TrashBooking, TRASH_BOOKING_ROW, after, limit)
+
+
+def fetch_trash_trip(conn, trip_id):
+    return fetch_trash_item(conn, 'trips', TrashTrip, TRASH_TRIP_ROW, trip_id)
+
+
+def fetch_trash_booking(conn, booking_id):
+    return fetch_trash_item(conn, 'bookings', TrashBooking, TRASH_BOOKING_ROW, booking_id)
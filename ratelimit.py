@@ -0,0 +1,279 @@
+from contextlib import contextmanager
+from functools import wraps
+from flask import jsonify, request
+from werkzeug.exceptions import RequestEntityTooLarge
+import os
+import math
+import mmap
+import time
+import random
+import struct
+import hashlib
+import logging
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# The shared state needs POSIX record locks; elsewhere (Windows development
+# machines) nothing is limited.
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', '1') == '1' and fcntl is not None
+
+# Proxy hops in front of the app whose X-Forwarded-For entries are trusted
+# (ProxyFix); the client address is what buckets are keyed on. 0 when the
+# app is reached directly.
+TRUSTED_PROXIES = int(os.environ.get('TRUSTED_PROXIES', 1))
+
+# Shared by the worker processes of this machine. Kept in memory (/dev/shm)
+# where available; losing it only resets the buckets.
+RATE_LIMIT_FILE = os.environ.get('RATE_LIMIT_FILE', os.path.join(
+    '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(), f'el-riyad-ratelimit-{os.getuid()}'))
+
+
+def parse_rate(value):
+    # '10/60': bursts of up to 10 requests, refilled at 10 per 60 seconds.
+    count, seconds = value.split('/')
+    return int(count), float(seconds)
+
+
+# Token buckets per client IP and rule.
+RATE_LIMITS = {
+    'bookings': parse_rate(os.environ.get('RATE_LIMIT_BOOKINGS', '10/60')),
+    'password': parse_rate(os.environ.get('RATE_LIMIT_PASSWORD', '5/60'))
+}
+
+# Requests of these kinds running at once across all processes; the rest
+# wait up to ADMISSION_QUEUE_TIMEOUT for a slot and are then shed with 429.
+ADMISSION_LIMITS = {
+    'bookings': int(os.environ.get('ADMISSION_BOOKINGS_LIMIT', 8))
+}
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', 2))
+ADMISSION_RETRY_AFTER = int(os.environ.get('ADMISSION_RETRY_AFTER', 2))
+ADMISSION_MAX_SLOTS = 1024
+
+COUNTERS = [f'{rule}.{outcome}' for rule in RATE_LIMITS for outcome in ('allowed', 'rejected')] + \
+           [f'admission.{name}.{outcome}' for name in ADMISSION_LIMITS for outcome in ('admitted', 'queued', 'shed')]
+
+COUNTER = struct.Struct('<Q')
+# Key hash (0 marks a free slot), tokens left, time of the last update.
+BUCKET = struct.Struct('<Qdd')
+BUCKET_SLOTS = 4096
+BUCKET_PROBES = 8
+BUCKETS_OFFSET = 64 * COUNTER.size
+FILE_SIZE = BUCKETS_OFFSET + BUCKET_SLOTS * BUCKET.size
+# Record locks live past the end of the data: one byte guards the buckets and
+# counters, one byte per admission slot.
+STATE_LOCK = FILE_SIZE
+ADMISSION_LOCKS = FILE_SIZE + 1
+
+
+class LocalBackend:
+    # Buckets and counters are kept in a memory-mapped file that every worker
+    # process maps. POSIX record locks serialize the processes and a thread
+    # lock the threads within one, since record locks belong to the process.
+    # An admission slot is a record lock of its own: the kernel drops it when
+    # its process dies, so a killed worker cannot leak slots.
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._pid = None
+        self._fd = None
+        self._map = None
+        self._held = set()
+
+    def _open(self):
+        # Opened lazily in each process; locks are not inherited on fork.
+        if self._pid == os.getpid():
+            return
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(fd).st_size < FILE_SIZE:
+            os.ftruncate(fd, FILE_SIZE)
+        self._map = mmap.mmap(fd, FILE_SIZE)
+        self._fd = fd
+        self._held = set()
+        self._pid = os.getpid()
+
+    @contextmanager
+    def _state(self):
+        with self._lock:
+            self._open()
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, STATE_LOCK)
+            try:
+                yield self._map
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, STATE_LOCK)
+
+    def _count(self, data, name):
+        offset = COUNTERS.index(name) * COUNTER.size
+        COUNTER.pack_into(data, offset, COUNTER.unpack_from(data, offset)[0] + 1)
+
+    def _bucket_offset(self, data, key_hash):
+        # Open addressing over a few slots; when all are taken by other keys
+        # the least recently used bucket is recycled.
+        oldest = None
+        for probe in range(BUCKET_PROBES):
+            offset = BUCKETS_OFFSET + (key_hash + probe) % BUCKET_SLOTS * BUCKET.size
+            stored_hash, _, updated = BUCKET.unpack_from(data, offset)
+            if stored_hash in (key_hash, 0):
+                return offset
+            if oldest is None or updated < oldest[1]:
+                oldest = (offset, updated)
+        return oldest[0]
+
+    def take(self, rule, key, capacity, period):
+        # Returns (allowed, seconds until a token is available).
+        key_hash = int.from_bytes(hashlib.blake2b(f'{rule}:{key}'.encode('utf-8'), digest_size=8).digest(), 'little') or 1
+        rate = capacity / period
+        now = time.time()
+
+        with self._state() as data:
+            offset = self._bucket_offset(data, key_hash)
+            stored_hash, tokens, updated = BUCKET.unpack_from(data, offset)
+            if stored_hash != key_hash:
+                tokens, updated = capacity, now
+            tokens = min(capacity, tokens + max(0, now - updated) * rate)
+
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            BUCKET.pack_into(data, offset, key_hash, tokens, now)
+            self._count(data, f"{rule}.{'allowed' if allowed else 'rejected'}")
+
+        return allowed, 0 if allowed else (1 - tokens) / rate
+
+    def acquire(self, name, limit, timeout):
+        # Polls for a free slot until the deadline; returns the slot, or None
+        # when the request should be shed.
+        base = ADMISSION_LOCKS + list(ADMISSION_LIMITS).index(name) * ADMISSION_MAX_SLOTS
+        deadline = time.monotonic() + timeout
+        queued = False
+        while True:
+            with self._lock:
+                self._open()
+                for slot in range(min(limit, ADMISSION_MAX_SLOTS)):
+                    if (name, slot) in self._held:
+                        continue
+                    try:
+                        fcntl.lockf(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, base + slot)
+                    except OSError:
+                        continue
+                    self._held.add((name, slot))
+                    break
+                else:
+                    slot = None
+
+            if slot is not None or time.monotonic() >= deadline:
+                with self._state() as data:
+                    if queued:
+                        self._count(data, f'admission.{name}.queued')
+                    self._count(data, f"admission.{name}.{'shed' if slot is None else 'admitted'}")
+                return slot
+
+            queued = True
+            time.sleep(random.uniform(0.01, 0.05))
+
+    def release(self, name, slot):
+        base = ADMISSION_LOCKS + list(ADMISSION_LIMITS).index(name) * ADMISSION_MAX_SLOTS
+        with self._lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, base + slot)
+            self._held.discard((name, slot))
+
+    def counters(self):
+        with self._state() as data:
+            return {name: COUNTER.unpack_from(data, i * COUNTER.size)[0] for i, name in enumerate(COUNTERS)}
+
+
+backend = LocalBackend(RATE_LIMIT_FILE)
+
+
+def too_many_requests(retry_after):
+    response = jsonify({'error': 'Too many requests, please try again later'})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def rate_limit(rule):
+    # Per client IP. The limiter fails open: a broken backend must not take
+    # the endpoint down with it.
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            if RATE_LIMIT_ENABLED:
+                try:
+                    allowed, retry_after = backend.take(rule, request.remote_addr or '', *RATE_LIMITS[rule])
+                except OSError as e:
+                    logger.error(f"Rate limiter unavailable: {str(e)}")
+                else:
+                    if not allowed:
+                        return too_many_requests(retry_after)
+            return view(*args, **kwargs)
+        return wrapped
+    return decorator
+
+
+def read_body():
+    # Multipart forms are parsed (uploads spooled to disk), anything else is
+    # buffered, so the view no longer waits on the client.
+    if request.mimetype in ('multipart/form-data', 'application/x-www-form-urlencoded'):
+        request.files
+    else:
+        request.get_data()
+
+
+def admission(name):
+    # Caps the requests working against the database at once. A slot is only
+    # taken once the whole request body has arrived: slow uploads must not
+    # hold slots while they trickle in, so only the view's own work (the
+    # database transaction and moving the spooled scan) runs inside one.
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            if not RATE_LIMIT_ENABLED:
+                return view(*args, **kwargs)
+            try:
+                read_body()
+            except RequestEntityTooLarge as e:
+                return jsonify({'error': e.description}), 413
+            try:
+                slot = backend.acquire(name, ADMISSION_LIMITS[name], ADMISSION_QUEUE_TIMEOUT)
+            except OSError as e:
+                logger.error(f"Admission control unavailable: {str(e)}")
+                return view(*args, **kwargs)
+            if slot is None:
+                return too_many_requests(ADMISSION_RETRY_AFTER)
+            try:
+                return view(*args, **kwargs)
+            finally:
+                backend.release(name, slot)
+        return wrapped
+    return decorator
+
+
+def limiter_stats():
+    counters = backend.counters() if RATE_LIMIT_ENABLED else dict.fromkeys(COUNTERS, 0)
+    return {
+        'enabled': RATE_LIMIT_ENABLED,
+        'rate_limits': {
+            rule: {
+                'capacity': capacity,
+                'period': period,
+                'allowed': counters[f'{rule}.allowed'],
+                'rejected': counters[f'{rule}.rejected']
+            } for rule, (capacity, period) in RATE_LIMITS.items()
+        },
+        'admission': {
+            name: {
+                'limit': limit,
+                'admitted': counters[f'admission.{name}.admitted'],
+                'queued': counters[f'admission.{name}.queued'],
+                'shed': counters[f'admission.{name}.shed']
+            } for name, limit in ADMISSION_LIMITS.items()
+        }
+    }
@@ -0,0 +1,143 @@
+from flask.cli import AppGroup
+from db import get_pool
+import os
+import re
+import time
+import logging
+import click
+import threading
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+MIGRATION_FILENAME = re.compile(r'^(\d{4})_(\w+)\.sql$')
+
+# Serializes concurrent `flask db upgrade` runs (e.g. several release steps).
+MIGRATION_LOCK_ID = 72010001
+
+# A schema found at the latest version stays there for the life of the
+# process, so only a failed readiness check is repeated, at most this often.
+SCHEMA_RECHECK_INTERVAL = float(os.environ.get('SCHEMA_RECHECK_INTERVAL', 30))
+
+_schema_ready = False
+_schema_checked_at = None
+_schema_lock = threading.Lock()
+
+
+def load_migrations():
+    migrations = []
+    for filename in sorted(os.listdir(MIGRATIONS_FOLDER)):
+        match = MIGRATION_FILENAME.match(filename)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), os.path.join(MIGRATIONS_FOLDER, filename)))
+    return migrations
+
+
+def latest_version():
+    migrations = load_migrations()
+    return migrations[-1][0] if migrations else 0
+
+
+def current_version(conn):
+    c = conn.cursor()
+
+    c.execute("SELECT to_regclass('schema_migrations') IS NOT NULL AS present")
+    if not c.fetchone()['present']:
+        return 0
+
+    c.execute('SELECT COALESCE(MAX(version), 0) AS version FROM schema_migrations')
+    return c.fetchone()['version']
+
+
+def upgrade(conn):
+    c = conn.cursor()
+
+    c.execute('SELECT pg_advisory_lock(%s)', (MIGRATION_LOCK_ID,))
+    try:
+        c.execute('''CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''')
+        conn.commit()
+
+        version = current_version(conn)
+        applied = []
+        for number, name, path in load_migrations():
+            if number <= version:
+                continue
+
+            with open(path, encoding='utf-8') as f:
+                sql = f.read()
+
+            # Each migration runs in its own transaction together with its
+            # version row, so a failure leaves the schema at the previous version.
+            try:
+                c.execute(sql)
+                c.execute('INSERT INTO schema_migrations (version, name) VALUES (%s, %s)', (number, name))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+            logger.info(f"Applied migration {number:04d}_{name}")
+            applied.append((number, name))
+
+        return applied
+    finally:
+        c.execute('SELECT pg_advisory_unlock(%s)', (MIGRATION_LOCK_ID,))
+        conn.commit()
+
+
+def check_schema():
+    try:
+        with get_pool().connection() as conn:
+            version = current_version(conn)
+    except Exception as e:
+        logger.error(f"Failed to check schema version: {str(e)}")
+        return False
+
+    latest = latest_version()
+    if version < latest:
+        logger.warning(f"Database schema is at version {version}, latest is {latest}; run `flask --app app db upgrade`")
+        return False
+
+    return True
+
+
+def schema_ready():
+    global _schema_ready, _schema_checked_at
+    if _schema_ready:
+        return True
+
+    with _schema_lock:
+        now = time.monotonic()
+        if not _schema_ready and (_schema_checked_at is None or now - _schema_checked_at >= SCHEMA_RECHECK_INTERVAL):
+            _schema_checked_at = now
+            _schema_ready = check_schema()
+    return _schema_ready
+
+
+db_cli = AppGroup('db', help='Database schema migrations.')
+
+
+@db_cli.command('upgrade')
+def upgrade_command():
+    """Apply all pending migrations."""
+    with get_pool().connection() as conn:
+        applied = upgrade(conn)
+
+    if not applied:
+        click.echo('Database schema is up to date.')
+    for number, name in applied:
+        click.echo(f'Applied {number:04d}_{name}')
+
+
+@db_cli.command('status')
+def status_command():
+    """Show the current and latest schema versions."""
+    with get_pool().connection() as conn:
+        version = current_version(conn)
+
+    click.echo(f'Current version: {version}')
+    click.echo(f'Latest version: {latest_version()}')
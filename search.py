@@ -0,0 +1,155 @@
+from queries import BOOKING_ROW, booking_columns
+import os
+import re
+
+SEARCH_MIN_LENGTH = 2
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = int(os.environ.get('SEARCH_MAX_LIMIT', 100))
+
+# Phone and passport fragments shorter than this match too much to be useful.
+IDENTIFIER_MIN_LENGTH = 3
+
+# Upper bound on the rows each kind of match contributes to the final
+# ranking. Every kind orders its own matches by score first (CANDIDATE_ORDER),
+# so the cut never drops a better match in favour of a worse one; it bounds
+# the rows that are merged, joined and fetched.
+SEARCH_CANDIDATES = int(os.environ.get('SEARCH_CANDIDATES', 500))
+
+ARABIC_INDIC_DIGITS = str.maketrans('٠١٢٣٤٥٦٧٨٩', '0123456789')
+NON_DIGITS = re.compile(r'[^0-9]')
+NON_KEY_CHARACTERS = re.compile(r'[^0-9A-Za-z]')
+LIKE_SPECIAL = re.compile(r'([\\%_])')
+
+# The expressions below must stay identical to the ones indexed by migration
+# 0010, otherwise the planner cannot use the indexes.
+NAMES = 'booking_search_names(first_name, last_name, father_name, grandfather_name)'
+NAMES_VECTOR = f"to_tsvector('simple', {NAMES})"
+EMAIL = 'lower(email)'
+
+# Each term of the query becomes a prefix match; the text goes through the
+# same normalization and parser as the indexed names.
+NAMES_QUERY = '''(SELECT to_tsquery('simple', string_agg(quote_literal(term) || ':*', ' & '))
+                  FROM unnest(tsvector_to_array(to_tsvector('simple', search_normalize(%(q)s)))) AS term)'''
+
+# Scores order the kinds of match: an exact phone, passport or email first,
+# then partial ones, then names by full-text rank and last typo-tolerant
+# name matches by similarity (both below 1).
+EXACT_SCORE = 4
+PARTIAL_SCORE = 3
+NAME_SCORE = 1
+
+# Same tie-break as the final ordering.
+CANDIDATE_ORDER = 'ORDER BY score DESC, booking_date DESC, id DESC\n               LIMIT %(candidates)s'
+
+_trigram_available = None
+
+
+class SearchError(ValueError):
+    pass
+
+
+def parse_search(args):
+    q = (args.get('q') or '').strip()
+    if len(q) < SEARCH_MIN_LENGTH:
+        raise SearchError(f'q must be at least {SEARCH_MIN_LENGTH} characters')
+
+    limit = args.get('limit')
+    if limit is None:
+        return q, SEARCH_DEFAULT_LIMIT
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise SearchError('limit must be an integer')
+    return q, max(1, min(limit, SEARCH_MAX_LIMIT))
+
+
+def is_email_query(q):
+    # A single word long enough to be worth matching against addresses.
+    return len(q) >= IDENTIFIER_MIN_LENGTH and not any(ch.isspace() for ch in q)
+
+
+def trigram_available(conn):
+    # pg_trgm is optional (migration 0010 only installs it where the server
+    # ships it); checked once per process.
+    global _trigram_available
+    if _trigram_available is None:
+        c = conn.cursor()
+        c.execute("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm') AS present")
+        _trigram_available = c.fetchone()['present']
+    return _trigram_available
+
+
+def identifier_match(expression, value, trigram):
+    # Substring matches need the trigram indexes; without them only the
+    # prefix is indexed.
+    pattern = f'%%{value}%%' if trigram else f'{value}%%'
+    return f'''SELECT id, CASE WHEN {expression} = '{value}' THEN {EXACT_SCORE} ELSE {PARTIAL_SCORE} END AS score
+               FROM bookings WHERE is_deleted = FALSE AND {expression} LIKE '{pattern}'{{branch}}
+               {CANDIDATE_ORDER}'''
+
+
+def email_match(trigram):
+    # Unlike the numbers, an address can contain anything, so it is passed as
+    # a parameter; the statement is never prepared, so it is still planned
+    # with the actual pattern.
+    return f'''SELECT id, CASE WHEN {EMAIL} = %(email)s THEN {EXACT_SCORE} ELSE {PARTIAL_SCORE} END AS score
+               FROM bookings WHERE is_deleted = FALSE AND {EMAIL} LIKE %(email_pattern)s{{branch}}
+               {CANDIDATE_ORDER}'''
+
+
+def email_params(q, trigram):
+    email = q.lower()
+    escaped = LIKE_SPECIAL.sub(r'\\\1', email)
+    return {'email': email, 'email_pattern': f'%{escaped}%' if trigram else f'{escaped}%'}
+
+
+def search_query(q, fields, branch_filter, trigram):
+    matches = [f'''SELECT id, {NAME_SCORE} + ts_rank({NAMES_VECTOR}, query) AS score
+               FROM bookings, {NAMES_QUERY} AS terms (query)
+               WHERE is_deleted = FALSE AND {NAMES_VECTOR} @@ query{{branch}}
+               {CANDIDATE_ORDER}''']
+    if trigram:
+        matches.append(f'''SELECT id, similarity({NAMES}, search_normalize(%(q)s)) AS score
+               FROM bookings
+               WHERE is_deleted = FALSE AND {NAMES} %% search_normalize(%(q)s){{branch}}
+               {CANDIDATE_ORDER}''')
+
+    # Only digits and ASCII letters survive the normalization, so the values
+    # are safe to inline; inlining them lets the planner use the LIKE indexes.
+    digits = NON_DIGITS.sub('', q.translate(ARABIC_INDIC_DIGITS))
+    if len(digits) >= IDENTIFIER_MIN_LENGTH:
+        matches.append(identifier_match('booking_search_digits(phone)', digits, trigram))
+        matches.append(identifier_match('booking_search_digits(whatsapp_number)', digits, trigram))
+
+    key = NON_KEY_CHARACTERS.sub('', q.translate(ARABIC_INDIC_DIGITS)).upper()
+    if len(key) >= IDENTIFIER_MIN_LENGTH and any(ch.isdigit() for ch in key):
+        matches.append(identifier_match('booking_search_key(passport_number)', key, trigram))
+
+    if is_email_query(q):
+        matches.append(email_match(trigram))
+
+    branch = ' AND branch_state = %(branch)s' if branch_filter != 'all' else ''
+    union = '\nUNION ALL\n'.join(f'({match.format(branch=branch)})' for match in matches)
+
+    return f'''WITH matches (id, score) AS ({union}),
+               ranked AS (SELECT id, MAX(score) AS score FROM matches GROUP BY id)
+               SELECT {booking_columns(fields)}
+               FROM ranked r
+               JOIN bookings b ON b.id = r.id
+               JOIN trips t ON b.trip_id = t.id
+               ORDER BY r.score DESC, b.booking_date DESC, b.id DESC
+               LIMIT %(limit)s'''
+
+
+def search_bookings(conn, q, fields, branch_filter, limit):
+    trigram = trigram_available(conn)
+    query = search_query(q, fields, branch_filter, trigram)
+    params = {'q': q, 'branch': branch_filter, 'limit': limit, 'candidates': SEARCH_CANDIDATES}
+    if is_email_query(q):
+        params.update(email_params(q, trigram))
+
+    # Never prepared: the statement text changes with the query anyway, and
+    # a generic plan could not use the LIKE prefix indexes.
+    c = conn.cursor(row_factory=BOOKING_ROW)
+    c.execute(query, params, prepare=False)
+    return c.fetchall()
@@ -0,0 +1,188 @@
+from flask.json.provider import JSONProvider
+from werkzeug.http import http_date
+from functools import lru_cache
+from inventory import ROOM_TYPES
+import os
+import uuid
+import decimal
+import logging
+import dataclasses
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# 'auto' uses orjson when it is installed, 'default' forces Flask's stdlib provider.
+JSON_PROVIDER = os.environ.get('JSON_PROVIDER', 'auto')
+
+
+def column(name, template='{}'):
+    # Expression reading one attribute of a row model (see queries.py);
+    # `template` wraps it in a conversion, e.g. "({} or '')".
+    return template.format(f'row.{name}')
+
+
+def _render(shape):
+    if isinstance(shape, dict):
+        return '{' + ', '.join(f'{key!r}: {_render(value)}' for key, value in shape.items()) + '}'
+    return shape
+
+
+def compile_shape(name, shape):
+    # Turns a declared shape (output key -> column expression, nested dicts
+    # allowed) into a function that builds the whole object in a single dict
+    # display, without a per-field loop.
+    source = f'def {name}(row):\n    return {_render(shape)}\n'
+    namespace = {}
+    exec(compile(source, f'<shape {name}>', 'exec'), namespace)
+    serializer = namespace[name]
+    serializer.source = source
+    return serializer
+
+
+# Logos are stored relative to /static; both trip pages live there, so the
+# API hands out page-relative names (also what the dashboard form saves).
+TRIP_SHAPE = {
+    'id': column('id'),
+    'date': column('date'),
+    'airline': column('airline'),
+    'airline_logo': column('airline_logo', "({} or '').replace('static/', '')"),
+    'hotel': column('hotel'),
+    'hotel_logo': column('hotel_logo', "({} or '')"),
+    'hotel_distance': column('hotel_distance', "({} or '')"),
+    'route': column('route'),
+    'duration': column('duration'),
+    'type': column('type'),
+    'state': column('state'),
+    **{
+        f'room{room_type}': {
+            'price': column(f'room{room_type}_price'),
+            'status': column(f'room{room_type}_status')
+        }
+        for room_type in ROOM_TYPES
+    }
+}
+
+serialize_trip = compile_shape('serialize_trip', TRIP_SHAPE)
+
+# API field -> bookings column (and Booking attribute).
+BOOKING_ATTRIBUTES = {
+    'id': 'id',
+    'tripId': 'trip_id',
+    'firstName': 'first_name',
+    'lastName': 'last_name',
+    'email': 'email',
+    'phone': 'phone',
+    'whatsappNumber': 'whatsapp_number',
+    'birthDate': 'birth_date',
+    'birthPlace': 'birth_place',
+    'passportNumber': 'passport_number',
+    'passportIssueDate': 'passport_issue_date',
+    'passportExpiryDate': 'passport_expiry_date',
+    'passportScan': 'passport_scan',
+    'passportFile': 'passport_file',
+    'maritalStatus': 'marital_status',
+    'fatherName': 'father_name',
+    'grandfatherName': 'grandfather_name',
+    'jobTitle': 'job_title',
+    'educationLevel': 'education_level',
+    'facebookProfile': 'facebook_profile',
+    'umrahType': 'umrah_type',
+    'roomType': 'room_type',
+    'notes': 'notes',
+    'status': 'status',
+    'bookingDate': 'booking_date',
+    'branchState': 'branch_state'
+}
+
+BOOKING_FIELDS = list(BOOKING_ATTRIBUTES) + ['trip']
+
+BOOKING_SUMMARY_FIELDS = [
+    'id', 'tripId', 'firstName', 'lastName', 'phone', 'umrahType',
+    'roomType', 'status', 'bookingDate', 'branchState', 'trip'
+]
+
+
+def booking_shape(fields):
+    shape = {field: column(BOOKING_ATTRIBUTES[field]) for field in fields if field in BOOKING_ATTRIBUTES}
+    if 'trip' in fields:
+        shape['trip'] = {'date': column('trip_date'), 'airline': column('trip_airline')}
+    return shape
+
+
+@lru_cache(maxsize=64)
+def _booking_serializer(fields):
+    return compile_shape('serialize_booking', booking_shape(fields))
+
+
+def booking_serializer(fields):
+    # Projections requested with ?fields= are compiled once and reused.
+    return _booking_serializer(tuple(fields))
+
+
+serialize_booking = booking_serializer(BOOKING_FIELDS)
+serialize_booking_summary = booking_serializer(BOOKING_SUMMARY_FIELDS)
+
+serialize_trash_trip = compile_shape('serialize_trash_trip', {
+    'id': column('id'),
+    'date': column('date'),
+    'airline': column('airline'),
+    'deleted_at': column('deleted_at')
+})
+
+serialize_trash_booking = compile_shape('serialize_trash_booking', {
+    'id': column('id'),
+    'firstName': column('first_name'),
+    'lastName': column('last_name'),
+    'email': column('email'),
+    'phone': column('phone'),
+    'deleted_at': column('deleted_at')
+})
+
+
+def _default(o):
+    # Mirrors Flask's default provider, so switching providers does not change
+    # the output: dates as HTTP dates, Decimal and UUID as strings.
+    if isinstance(o, decimal.Decimal):
+        return str(o)
+    if hasattr(o, 'timetuple'):
+        return http_date(o)
+    if isinstance(o, uuid.UUID):
+        return str(o)
+    if dataclasses.is_dataclass(o):
+        return dataclasses.asdict(o)
+    if hasattr(o, '__html__'):
+        return str(o.__html__())
+    raise TypeError(f'Object of type {type(o).__name__} is not JSON serializable')
+
+
+class ORJSONProvider(JSONProvider):
+    # Encodes in C straight to bytes. Keys are emitted in insertion order and
+    # non-ASCII text as UTF-8 rather than \u escapes.
+
+    def _options(self, extra=0):
+        return orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | extra
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=_default, option=self._options()).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=_default, option=self._options(orjson.OPT_APPEND_NEWLINE))
+        return self._app.response_class(body, mimetype='application/json')
+
+
+def init_app(app):
+    if JSON_PROVIDER == 'default':
+        return
+    if orjson is None:
+        if JSON_PROVIDER == 'orjson':
+            logger.warning("JSON_PROVIDER=orjson but orjson is not installed; using the default provider")
+        return
+    app.json = ORJSONProvider(app)
@@ -0,0 +1,309 @@
+from flask import current_app, send_file, stream_with_context
+from inventory import ROOM_TYPES
+from serializers import BOOKING_ATTRIBUTES
+import os
+import io
+import csv
+import tempfile
+import importlib.util
+
+# XlsxWriter is optional and only imported by the first XLSX export.
+XLSX_AVAILABLE = importlib.util.find_spec('xlsxwriter') is not None
+
+EXPORT_FORMATS = ('csv', 'xlsx')
+CSV_MIMETYPE = 'text/csv; charset=utf-8'
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Excel only reads a CSV as UTF-8 (and so shows Arabic names) when it starts
+# with a byte order mark.
+UTF8_BOM = b'\xef\xbb\xbf'
+
+IMPORT_MAX_ROWS = int(os.environ.get('IMPORT_MAX_ROWS', 100000))
+
+INT4_MAX = 2 ** 31 - 1
+
+# (SQL expression, header, type) of every exported column. The trip columns
+# double as the import format.
+TRIP_EXPORT_COLUMNS = [
+    ('t.id', 'id', 'int4'),
+    ('t.date', 'date', 'text'),
+    ('t.airline', 'airline', 'text'),
+    ('t.airline_logo', 'airline_logo', 'text'),
+    ('t.hotel', 'hotel', 'text'),
+    ('t.hotel_logo', 'hotel_logo', 'text'),
+    ('t.hotel_distance', 'hotel_distance', 'text'),
+    ('t.route', 'route', 'text'),
+    ('t.duration', 'duration', 'int4'),
+    ('t.type', 'type', 'text'),
+    ('t.state', 'state', 'text')
+]
+for _room_type in ROOM_TYPES:
+    TRIP_EXPORT_COLUMNS.extend([
+        (f't.room{_room_type}_price', f'room{_room_type}_price', 'int4'),
+        (f't.room{_room_type}_status', f'room{_room_type}_status', 'text'),
+        (f'r{_room_type}.capacity', f'room{_room_type}_capacity', 'int4'),
+        (f'COALESCE(r{_room_type}.booked, 0)', f'room{_room_type}_booked', 'int4')
+    ])
+
+BOOKING_EXPORT_COLUMNS = [
+    (f'b.{column}', field, 'int4' if field in ('id', 'tripId') else 'text')
+    for field, column in BOOKING_ATTRIBUTES.items()
+] + [
+    ('t.date', 'tripDate', 'text'),
+    ('t.airline', 'tripAirline', 'text')
+]
+
+TRIP_TEXT_FIELDS = ['date', 'airline', 'airline_logo', 'hotel', 'hotel_logo', 'hotel_distance', 'route', 'type', 'state']
+TRIP_INTEGER_FIELDS = ['duration'] + [f'room{room_type}_price' for room_type in ROOM_TYPES]
+TRIP_CAPACITY_FIELDS = [f'room{room_type}_capacity' for room_type in ROOM_TYPES]
+TRIP_OPTIONAL_FIELDS = {'airline_logo', 'hotel_logo', 'hotel_distance'}
+
+TRIP_IMPORT_REQUIRED = [field for field in TRIP_TEXT_FIELDS + TRIP_INTEGER_FIELDS if field not in TRIP_OPTIONAL_FIELDS]
+
+# Staging columns, in the order parse_trips_csv() produces them.
+TRIP_STAGING_COLUMNS = ['line', 'id'] + TRIP_TEXT_FIELDS + TRIP_INTEGER_FIELDS + TRIP_CAPACITY_FIELDS
+
+
+class TripImportError(Exception):
+    # `errors` is a list of {'line': n, 'errors': [...]}; line 0 is the file itself.
+
+    def __init__(self, errors):
+        super().__init__(f'{len(errors)} rows were rejected')
+        self.errors = errors
+
+
+def select_list(columns):
+    return ', '.join(f'{expression} AS "{header}"' for expression, header, _ in columns)
+
+
+def trips_export_query():
+    joins = ' '.join(
+        f"LEFT JOIN trip_rooms r{room_type} ON r{room_type}.trip_id = t.id AND r{room_type}.room_type = '{room_type}'"
+        for room_type in ROOM_TYPES
+    )
+    return f'''SELECT {select_list(TRIP_EXPORT_COLUMNS)}
+               FROM trips t {joins}
+               WHERE t.is_deleted = FALSE
+               ORDER BY t.id'''
+
+
+def bookings_export_query(branch_filter):
+    query = f'''SELECT {select_list(BOOKING_EXPORT_COLUMNS)}
+                FROM bookings b
+                JOIN trips t ON b.trip_id = t.id
+                WHERE b.is_deleted = FALSE'''
+    if branch_filter != 'all':
+        query += ' AND b.branch_state = %(branch)s'
+    return query + ' ORDER BY b.id'
+
+
+def stream_csv(conn, query, params=None):
+    # Postgres formats the CSV itself; blocks go to the client as they arrive.
+    yield UTF8_BOM
+    with conn.cursor().copy(f'COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)', params) as copy:
+        for block in copy:
+            yield bytes(block)
+
+
+def write_xlsx(conn, query, columns, sheet_name, params=None):
+    # XLSX is a zip archive, so it cannot be streamed; constant_memory keeps
+    # only the current row in memory while the file is written to disk.
+    # Returns the rewound temporary file.
+    import xlsxwriter
+
+    output = tempfile.TemporaryFile()
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
+    worksheet = workbook.add_worksheet(sheet_name)
+    header_format = workbook.add_format({'bold': True})
+    worksheet.write_row(0, 0, [header for _, header, _ in columns], header_format)
+
+    with conn.cursor().copy(f'COPY ({query}) TO STDOUT', params) as copy:
+        copy.set_types([column_type for _, _, column_type in columns])
+        for index, row in enumerate(copy.rows(), start=1):
+            worksheet.write_row(index, 0, row)
+
+    workbook.close()
+    output.seek(0)
+    return output
+
+
+def _parse_integer(value, field, errors, minimum=0):
+    try:
+        number = int(value)
+    except ValueError:
+        errors.append(f'{field} must be an integer')
+        return None
+    if not minimum <= number <= INT4_MAX:
+        errors.append(f'{field} must be between {minimum} and {INT4_MAX}')
+        return None
+    return number
+
+
+def parse_trips_csv(stream):
+    # Validates a trips CSV (the format of the trips export) and returns
+    # (rows, with_capacity). Rows with an id update that trip, rows without
+    # one create a trip. Status and booked columns are ignored.
+    reader = csv.reader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    try:
+        header = [name.strip() for name in next(reader)]
+    except StopIteration:
+        raise TripImportError([{'line': 0, 'errors': ['The file is empty']}])
+    except UnicodeDecodeError:
+        raise TripImportError([{'line': 0, 'errors': ['The file is not UTF-8 encoded']}])
+
+    missing = [field for field in TRIP_IMPORT_REQUIRED if field not in header]
+    if missing:
+        raise TripImportError([{'line': 1, 'errors': [f'Missing column: {field}' for field in missing]}])
+
+    positions = {name: index for index, name in enumerate(header)}
+    with_capacity = any(field in positions for field in TRIP_CAPACITY_FIELDS)
+
+    rows = []
+    errors = []
+    seen_ids = {}
+    try:
+        for record in reader:
+            line = reader.line_num
+            if not any(value.strip() for value in record):
+                continue
+            if len(rows) >= IMPORT_MAX_ROWS:
+                raise TripImportError([{'line': line, 'errors': [f'At most {IMPORT_MAX_ROWS} rows per import']}])
+
+            def value(field):
+                index = positions.get(field)
+                return record[index].strip() if index is not None and index < len(record) else ''
+
+            row_errors = []
+
+            trip_id = None
+            if value('id'):
+                trip_id = _parse_integer(value('id'), 'id', row_errors, minimum=1)
+                if trip_id in seen_ids:
+                    row_errors.append(f'Duplicate id {trip_id} (also on line {seen_ids[trip_id]})')
+                elif trip_id is not None:
+                    seen_ids[trip_id] = line
+
+            texts = []
+            for field in TRIP_TEXT_FIELDS:
+                if not value(field) and field not in TRIP_OPTIONAL_FIELDS:
+                    row_errors.append(f'{field} is required')
+                texts.append(value(field))
+
+            integers = []
+            for field in TRIP_INTEGER_FIELDS:
+                if not value(field):
+                    row_errors.append(f'{field} is required')
+                    integers.append(None)
+                else:
+                    integers.append(_parse_integer(value(field), field, row_errors))
+
+            # An empty capacity cell means unlimited.
+            capacities = [
+                _parse_integer(value(field), field, row_errors) if value(field) else None
+                for field in TRIP_CAPACITY_FIELDS
+            ]
+
+            if row_errors:
+                errors.append({'line': line, 'errors': row_errors})
+            else:
+                rows.append((line, trip_id, *texts, *integers, *capacities))
+    except UnicodeDecodeError:
+        raise TripImportError([{'line': reader.line_num + 1, 'errors': ['The file is not UTF-8 encoded']}])
+    except csv.Error as e:
+        raise TripImportError([{'line': reader.line_num, 'errors': [str(e)]}])
+
+    if errors:
+        raise TripImportError(errors)
+    if not rows:
+        raise TripImportError([{'line': 0, 'errors': ['The file has no trips']}])
+    return rows, with_capacity
+
+
+def import_trips(conn, rows, with_capacity):
+    # Loads the rows into a staging table with COPY and merges them into
+    # trips (and trip_rooms) with set-based statements, all in the caller's
+    # transaction. Raises TripImportError without changing anything when a
+    # row cannot be applied. Returns [(line, id, created)].
+    c = conn.cursor()
+
+    c.execute(f'''CREATE TEMP TABLE trip_import (
+        line INTEGER PRIMARY KEY,
+        id INTEGER,
+        is_new BOOLEAN NOT NULL DEFAULT FALSE,
+        {', '.join(f'{field} TEXT' for field in TRIP_TEXT_FIELDS)},
+        {', '.join(f'{field} INTEGER' for field in TRIP_INTEGER_FIELDS + TRIP_CAPACITY_FIELDS)}
+    ) ON COMMIT DROP''')
+
+    with c.copy(f'COPY trip_import ({", ".join(TRIP_STAGING_COLUMNS)}) FROM STDIN') as copy:
+        for row in rows:
+            copy.write_row(row)
+
+    c.execute('''SELECT s.line, s.id FROM trip_import s
+                 LEFT JOIN trips t ON t.id = s.id AND t.is_deleted = FALSE
+                 WHERE s.id IS NOT NULL AND t.id IS NULL
+                 ORDER BY s.line''')
+    errors = [{'line': row['line'], 'errors': [f"Trip {row['id']} not found"]} for row in c.fetchall()]
+
+    capacities = ', '.join(f"('{room_type}', s.room{room_type}_capacity)" for room_type in ROOM_TYPES)
+    if with_capacity:
+        c.execute(f'''SELECT s.line, r.room_type, r.booked FROM trip_import s
+                      CROSS JOIN LATERAL (VALUES {capacities}) AS v(room_type, capacity)
+                      JOIN trip_rooms r ON r.trip_id = s.id AND r.room_type = v.room_type
+                      WHERE v.capacity IS NOT NULL AND r.booked > v.capacity
+                      ORDER BY s.line''')
+        errors.extend(
+            {'line': row['line'], 'errors': [f"room{row['room_type']}_capacity is lower than the {row['booked']} rooms already booked"]}
+            for row in c.fetchall()
+        )
+
+    if errors:
+        raise TripImportError(sorted(errors, key=lambda error: error['line']))
+
+    # Ids are drawn up front so every new row knows the trip it became.
+    c.execute('''UPDATE trip_import SET id = nextval(pg_get_serial_sequence('trips', 'id')), is_new = TRUE
+                 WHERE id IS NULL''')
+
+    fields = TRIP_TEXT_FIELDS + TRIP_INTEGER_FIELDS
+    statuses = [f'room{room_type}_status' for room_type in ROOM_TYPES]
+    c.execute(f'''INSERT INTO trips (id, {', '.join(fields + statuses)})
+                  SELECT id, {', '.join(fields + ["'available'"] * len(statuses))}
+                  FROM trip_import WHERE is_new ORDER BY line''')
+
+    c.execute(f'''UPDATE trips t SET {', '.join(f'{field} = s.{field}' for field in fields)}
+                  FROM trip_import s
+                  WHERE t.id = s.id AND NOT s.is_new''')
+
+    if with_capacity:
+        c.execute(f'''INSERT INTO trip_rooms (trip_id, room_type, capacity)
+                      SELECT s.id, v.room_type, v.capacity FROM trip_import s
+                      CROSS JOIN LATERAL (VALUES {capacities}) AS v(room_type, capacity)
+                      ON CONFLICT (trip_id, room_type) DO UPDATE SET capacity = EXCLUDED.capacity''')
+
+        # Same rule as inventory.sync_room_status, for every imported trip.
+        for room_type in ROOM_TYPES:
+            status_field = f'room{room_type}_status'
+            c.execute(f'''UPDATE trips t
+                          SET {status_field} = CASE WHEN r.booked >= r.capacity THEN 'full' ELSE 'available' END
+                          FROM trip_import s
+                          JOIN trip_rooms r ON r.trip_id = s.id AND r.room_type = %s
+                          WHERE t.id = s.id AND r.capacity IS NOT NULL
+                            AND (r.booked >= r.capacity) <> (t.{status_field} = 'full')''', (room_type,))
+    else:
+        c.execute(f'''INSERT INTO trip_rooms (trip_id, room_type)
+                      SELECT s.id, v.room_type FROM trip_import s
+                      CROSS JOIN LATERAL (VALUES {capacities}) AS v(room_type, capacity)
+                      WHERE s.is_new
+                      ON CONFLICT (trip_id, room_type) DO NOTHING''')
+
+    c.execute('SELECT line, id, is_new FROM trip_import ORDER BY line')
+    return [(row['line'], row['id'], row['is_new']) for row in c.fetchall()]
+
+
+def export_response(conn, name, query, columns, export_format, params=None):
+    if export_format == 'csv':
+        response = current_app.response_class(stream_with_context(stream_csv(conn, query, params)), mimetype=CSV_MIMETYPE)
+        response.headers['Content-Disposition'] = f'attachment; filename={name}.csv'
+        return response
+
+    return send_file(write_xlsx(conn, query, columns, name, params), mimetype=XLSX_MIMETYPE,
+                     as_attachment=True, download_name=f'{name}.xlsx')
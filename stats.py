@@ -0,0 +1,76 @@
+from flask.cli import AppGroup
+from db import PREPARE, get_pool
+import click
+
+# Same aggregation the booking_stats triggers maintain incrementally.
+ACTUAL_STATS_QUERY = '''
+    SELECT 'total' AS dimension, '' AS value, COUNT(*) AS count FROM bookings WHERE is_deleted = FALSE
+    UNION ALL
+    SELECT 'status', COALESCE(status, ''), COUNT(*) FROM bookings WHERE is_deleted = FALSE GROUP BY 2
+    UNION ALL
+    SELECT 'branch_state', COALESCE(branch_state, ''), COUNT(*) FROM bookings WHERE is_deleted = FALSE GROUP BY 2
+    UNION ALL
+    SELECT 'umrah_type', COALESCE(umrah_type, ''), COUNT(*) FROM bookings WHERE is_deleted = FALSE GROUP BY 2
+    UNION ALL
+    SELECT 'trips', '', COUNT(*) FROM trips WHERE is_deleted = FALSE
+'''
+
+
+def read_stats(conn):
+    c = conn.cursor()
+    c.execute('SELECT dimension, value, count FROM booking_stats WHERE count <> 0', prepare=PREPARE)
+
+    counts = {}
+    for row in c.fetchall():
+        counts.setdefault(row['dimension'], {})[row['value']] = row['count']
+
+    status_counts = counts.get('status', {})
+    return {
+        'total_bookings': counts.get('total', {}).get('', 0),
+        'pending_bookings': status_counts.get('pending', 0),
+        'approved_bookings': status_counts.get('approved', 0),
+        'total_trips': counts.get('trips', {}).get('', 0),
+        'state_stats': counts.get('branch_state', {}),
+        'type_stats': counts.get('umrah_type', {})
+    }
+
+
+def reconcile(conn):
+    c = conn.cursor()
+
+    # Blocks the maintenance triggers until the rebuild commits, so no delta
+    # is lost or applied twice while the counters are recomputed.
+    c.execute('LOCK TABLE booking_stats IN EXCLUSIVE MODE')
+
+    c.execute('SELECT dimension, value, count FROM booking_stats')
+    stored = {(row['dimension'], row['value']): row['count'] for row in c.fetchall()}
+
+    c.execute(ACTUAL_STATS_QUERY)
+    actual = {(row['dimension'], row['value']): row['count'] for row in c.fetchall()}
+
+    drift = []
+    for key in sorted(set(stored) | set(actual)):
+        if stored.get(key, 0) != actual.get(key, 0):
+            drift.append((key[0], key[1], stored.get(key, 0), actual.get(key, 0)))
+
+    c.execute('DELETE FROM booking_stats')
+    c.executemany('INSERT INTO booking_stats (dimension, value, count) VALUES (%s, %s, %s)',
+                  [(dimension, value, count) for (dimension, value), count in actual.items()])
+    conn.commit()
+
+    return drift
+
+
+stats_cli = AppGroup('stats', help='Booking statistics rollup.')
+
+
+@stats_cli.command('reconcile')
+def reconcile_command():
+    """Rebuild booking_stats from the base tables and report drift."""
+    with get_pool().connection() as conn:
+        drift = reconcile(conn)
+
+    if not drift:
+        click.echo('booking_stats is consistent.')
+    for dimension, value, stored, actual in drift:
+        click.echo(f'{dimension}={value!r}: stored {stored}, actual {actual}')
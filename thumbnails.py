@@ -0,0 +1,151 @@
+from concurrent.futures import ProcessPoolExecutor
+from uploads import UPLOAD_FOLDER, ALLOWED_EXTENSIONS
+from jobs import job_handler
+from werkzeug.security import safe_join
+import os
+import hashlib
+import logging
+import threading
+import multiprocessing
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_FOLDER = os.path.join(UPLOAD_FOLDER, 'previews')
+PREVIEW_SIZES = {'small': 160, 'medium': 480, 'large': 1024}
+PREVIEW_QUALITY = int(os.environ.get('PREVIEW_QUALITY', 80))
+PREVIEW_WORKERS = int(os.environ.get('PREVIEW_WORKERS', 2))
+PREVIEW_TIMEOUT = float(os.environ.get('PREVIEW_TIMEOUT', 30))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def render_preview(source_path, target_path, max_size):
+    # Runs in a worker process: decode, downscale and encode a WebP. PDFs are
+    # rendered from their first page.
+    from PIL import Image
+
+    if source_path.lower().endswith('.pdf'):
+        import pypdfium2
+
+        pdf = pypdfium2.PdfDocument(source_path)
+        try:
+            page = pdf[0]
+            width, height = page.get_size()
+            image = page.render(scale=max_size / max(width, height)).to_pil()
+        finally:
+            pdf.close()
+    else:
+        image = Image.open(source_path)
+        # Lets the JPEG decoder skip most of the work for large scans.
+        image.draft('RGB', (max_size, max_size))
+
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGB')
+    image.thumbnail((max_size, max_size))
+
+    partial_path = f'{target_path}.{os.getpid()}.part'
+    image.save(partial_path, 'WEBP', quality=PREVIEW_QUALITY, method=4)
+    os.replace(partial_path, target_path)
+    return target_path
+
+
+def get_executor():
+    # Created lazily so that every server worker gets its own pool. 'spawn'
+    # avoids forking a multi-threaded server process.
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ProcessPoolExecutor(
+                    max_workers=PREVIEW_WORKERS,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+    return _executor
+
+
+def source_path(filename):
+    if '.' not in filename or filename.rsplit('.', 1)[1].lower() not in ALLOWED_EXTENSIONS:
+        return None
+    path = safe_join(UPLOAD_FOLDER, filename)
+    if path is None or not os.path.isfile(path):
+        return None
+    return path
+
+
+def preview_path(filename, size):
+    # Uploads are content-addressed, so a preview keyed by the source path
+    # never goes stale.
+    key = hashlib.sha256(filename.encode('utf-8')).hexdigest()
+    return os.path.join(PREVIEW_FOLDER, size, key[:2], f'{key}.webp')
+
+
+@job_handler('passport_previews')
+def generate_previews(payload):
+    # Queued with the booking that uploaded the scan. A failed render raises,
+    # so the job is retried.
+    filename = payload['filename']
+    source = source_path(filename)
+    if source is None:
+        # Not on this machine's disk; ensure_preview renders it on demand.
+        logger.warning(f"Skipping previews for missing upload {filename}")
+        return
+
+    for size, max_size in PREVIEW_SIZES.items():
+        target = preview_path(filename, size)
+        if os.path.exists(target):
+            continue
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        get_executor().submit(render_preview, source, target, max_size).result(timeout=PREVIEW_TIMEOUT)
+
+
+def lock_render(lock_path):
+    # Exclusive flock on a per-preview lock file that the holder deletes when
+    # done. A waiter may end up locking a file that was deleted meanwhile, so
+    # it checks that it holds the file still at lock_path and retries if not.
+    while True:
+        lock_file = open(lock_path, 'a')
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            if os.stat(lock_path).st_ino == os.fstat(lock_file.fileno()).st_ino:
+                return lock_file
+        except FileNotFoundError:
+            pass
+        lock_file.close()
+
+
+def ensure_preview(filename, size):
+    # Returns the preview path, generating it on demand when the background
+    # job has not run (yet). A lock per preview makes concurrent requests from
+    # any worker wait for a single render instead of starting their own,
+    # without holding up renders of other previews.
+    source = source_path(filename)
+    if source is None:
+        return None
+
+    target = preview_path(filename, size)
+    if os.path.exists(target):
+        return target
+
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    lock_path = f'{target}.lock'
+    lock_file = lock_render(lock_path) if fcntl is not None else None
+    try:
+        if not os.path.exists(target):
+            get_executor().submit(render_preview, source, target, PREVIEW_SIZES[size]).result(timeout=PREVIEW_TIMEOUT)
+    finally:
+        if lock_file is not None:
+            # Deleted before the lock is released, so no lock file outlives
+            # its render.
+            try:
+                os.unlink(lock_path)
+            except FileNotFoundError:
+                pass
+            lock_file.close()
+
+    return target
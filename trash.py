@@ -0,0 +1,124 @@
+from flask.cli import AppGroup
+from catalog_cache import bump_version
+from db import get_pool
+from uploads import PASSPORT_UPLOAD_FOLDER
+from thumbnails import PREVIEW_SIZES, preview_path
+import os
+import time
+import click
+
+# Rows stay restorable from the trash this long before the purge removes them.
+TRASH_RETENTION_DAYS = int(os.environ.get('TRASH_RETENTION_DAYS', 30))
+# Each batch is its own short transaction, so row locks are held briefly and
+# vacuum can reclaim the space of earlier batches while the purge runs. At
+# this size the change feed still reports the purged ids one by one.
+TRASH_PURGE_BATCH_SIZE = int(os.environ.get('TRASH_PURGE_BATCH_SIZE', 100))
+TRASH_PURGE_PAUSE = float(os.environ.get('TRASH_PURGE_PAUSE', 0.1))
+# Passport scans are stored before their booking commits, so a failed or
+# purged booking can leave a scan no row refers to. Only scans untouched for
+# this long are considered, which leaves bookings in flight alone.
+TRASH_PASSPORT_GRACE_HOURS = float(os.environ.get('TRASH_PASSPORT_GRACE_HOURS', 24))
+PASSPORT_SWEEP_BATCH_SIZE = 1000
+
+# Oldest first through the partial trash index. Rows locked by a concurrent
+# restore are skipped and left for the next run.
+PURGE_BATCH = '''DELETE FROM {table} WHERE id IN (
+                     SELECT id FROM {table}
+                     WHERE is_deleted = TRUE AND deleted_at < CURRENT_TIMESTAMP - make_interval(days => %s){condition}
+                     ORDER BY deleted_at, id LIMIT %s FOR UPDATE SKIP LOCKED)'''
+
+# Bookings go first, so a trip's expired bookings are gone before the trip
+# is considered. A trip that bookings still point at stays in the trash:
+# bookings.trip_id is NOT NULL, so removing the trip would fail.
+PURGE_TABLES = (
+    ('bookings', ''),
+    ('trips', ' AND NOT EXISTS (SELECT 1 FROM bookings b WHERE b.trip_id = trips.id)')
+)
+
+
+def purge_expired(conn, table, condition, retention_days, batch_size, pause=0):
+    purged = 0
+    while True:
+        c = conn.cursor()
+        c.execute(PURGE_BATCH.format(table=table, condition=condition), (retention_days, batch_size))
+        deleted = c.rowcount
+        if deleted:
+            bump_version(conn, table)
+        conn.commit()
+
+        purged += deleted
+        if deleted < batch_size:
+            return purged
+        time.sleep(pause)
+
+
+def stale_passports(cutoff):
+    # (stored name as in bookings.passport_file, path on disk) of every scan
+    # last modified before cutoff.
+    for directory, _, filenames in os.walk(PASSPORT_UPLOAD_FOLDER):
+        for filename in filenames:
+            path = os.path.join(directory, filename)
+            try:
+                if os.stat(path).st_mtime >= cutoff:
+                    continue
+            except FileNotFoundError:
+                continue
+            relative_path = os.path.relpath(path, PASSPORT_UPLOAD_FOLDER).replace(os.sep, '/')
+            yield f'uploads/passports/{relative_path}', path
+
+
+def remove_unreferenced(conn, passports, cutoff):
+    c = conn.cursor()
+    c.execute('SELECT DISTINCT passport_file FROM bookings WHERE passport_file = ANY(%s)', (list(passports),))
+    referenced = {row['passport_file'] for row in c.fetchall()}
+    conn.commit()
+
+    removed = 0
+    for name, path in passports.items():
+        try:
+            # Checked again: a booking may have reused the scan meanwhile.
+            if name in referenced or os.stat(path).st_mtime >= cutoff:
+                continue
+            os.unlink(path)
+        except FileNotFoundError:
+            continue
+        removed += 1
+        for size in PREVIEW_SIZES:
+            try:
+                os.unlink(preview_path(name.split('/', 1)[1], size))
+            except FileNotFoundError:
+                pass
+    return removed
+
+
+def sweep_passports(conn, grace_hours):
+    # Deletes stored scans (and their previews) that no booking, live or in
+    # the trash, refers to.
+    cutoff = time.time() - grace_hours * 3600
+    removed = 0
+    batch = {}
+    for name, path in stale_passports(cutoff):
+        batch[name] = path
+        if len(batch) >= PASSPORT_SWEEP_BATCH_SIZE:
+            removed += remove_unreferenced(conn, batch, cutoff)
+            batch = {}
+    if batch:
+        removed += remove_unreferenced(conn, batch, cutoff)
+    return removed
+
+
+trash_cli = AppGroup('trash', help='Soft-deleted trips and bookings.')
+
+
+@trash_cli.command('purge')
+@click.option('--days', type=int, default=TRASH_RETENTION_DAYS, show_default=True,
+              help='Purge rows deleted more than this many days ago.')
+@click.option('--batch-size', type=int, default=TRASH_PURGE_BATCH_SIZE, show_default=True)
+def purge_command(days, batch_size):
+    """Permanently delete trash older than the retention period, and passport scans no booking uses."""
+    with get_pool().connection() as conn:
+        for table, condition in PURGE_TABLES:
+            purged = purge_expired(conn, table, condition, days, max(1, batch_size), TRASH_PURGE_PAUSE)
+            click.echo(f'Purged {purged} {table}.')
+        removed = sweep_passports(conn, TRASH_PASSPORT_GRACE_HOURS)
+        click.echo(f'Removed {removed} unreferenced passport scans.')
@@ -0,0 +1,88 @@
+from flask import Request
+from werkzeug.exceptions import RequestEntityTooLarge
+import os
+import hashlib
+import tempfile
+
+UPLOAD_FOLDER = 'static/uploads'
+PASSPORT_UPLOAD_FOLDER = os.path.join(UPLOAD_FOLDER, 'passports')
+# Uploads are spooled outside static/ so that partial or rejected files are
+# never served. Must be on the same filesystem as PASSPORT_UPLOAD_FOLDER,
+# which accepted scans are renamed into.
+INCOMING_FOLDER = os.environ.get('UPLOAD_INCOMING_FOLDER', 'upload_spool')
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'pdf', 'webp'}
+
+PASSPORT_MAX_BYTES = int(os.environ.get('PASSPORT_MAX_BYTES', 10 * 1024 * 1024))
+
+# Room for the ~20 text fields of the booking form on top of the scan itself.
+MAX_CONTENT_LENGTH = PASSPORT_MAX_BYTES + 1024 * 1024
+
+
+def allowed_file(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+
+class HashingUpload:
+    # Spool file handed to Werkzeug's multipart parser. Chunks are written to
+    # disk as they arrive while their SHA-256 is computed, and the upload is
+    # aborted with 413 as soon as it exceeds max_bytes. Unless promoted into
+    # the content store, the spool file is removed when the request closes it.
+
+    def __init__(self, max_bytes):
+        os.makedirs(INCOMING_FOLDER, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(dir=INCOMING_FOLDER, suffix='.part')
+        self._file = os.fdopen(fd, 'w+b')
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+        self.promoted = False
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            # The parser drops this container on error, so nobody else will
+            # close it.
+            self.close()
+            raise RequestEntityTooLarge(f'File exceeds the {self.max_bytes} byte limit')
+        self.sha256.update(data)
+        return self._file.write(data)
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._file.close()
+        if not self.promoted:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+class UploadRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return HashingUpload(PASSPORT_MAX_BYTES)
+
+
+def store_passport(storage):
+    # Content-addressed: identical scans share one blob, and the name cannot
+    # collide between concurrent uploads. Returns the path stored in bookings.
+    upload = storage.stream
+    extension = storage.filename.rsplit('.', 1)[1].lower()
+    digest = upload.sha256.hexdigest()
+    relative_path = f'{digest[:2]}/{digest}.{extension}'
+    target = os.path.join(PASSPORT_UPLOAD_FOLDER, relative_path)
+
+    if not os.path.exists(target):
+        upload.flush()
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(upload.path, target)
+        upload.promoted = True
+    else:
+        # Reused by a booking that has not committed yet; a fresh mtime keeps
+        # the orphan sweep (trash.py) away from it.
+        os.utime(target)
+
+    return f'uploads/passports/{relative_path}'